@@ -1,21 +1,51 @@
 from . import (
     generate_julia_code,
     ode_parameters,
+    utils_adaptive_scan,
+    utils_batched,
+    utils_code_cache,
     utils_julia,
+    utils_packed,
+    utils_periodic,
     utils_setup,
     utils_solver,
     utils_solver_progress,
+    utils_steady_state,
+    utils_store,
+    utils_surrogate,
+    utils_trajectory_ensemble,
+    utils_worker_pool,
 )
 from .generate_julia_code import *  # noqa
 from .ode_parameters import *  # noqa
+from .utils_adaptive_scan import *  # noqa
+from .utils_batched import *  # noqa
+from .utils_code_cache import *  # noqa
 from .utils_julia import *  # noqa
+from .utils_packed import *  # noqa
+from .utils_periodic import *  # noqa
 from .utils_setup import *  # noqa
 from .utils_solver import *  # noqa
 from .utils_solver_progress import *  # noqa
+from .utils_steady_state import *  # noqa
+from .utils_store import *  # noqa
+from .utils_surrogate import *  # noqa
+from .utils_trajectory_ensemble import *  # noqa
+from .utils_worker_pool import *  # noqa
 
 __all__ = generate_julia_code.__all__.copy()
 __all__ += ode_parameters.__all__.copy()
+__all__ += utils_adaptive_scan.__all__.copy()
+__all__ += utils_batched.__all__.copy()
+__all__ += utils_code_cache.__all__.copy()
 __all__ += utils_julia.__all__.copy()
+__all__ += utils_packed.__all__.copy()
+__all__ += utils_periodic.__all__.copy()
 __all__ += utils_setup.__all__.copy()
 __all__ += utils_solver.__all__.copy()
 __all__ += utils_solver_progress.__all__.copy()
+__all__ += utils_steady_state.__all__.copy()
+__all__ += utils_store.__all__.copy()
+__all__ += utils_surrogate.__all__.copy()
+__all__ += utils_trajectory_ensemble.__all__.copy()
+__all__ += utils_worker_pool.__all__.copy()
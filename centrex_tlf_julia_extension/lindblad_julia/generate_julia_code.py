@@ -7,9 +7,18 @@ from sympy import MutableDenseMatrix
 from sympy.parsing import sympy_parser
 from sympy.printing.julia import julia_code
 
+from .julia_code_printer import DensityMatrixJuliaCodePrinter
 from .ode_parameters import odeParameters
+from .utils_julia_sparse import _julia_vector
+from .utils_packed import packed_index
+from .utils_parallel import map_blocks, partition_chunks, partition_triangle_rows
 
-__all__ = ["system_of_equations_to_lines", "generate_preamble"]
+__all__ = [
+    "system_of_equations_to_lines",
+    "system_of_equations_to_functions",
+    "generate_preamble",
+    "generate_jacobian_code",
+]
 
 
 def generate_preamble(
@@ -47,69 +56,345 @@ def generate_preamble(
     return preamble
 
 
+def _system_block_to_lines(
+    elements: Sequence[tuple[int, int, smp.Expr]],
+    temp_prefix: str,
+    packed_size: None | int = None,
+) -> List[str]:
+    """Run CSE on a block of system elements and print them as Julia lines."""
+    cse_temps, system_opt = smp.cse(
+        [expr for _, _, expr in elements],
+        symbols=smp.numbered_symbols(temp_prefix),
+        optimizations="basic",
+    )
+
+    printer = DensityMatrixJuliaCodePrinter({"packed_size": packed_size})
+
+    code_lines: list[str] = []
+    for val, temp in cse_temps:
+        code_lines.append(f"{val} = {printer.doprint(temp)}")
+    for (idx, idy, _), expr in zip(elements, system_opt):
+        code = printer.doprint(expr)
+        if packed_size is None:
+            code_lines.append(f"du[{idx + 1},{idy + 1}] = {code}")
+        elif idx == idy:
+            k = packed_index(packed_size, idx, idy) + 1
+            code_lines.append(f"du[{k}] = real({code})")
+        else:
+            k = packed_index(packed_size, idx, idy) + 1
+            code_lines.append(f"du[{k}], du[{k + 1}] = reim({code})")
+    return code_lines
+
+
+def _system_block_to_function(
+    elements: Sequence[tuple[int, int, smp.Expr]],
+    temp_prefix: str,
+    packed_size: None | int,
+    func_name: str,
+) -> tuple[str, str]:
+    """Print a block of system elements as a separate `@noinline` Julia function.
+
+    The function takes `du`, `ρ` and the symbols used by the block as arguments, so
+    it is compiled independently of the other blocks.
+
+    Returns:
+        tuple: function definition and the line calling it
+    """
+    density_matrix = DensityMatrixJuliaCodePrinter._default_settings["density_matrix"]
+    names: set[str] = set()
+    for _, _, expr in elements:
+        names.update(
+            s.name
+            for s in expr.free_symbols
+            if isinstance(s, smp.Symbol) and s.name != density_matrix
+        )
+        # undefined functions of time are printed as the bare symbol name
+        names.update(str(f.func) for f in expr.atoms(smp.core.function.AppliedUndef))
+    args = ", ".join(["du", density_matrix, *sorted(names)])
+
+    code = f"@noinline function {func_name}({args})\n\t@inbounds begin\n"
+    for line in _system_block_to_lines(elements, temp_prefix, packed_size):
+        code += f"\t\t{line}\n"
+    code += "\tend\n\tnothing\nend"
+    return code, f"{func_name}({args})"
+
+
+def system_of_equations_to_functions(
+    system: MutableDenseMatrix,
+    transition_selectors: Sequence[couplings.TransitionSelector],
+    chunk_size: int,
+    n_jobs: None | int = None,
+    packed: bool = False,
+    func_name: str = "Lindblad_rhs_block",
+) -> tuple[List[str], List[str]]:
+    """Convert the symbolic system of equations into chunked Julia functions.
+
+    Same as `system_of_equations_to_lines`, but the non-zero elements of the upper
+    triangle and diagonal are split into chunks of at most `chunk_size` elements,
+    each printed as a separate `@noinline` function with its own CSE temporaries.
+    The returned call lines replace the code lines in the body of
+    `Lindblad_rhs!`. Julia compile time grows superlinearly with function size, so
+    several moderately sized functions compile much faster than one large one,
+    while the cost of the extra calls is negligible compared to the work per block.
+
+    Args:
+        system (MutableDenseMatrix): symbolic system of equations dρ/dt
+        transition_selectors (Sequence[TransitionSelector]): transition selectors
+        chunk_size (int): maximum number of density matrix elements per function
+        n_jobs (int, optional): number of processes used for code generation.
+                                Defaults to None (serial).
+        packed (bool, optional): generate code for the packed state layout.
+                                Defaults to False.
+        func_name (str, optional): base name of the block functions, numbered from
+                                    1. Defaults to "Lindblad_rhs_block".
+
+    Returns:
+        tuple[List[str], List[str]]: block function definitions and the lines
+                                    calling them
+    """
+    n_states = system.shape[0]
+    elements = [
+        (idx, idy, system[idx, idy])
+        for idx in range(n_states)
+        for idy in range(idx, n_states)
+        if system[idx, idy] != 0
+    ]
+    args = [
+        (
+            elements[start:stop],
+            f"x{idb}_",
+            n_states if packed else None,
+            f"{func_name}{idb + 1}!",
+        )
+        for idb, (start, stop) in enumerate(partition_chunks(len(elements), chunk_size))
+    ]
+    blocks = map_blocks(_system_block_to_function, args, n_jobs)
+    return [code for code, _ in blocks], [call for _, call in blocks]
+
+
 def system_of_equations_to_lines(
     system: MutableDenseMatrix,
     transition_selectors: Sequence[couplings.TransitionSelector],
+    n_jobs: None | int = None,
+    packed: bool = False,
 ) -> List[str]:
+    """Convert the symbolic system of equations into lines of Julia code.
+
+    Common subexpressions are extracted into temporaries, followed by one
+    `du[i,j] = ...` line per non-zero element of the upper triangle and diagonal.
+    Density matrix elements are only read from the upper triangle, lower triangle
+    elements are printed as `conj(ρ[j,i])`.
+
+    With `n_jobs` > 1 the rows of the upper triangle are split into `n_jobs` blocks
+    which are processed (CSE and printing) in parallel worker processes. Each block
+    gets its own temporaries (`x<block>_<k>`); the lines are concatenated in block
+    order, so the output only depends on the system and `n_jobs`.
+
+    With `packed` the lines read from and write to the real packed state vector
+    (see `utils_packed`) instead of the complex density matrix, halving the size of
+    the ODE state.
+
+    Args:
+        system (MutableDenseMatrix): symbolic system of equations dρ/dt
+        transition_selectors (Sequence[TransitionSelector]): transition selectors
+        n_jobs (int, optional): number of processes used for code generation.
+                                Defaults to None (serial).
+        packed (bool, optional): generate code for the packed state layout.
+                                Defaults to False.
+
+    Returns:
+        List[str]: lines of Julia code
+    """
     n_states = system.shape[0]
-    rho = smp.IndexedBase("\u03c1")
-    ρ = smp.Matrix(n_states, n_states, lambda i, j: rho[i, j])
 
-    cse_temps, [system_opt] = smp.cse(system, optimizations="basic")
+    if n_jobs is None or n_jobs <= 1:
+        row_blocks = [(0, n_states)]
+    else:
+        row_blocks = partition_triangle_rows(n_states, n_jobs, uplo="U")
+
+    # only calculating the upper triangle and diagonal
+    args = []
+    for idb, (start, stop) in enumerate(row_blocks):
+        elements = [
+            (idx, idy, system[idx, idy])
+            for idx in range(start, stop)
+            for idy in range(idx, n_states)
+            if system[idx, idy] != 0
+        ]
+        temp_prefix = "x" if len(row_blocks) == 1 else f"x{idb}_"
+        args.append((elements, temp_prefix, n_states if packed else None))
 
     code_lines: list[str] = []
+    for block_lines in map_blocks(_system_block_to_lines, args, n_jobs):
+        code_lines.extend(block_lines)
+    return code_lines
 
-    for val, temp in cse_temps:
-        cline = str(temp)
-        cline = cline.replace("conjugate", "conj")
-        cline = cline.replace("(t)", "")
-        cline = cline.replace("I", "1im")
-        cline += "\n"
-        for i in range(system.shape[0]):
-            for j in range(system.shape[1]):
-                _ = str(ρ[i, j])
-                cline = cline.replace(_ + "*", f"ρ[{i + 1},{j + 1}]*")
-                cline = cline.replace(_ + " ", f"ρ[{i + 1},{j + 1}] ")
-                cline = cline.replace(_ + "\n", f"ρ[{i + 1},{j + 1}]")
-                cline = cline.replace(_ + ")", f"ρ[{i + 1},{j + 1}])")
-        cline = cline.strip()
-        # replace ρ[i,j] with conj(ρ[j,i])
-        for i in range(n_states):
-            for j in range(0, i):
-                cline = cline.replace(
-                    f"ρ[{i + 1},{j + 1}]", f"conj(ρ[{j + 1},{i + 1}])"
+
+def _jacobian_block_entries(
+    elements: Sequence[tuple[int, int, smp.Expr]],
+    temp_prefix: str,
+    n_states: int,
+    density_matrix: str,
+    real_symbols: Sequence[str],
+) -> tuple[List[str], List[tuple[int, int, str]]]:
+    """Differentiate a block of system elements with respect to the packed state.
+
+    The system is linear in ρ, so d(dρ[i,j]/dt)/dρ[a,b] only depends on t and the
+    parameters. ρ[a,b] is expressed through the packed real state u: ρ[a,a] = u_k,
+    ρ[a,b] = u_k ± i u_(k+1) for a < b (+) and a > b (-), and the real and imaginary
+    parts of the complex coefficients of u_k give the Jacobian entries. Entries that
+    vanish because the coefficient is real or imaginary (given `real_symbols`) are
+    dropped from the sparsity pattern.
+
+    Returns:
+        tuple: CSE temporary lines and (row, column, code) of each Jacobian entry,
+            with 0-based indices into the packed state.
+    """
+    entries: list[tuple[int, int, bool, smp.Expr]] = []
+    for idx, idy, expr in elements:
+        expr = expr.xreplace(
+            {
+                sym: smp.Symbol(sym.name, real=True)
+                for sym in expr.free_symbols
+                if isinstance(sym, smp.Symbol) and sym.name in real_symbols
+            }
+        )
+        coefficients: dict[int, smp.Expr] = {}
+        # conj(ρ[a,b]) = ρ[b,a], leaves ρ only in Indexed elements
+        expr = expr.xreplace(
+            {
+                c: c.args[0].base[c.args[0].indices[::-1]]
+                for c in expr.atoms(smp.conjugate)
+                if isinstance(c.args[0], smp.Indexed)
+                and str(c.args[0].base.label) == density_matrix
+            }
+        )
+        indexed = [
+            a for a in expr.atoms(smp.Indexed) if str(a.base.label) == density_matrix
+        ]
+        # real placeholders, differentiating conjugate(Ω) with respect to a complex
+        # symbol would leave unevaluated derivatives
+        placeholders = {element: smp.Dummy(real=True) for element in indexed}
+        expr = expr.xreplace(placeholders)
+        for element in sorted(indexed, key=lambda a: tuple(int(i) for i in a.indices)):
+            a, b = (int(i) for i in element.indices)
+            d = expr.diff(placeholders[element])
+            k = packed_index(n_states, min(a, b), max(a, b))
+            coefficients[k] = coefficients.get(k, smp.S.Zero) + d
+            if a != b:
+                sign = 1 if a < b else -1
+                coefficients[k + 1] = (
+                    coefficients.get(k + 1, smp.S.Zero) + sign * smp.I * d
                 )
+        row = packed_index(n_states, idx, idy)
+        for column, coefficient in sorted(coefficients.items()):
+            if smp.re(coefficient) != 0:
+                entries.append((row, column, False, coefficient))
+            if idx != idy and smp.im(coefficient) != 0:
+                entries.append((row + 1, column, True, coefficient))
 
-        code_lines.append(f"{val} = {cline}")
+    # CSE on the complex coefficients, the real and imaginary part of an off-diagonal
+    # element share the same coefficient
+    unique: dict[smp.Expr, int] = {}
+    for _, _, _, coefficient in entries:
+        unique.setdefault(coefficient, len(unique))
+    cse_temps, reduced = smp.cse(
+        list(unique), symbols=smp.numbered_symbols(temp_prefix), optimizations="basic"
+    )
 
-    # only calculating the upper triangle and diagonal
-    for idx in range(n_states):
-        for idy in range(idx, n_states):
-            if system_opt[idx, idy] != 0:
-                cline = str(system_opt[idx, idy])
-                cline = cline.replace("conjugate", "conj")
-                cline = f"du[{idx + 1},{idy + 1}] = " + cline
-                cline = cline.replace("(t)", "")
-                cline = cline.replace("I", "1im")
-
-                # replace pol*rabi symbols
-                # for repl in pol_rabi_replacements:
-                #     cline = cline.replace(*repl)
-                cline += "\n"
-                for i in range(system.shape[0]):
-                    for j in range(system.shape[1]):
-                        _ = str(ρ[i, j])
-                        cline = cline.replace(_ + "*", f"ρ[{i + 1},{j + 1}]*")
-                        cline = cline.replace(_ + " ", f"ρ[{i + 1},{j + 1}] ")
-                        cline = cline.replace(_ + "\n", f"ρ[{i + 1},{j + 1}]")
-                        cline = cline.replace(_ + ")", f"ρ[{i + 1},{j + 1}])")
-                cline = cline.strip()
-                # replace ρ[i,j] with conj(ρ[j,i])
-                for i in range(n_states):
-                    for j in range(0, i):
-                        cline = cline.replace(
-                            f"ρ[{i + 1},{j + 1}]", f"conj(ρ[{j + 1},{i + 1}])"
-                        )
-
-                code_lines.append(cline)
-    return code_lines
+    printer = DensityMatrixJuliaCodePrinter()
+    temp_lines = [f"{val} = {printer.doprint(temp)}" for val, temp in cse_temps]
+    values: list[tuple[int, int, str]] = []
+    for row, column, imaginary, coefficient in entries:
+        value = reduced[unique[coefficient]]
+        if value.is_number:
+            part = smp.im(value) if imaginary else smp.re(value)
+            if part == 0:
+                continue
+            values.append((row, column, printer.doprint(smp.N(part))))
+        else:
+            part = "imag" if imaginary else "real"
+            values.append((row, column, f"{part}({printer.doprint(value)})"))
+    return temp_lines, values
+
+
+def generate_jacobian_code(
+    preamble: str,
+    system: MutableDenseMatrix,
+    n_jobs: None | int = None,
+    real_symbols: None | Sequence[str] = None,
+    function_name: str = "Lindblad_jac!",
+    prototype_name: str = "jac_prototype",
+) -> str:
+    """Generate an analytic Jacobian and its sparsity pattern for the packed layout.
+
+    The Jacobian is derived from the same symbolic system as the right-hand side
+    generated by `system_of_equations_to_lines(..., packed=True)`. Since the packed
+    state is real, so is the Jacobian; it is written directly into the non-zero
+    values of the sparse matrix `J`, which must have the sparsity pattern of the
+    generated `jac_prototype` (as is the case when used as the `jac_prototype` of an
+    `ODEFunction`).
+
+    Args:
+        preamble (str): preamble generated by `generate_preamble`, binding the
+                        parameters
+        system (MutableDenseMatrix): symbolic system of equations dρ/dt
+        n_jobs (int, optional): number of processes used for code generation.
+                                Defaults to None (serial).
+        real_symbols (Sequence[str], optional): names of symbols known to be real,
+                                used to drop structurally zero entries. Defaults
+                                to None.
+        function_name (str, optional): name of the Jacobian function. Defaults to
+                                        "Lindblad_jac!".
+        prototype_name (str, optional): name of the sparsity prototype. Defaults to
+                                        "jac_prototype".
+
+    Returns:
+        str: Julia code defining the Jacobian function and the sparsity prototype
+    """
+    n_states = system.shape[0]
+    density_matrix = DensityMatrixJuliaCodePrinter._default_settings["density_matrix"]
+
+    if n_jobs is None or n_jobs <= 1:
+        row_blocks = [(0, n_states)]
+    else:
+        row_blocks = partition_triangle_rows(n_states, n_jobs, uplo="U")
+
+    args = []
+    for idb, (start, stop) in enumerate(row_blocks):
+        elements = [
+            (idx, idy, system[idx, idy])
+            for idx in range(start, stop)
+            for idy in range(idx, n_states)
+            if system[idx, idy] != 0
+        ]
+        temp_prefix = "j" if len(row_blocks) == 1 else f"j{idb}_"
+        args.append(
+            (elements, temp_prefix, n_states, density_matrix, list(real_symbols or []))
+        )
+    blocks = map_blocks(_jacobian_block_entries, args, n_jobs)
+
+    # position of each entry in the non-zero values of a CSC matrix
+    coordinates = sorted(
+        ((column, row) for _, values in blocks for row, column, _ in values)
+    )
+    position = {coordinate: idx for idx, coordinate in enumerate(coordinates, 1)}
+
+    header = preamble.splitlines()[0]
+    code = preamble.replace(header, f"function {function_name}(J, ρ, p, t)", 1)
+    code += "\t\tnz = nonzeros(J)\n"
+    for block_temps, values in blocks:
+        for line in block_temps:
+            code += f"\t\t{line}\n"
+        for row, column, value in values:
+            code += f"\t\tnz[{position[(column, row)]}] = {value}\n"
+    code += "\t end \n \t nothing \n end\n"
+
+    size = n_states * n_states
+    rows = _julia_vector([row + 1 for _, row in coordinates], "Int")
+    columns = _julia_vector([column + 1 for column, _ in coordinates], "Int")
+    code += (
+        f"{prototype_name} = sparse({rows}, {columns}, "
+        f"zeros(Float64, {len(coordinates)}), {size}, {size})\n"
+    )
+    return code
@@ -6,6 +6,7 @@ from sympy.matrices.expressions.matexpr import MatrixElement
 from sympy.printing.julia import JuliaCodePrinter
 
 from .parse_julia_functions import julia_functions
+from .utils_packed import packed_index
 
 
 def shift_sympy_indices(expr: smp.Basic, shift: int = 1) -> smp.Basic:
@@ -87,6 +88,75 @@ class CustomJuliaCodePrinter(JuliaCodePrinter):
         return cast(str, super()._print_Function(expr))  # type: ignore[misc]
 
 
+class DensityMatrixJuliaCodePrinter(CustomJuliaCodePrinter):
+    """Julia code printer for the expanded system of equations.
+
+    Density matrix elements `Indexed(ρ, i, j)` are printed directly as
+    `ρ[i+1,j+1]` for the upper triangle and, if `hermitian` is set, as
+    `conj(ρ[j+1,i+1])` for the lower triangle, so only the upper triangle of the
+    density matrix is read. Undefined functions of time only, e.g. `Ω0(t)`, are
+    printed as the bare symbol name.
+
+    If `packed_size` is set to the number of states, the density matrix is read
+    from the real packed state vector (see `utils_packed`): populations are printed
+    as `ρ[k]` and coherences as `complex(ρ[k], ρ[k+1])`, conjugated for the lower
+    triangle.
+
+    Index shifting happens while printing, so the expression tree is not rewritten
+    beforehand.
+    """
+
+    _default_settings: dict[str, Any] = dict(
+        CustomJuliaCodePrinter._default_settings,
+        density_matrix="\u03c1",
+        hermitian=True,
+        packed_size=None,
+    )
+
+    def __init__(self, settings: dict[str, Any] | None = None):
+        super().__init__(settings or {})
+        self._density_matrix: str = self._settings["density_matrix"]
+        self._hermitian: bool = self._settings["hermitian"]
+        self._packed_size: int | None = self._settings["packed_size"]
+        # indices are shifted in _print_Indexed instead
+        self._shifting_enabled = False
+
+    def _print_Indexed(self, expr: Indexed) -> str:
+        label = str(expr.base.label)
+        indices = expr.indices
+        if label == self._density_matrix and all(
+            isinstance(i, smp.Integer) for i in indices
+        ):
+            i, j = (int(idx) for idx in indices)
+            if self._packed_size is not None:
+                k = packed_index(self._packed_size, min(i, j), max(i, j)) + 1
+                if i == j:
+                    return f"{label}[{k}]"
+                sign = "-" if i > j else ""
+                return f"complex({label}[{k}], {sign}{label}[{k + 1}])"
+            if self._hermitian and i > j:
+                return f"conj({label}[{j + 1},{i + 1}])"
+            return f"{label}[{i + 1},{j + 1}]"
+        inds = [
+            self._print(idx + self._index_shift)  # type: ignore[attr-defined]
+            if isinstance(idx, smp.Integer)
+            else self._print(idx)  # type: ignore[attr-defined]
+            for idx in indices
+        ]
+        return f"{label}[{','.join(inds)}]"
+
+    def _print_Function(self, expr: smp.Expr) -> str:
+        # time dependent symbols, e.g. Ω0(t), are bound as plain variables
+        if (
+            isinstance(expr, smp.core.function.AppliedUndef)
+            and str(expr.func) not in julia_functions
+            and len(expr.args) == 1
+            and str(expr.args[0]) == "t"
+        ):
+            return str(expr.func)
+        return super()._print_Function(expr)
+
+
 def custom_julia_code(expr: smp.Basic, **settings: Any) -> str:
     """Generate Julia code using our custom printer."""
     printer = CustomJuliaCodePrinter(settings)
@@ -1,5 +1,6 @@
 using Distributed
 @everywhere using Waveforms
+@everywhere using SparseArrays
 
 @everywhere begin
     """
@@ -247,6 +248,226 @@ using Distributed
         return nothing
     end
 
+    """
+        SparseTerms{T<:Complex}
+
+    Decomposition of a Hamiltonian into H0 + Σ_k f_k V_k, stored in the non-zero
+    layout of a fixed-pattern `SparseMatrixCSC`. Only the upper triangle of the V_k
+    is stored, the lower triangle follows from hermiticity.
+
+    # Fields
+    - `nzval0`: non-zero values of H0 in the layout of the sparse Hamiltonian
+    - `nzind`: index into the non-zero values for each upper triangle element of V_k
+    - `nzmirror`: index of the mirrored (lower triangle) element, 0 on the diagonal
+    - `coef`: coefficient index k for each element
+    - `vals`: value of each element
+    """
+    struct SparseTerms{T<:Complex}
+        nzval0::Vector{T}
+        nzind::Vector{Int}
+        nzmirror::Vector{Int}
+        coef::Vector{Int}
+        vals::Vector{T}
+    end
+
+    """
+        update_sparse_hamiltonian!(H, terms, f)
+
+    Write H0 + Σ_k f[k] V_k into the non-zero values of the sparse Hamiltonian `H`.
+    Only touches the stored non-zeros, the cost scales with the number of couplings.
+    """
+    function update_sparse_hamiltonian!(H::SparseMatrixCSC{T}, terms::SparseTerms{T}, f) where {T<:Complex}
+        nz = nonzeros(H)
+        copyto!(nz, terms.nzval0)
+        @inbounds for m in eachindex(terms.nzind)
+            v = f[terms.coef[m]] * terms.vals[m]
+            nz[terms.nzind[m]] += v
+            k = terms.nzmirror[m]
+            if k != 0
+                nz[k] += conj(v)
+            end
+        end
+        return H
+    end
+
+    """
+        liouvillian_commutator_sparse!(C, H, ρ)
+
+    Compute the commutator -i[H,ρ] for a sparse Hamiltonian `H` and a dense density
+    matrix `ρ`, overwriting `C`. Both products use the sparse-dense kernels from
+    SparseArrays, the cost scales as nnz(H)·n instead of n³.
+    """
+    function liouvillian_commutator_sparse!(C::StridedMatrix{T},
+                                            H::SparseMatrixCSC{T},
+                                            ρ::StridedMatrix{T}) where {T<:Complex}
+        mul!(C, H, ρ, -im, false)   # C = -iHρ
+        mul!(C, ρ, H, im, true)     # C += iρH
+        return nothing
+    end
+
+    """
+        JumpDissipator{T<:Complex}
+
+    Lindblad dissipator D(ρ) = Σ_c C ρ C' - ½{K, ρ} with K = Σ_c C'C, applied at
+    runtime from the sparse collapse operators C. The sandwich terms C ρ C' of all
+    collapse operators are combined into a single list of
+    du[dst] += vals * ρ[src] updates (linear indices); the anticommutator uses the
+    sparse-dense kernels with the constant K.
+    """
+    struct JumpDissipator{T<:Complex}
+        dst::Vector{Int}
+        src::Vector{Int}
+        vals::Vector{T}
+        K::SparseMatrixCSC{T,Int}
+    end
+
+    function JumpDissipator(n::Int, C::Vector{SparseMatrixCSC{T,Int}}) where {T<:Complex}
+        L = LinearIndices((n, n))
+        terms = Dict{Tuple{Int,Int},T}()
+        K = spzeros(T, n, n)
+        for c in C
+            rows, cols, vals = findnz(c)
+            for (i, a, v1) in zip(rows, cols, vals), (j, b, v2) in zip(rows, cols, vals)
+                key = (L[i, j], L[a, b])
+                terms[key] = get(terms, key, zero(T)) + v1 * conj(v2)
+            end
+            K += sparse(c' * c)
+        end
+        # sorted by destination for memory locality
+        keys_sorted = sort!(collect(keys(terms)))
+        return JumpDissipator(
+            first.(keys_sorted),
+            last.(keys_sorted),
+            T[terms[k] for k in keys_sorted],
+            dropzeros!(K),
+        )
+    end
+
+    @inline function (d::JumpDissipator)(du, u)
+        @inbounds for m in eachindex(d.dst)
+            du[d.dst[m]] += d.vals[m] * u[d.src[m]]
+        end
+        mul!(du, d.K, u, -0.5, true)
+        mul!(du, u, d.K, -0.5, true)
+        return nothing
+    end
+
+    """
+        Superoperator{T<:Complex}
+
+    Liouville superoperator L(t) = L0 + Σ_k f_k(t) L_k + conj(f_k(t)) L_k' acting on
+    vec(ρ) (column major). `Lk` holds the pairs (L_k, L_k') as consecutive entries.
+    `prototype` holds the union of all sparsity patterns, with `L0ind` and `Lkind`
+    the indices of the non-zeros of L0 and L_k into the non-zeros of `prototype`.
+    """
+    struct Superoperator{T<:Complex}
+        L0::SparseMatrixCSC{T,Int}
+        Lk::Vector{SparseMatrixCSC{T,Int}}
+        prototype::SparseMatrixCSC{T,Int}
+        L0ind::Vector{Int}
+        Lkind::Vector{Vector{Int}}
+    end
+
+    # indices of the non-zeros of A into the non-zeros of P, the pattern of A must
+    # be a subset of the pattern of P
+    function _nonzero_indices(P::SparseMatrixCSC, A::SparseMatrixCSC)
+        ind = Vector{Int}(undef, nnz(A))
+        rowsA = rowvals(A)
+        rowsP = rowvals(P)
+        @inbounds for j in 1:size(A, 2)
+            rangeP = nzrange(P, j)
+            for idx in nzrange(A, j)
+                ind[idx] = rangeP[searchsortedfirst(view(rowsP, rangeP), rowsA[idx])]
+            end
+        end
+        return ind
+    end
+
+    """
+        build_superoperator(H0, U, C)
+
+    Build the Liouville superoperator for H = H0 + Σ_k f_k U_k + conj(f_k) U_k' and
+    collapse operators C:
+
+        L0 = -i(I⊗H0 - H0ᵀ⊗I) + Σ_c conj(C)⊗C - ½(I⊗C'C + (C'C)ᵀ⊗I)
+        L_k = -i(I⊗U_k - U_kᵀ⊗I)
+    """
+    function build_superoperator(H0::SparseMatrixCSC{T}, U::Vector{SparseMatrixCSC{T,Int}}, C::Vector{SparseMatrixCSC{T,Int}}) where {T<:Complex}
+        n = size(H0, 1)
+        Id = sparse(one(T) * LinearAlgebra.I, n, n)
+        commutator(A) = -im .* (kron(Id, A) - kron(copy(transpose(A)), Id))
+
+        L0 = commutator(H0)
+        for c in C
+            CdC = sparse(c' * c)
+            L0 += kron(conj.(c), c) - 0.5 .* (kron(Id, CdC) + kron(copy(transpose(CdC)), Id))
+        end
+        dropzeros!(L0)
+
+        Lk = SparseMatrixCSC{T,Int}[]
+        for u in U
+            push!(Lk, dropzeros!(commutator(u)))
+            push!(Lk, dropzeros!(commutator(sparse(u'))))
+        end
+
+        I_all = Int[]
+        J_all = Int[]
+        for L in (L0, Lk...)
+            rows, cols, _ = findnz(L)
+            append!(I_all, rows)
+            append!(J_all, cols)
+        end
+        # sparse keeps structural zeros, combining duplicates only sums the zeros
+        prototype = sparse(I_all, J_all, zeros(T, length(I_all)), n^2, n^2)
+
+        return Superoperator(
+            L0, Lk, prototype, _nonzero_indices(prototype, L0),
+            [_nonzero_indices(prototype, L) for L in Lk],
+        )
+    end
+
+    """
+        superoperator_rhs!(du, u, S, f)
+
+    Compute vec(du) = L(t) vec(u) with a handful of sparse mat-vecs, `f` holds the
+    coefficients f_k(t).
+    """
+    function superoperator_rhs!(du, u, S::Superoperator, f)
+        dv = vec(du)
+        v = vec(u)
+        mul!(dv, S.L0, v)
+        @inbounds for k in eachindex(f)
+            mul!(dv, S.Lk[2k-1], v, f[k], true)
+            mul!(dv, S.Lk[2k], v, conj(f[k]), true)
+        end
+        return nothing
+    end
+
+    """
+        superoperator_jacobian!(J, S, f)
+
+    Write the Jacobian L(t) into the non-zeros of `J`, which must have the sparsity
+    pattern of `S.prototype`.
+    """
+    function superoperator_jacobian!(J::SparseMatrixCSC, S::Superoperator, f)
+        nz = nonzeros(J)
+        fill!(nz, zero(eltype(nz)))
+        L0nz = nonzeros(S.L0)
+        @inbounds for m in eachindex(S.L0ind)
+            nz[S.L0ind[m]] += L0nz[m]
+        end
+        @inbounds for k in eachindex(f)
+            for (l, fk) in ((2k - 1, f[k]), (2k, conj(f[k])))
+                Lnz = nonzeros(S.Lk[l])
+                ind = S.Lkind[l]
+                for m in eachindex(ind)
+                    nz[ind[m]] += fk * Lnz[m]
+                end
+            end
+        end
+        return nothing
+    end
+
     """
         liouvillian_commutator!(C, A, B)
 
@@ -281,4 +502,379 @@ using Distributed
         end
         return nothing
     end
+
+    """
+        pack_hermitian(ρ::AbstractMatrix)
+
+    Pack a Hermitian density matrix into the real packed state vector of length n²:
+    the populations `ρ[i,i]` followed by the real and imaginary parts of the upper
+    triangle coherences `ρ[i,j]`, `i < j`, in row-major order. Matches
+    `utils_packed.pack_density_matrix` on the Python side.
+    """
+    function pack_hermitian(ρ::AbstractMatrix)
+        n = size(ρ, 1)
+        u = Vector{Float64}(undef, n * n)
+        @inbounds begin
+            for i in 1:n
+                u[i] = real(ρ[i, i])
+            end
+            k = n + 1
+            for i in 1:n, j in i+1:n
+                u[k] = real(ρ[i, j])
+                u[k+1] = imag(ρ[i, j])
+                k += 2
+            end
+        end
+        return u
+    end
+
+    """
+        unpack_hermitian(u::AbstractVector)
+
+    Inverse of `pack_hermitian`, returns the complex Hermitian density matrix.
+    """
+    function unpack_hermitian(u::AbstractVector)
+        n = isqrt(length(u))
+        ρ = Matrix{ComplexF64}(undef, n, n)
+        @inbounds begin
+            for i in 1:n
+                ρ[i, i] = u[i]
+            end
+            k = n + 1
+            for i in 1:n, j in i+1:n
+                ρ[i, j] = complex(u[k], u[k+1])
+                ρ[j, i] = complex(u[k], -u[k+1])
+                k += 2
+            end
+        end
+        return ρ
+    end
+
+    # populations of a density matrix or of a packed state vector
+    populations(u::AbstractMatrix) = real(diag(u))
+    populations(u::AbstractVector) = u[1:isqrt(length(u))]
+    population(u::AbstractMatrix, j::Integer) = real(u[j, j])
+    population(u::AbstractVector, j::Integer) = u[j]
+
+    """
+        BatchedParameters{V<:Tuple}
+
+    Parameters of a batch of trajectories solved as a single ODE, see `batched_rhs!`.
+    `values` holds the ODE parameters in struct-of-arrays layout: a vector with one
+    value per trajectory for scanned parameters, a scalar for shared parameters.
+    Trajectory `b` is integrated while `active[b]` and `t < t_end[b]`; callbacks can
+    set `active[b] = false` to terminate a single trajectory.
+    """
+    struct BatchedParameters{V<:Tuple}
+        values::V
+        t_end::Vector{Float64}
+        active::Vector{Bool}
+    end
+
+    function BatchedParameters(values::Tuple, t_end::AbstractVector)
+        BatchedParameters(values, collect(Float64, t_end), fill(true, length(t_end)))
+    end
+
+    # ODE parameters of trajectory b
+    @inline batch_parameters(values::Tuple, b::Int) =
+        map(v -> v isa AbstractVector ? v[b] : v, values)
+
+    @inline batch_active(p::BatchedParameters, b::Int, t) =
+        p.active[b] && t < p.t_end[b]
+
+    """
+        batched_rhs!(du, u, p::BatchedParameters, t)
+
+    Evaluate `Lindblad_rhs!` for a batch of trajectories stacked along the last
+    dimension of `u`, a (n, n, B) array or a (n², B) array of packed states. The
+    derivative of terminated trajectories is zero, freezing their state.
+
+    The trajectories are evaluated one after the other with the scalar generated
+    RHS on a view of their state, there is no SIMD over the batch. The batch saves
+    the per-solve and per-step overhead of the solver, not RHS evaluation time. All
+    trajectories share the adaptive step size, so the trajectory needing the
+    smallest steps sets the steps of the whole batch.
+    """
+    function batched_rhs!(du, u, p::BatchedParameters, t)
+        d = ndims(u)
+        @inbounds for b in eachindex(p.active)
+            dub = selectdim(du, d, b)
+            if batch_active(p, b, t)
+                Lindblad_rhs!(dub, selectdim(u, d, b), batch_parameters(p.values, b), t)
+            else
+                fill!(dub, zero(eltype(du)))
+            end
+        end
+        return nothing
+    end
+
+    # terminate the batched solve once all its trajectories are terminated
+    function batched_terminate_callback()
+        condition(u, t, integrator) =
+            !any(b -> batch_active(integrator.p, b, t), eachindex(integrator.p.active))
+        DiscreteCallback(condition, terminate!; save_positions = (false, false))
+    end
+
+    # states of the trajectories of a batched state as density matrices
+    function batched_final_states(u::AbstractArray)
+        d = ndims(u)
+        as_matrix(x) = d == 2 ? unpack_hermitian(x) : Matrix(x)
+        [as_matrix(selectdim(u, d, b)) for b in axes(u, d)]
+    end
+
+    batched_output_func(sol, i) = (batched_final_states(sol.u[end]), false)
+
+    """
+        TrajectoryStore{T}
+
+    Per-process writer of per-trajectory results into a C-ordered .npy file with
+    one row per trajectory, created on the Python side (see utils_store.py). Rows
+    are buffered and written to their offsets once `buffer_size` rows are pending,
+    each process writes through its own file handle to disjoint rows. A byte per
+    trajectory in the `done` file marks rows that are on disk. The lock guards
+    `pending` against the threads of a process solving trajectories concurrently.
+    """
+    mutable struct TrajectoryStore{T}
+        path::String
+        offset::Int
+        done_path::String
+        done_offset::Int
+        row_length::Int
+        buffer_size::Int
+        pending::Vector{Pair{Int,Vector{T}}}
+        lock::ReentrantLock
+    end
+
+    trajectory_stores::Dict{String,TrajectoryStore} = Dict{String,TrajectoryStore}()
+
+    function open_trajectory_store(name::String, ::Type{T}, path, offset, done_path,
+                                   done_offset, row_length, buffer_size) where {T}
+        trajectory_stores[name] = TrajectoryStore{T}(
+            path, offset, done_path, done_offset, row_length, buffer_size,
+            Pair{Int,Vector{T}}[], ReentrantLock(),
+        )
+        return nothing
+    end
+
+    # row in C order, matching the row layout of the .npy file
+    store_row(x::Number, T) = T[x]
+    store_row(x::AbstractArray, T) = Vector{T}(vec(permutedims(x, ndims(x):-1:1)))
+
+    store_trajectory!(name::String, i::Int, x) =
+        store_trajectory!(trajectory_stores[name], i, x)
+
+    function store_trajectory!(store::TrajectoryStore{T}, i::Int, x) where {T}
+        row = store_row(x, T)
+        length(row) == store.row_length || error(
+            "trajectory $i: output has $(length(row)) elements, the store " *
+            "expects $(store.row_length)"
+        )
+        lock(store.lock) do
+            push!(store.pending, i => row)
+            length(store.pending) >= store.buffer_size && flush_trajectory_store!(store)
+        end
+        return nothing
+    end
+
+    flush_trajectory_store!(name::String) =
+        flush_trajectory_store!(trajectory_stores[name])
+
+    function flush_trajectory_store!(store::TrajectoryStore{T}) where {T}
+        lock(store.lock) do
+            isempty(store.pending) && return nothing
+            sort!(store.pending; by = first)
+            open(store.path, "r+") do io
+                for (i, row) in store.pending
+                    seek(io, store.offset + (i - 1) * store.row_length * sizeof(T))
+                    write(io, row)
+                end
+            end
+            # rows are on disk before they are marked as done
+            open(store.done_path, "r+") do io
+                for (i, _) in store.pending
+                    seek(io, store.done_offset + i - 1)
+                    write(io, 0x01)
+                end
+            end
+            empty!(store.pending)
+        end
+        return nothing
+    end
+
+    function close_trajectory_store!(name::String)
+        haskey(trajectory_stores, name) || return nothing
+        flush_trajectory_store!(name)
+        delete!(trajectory_stores, name)
+        return nothing
+    end
+    """
+        liouvillian_packed(f!, p, n, packed, t)
+
+    Real n²×n² matrix L of the Lindblad equation d pack(ρ)/dt = L pack(ρ) in the
+    packed Hermitian layout (see `pack_hermitian`), with the parameters `p` frozen
+    at time `t`. Assembled column by column by applying the right-hand side
+    `f!(du, u, p, t)` to the packed basis states, so it works for every code
+    generation method; the state layout of `f!` is the complex density matrix
+    unless `packed`.
+    """
+    function liouvillian_packed(f!, p, n::Int, packed::Bool, t::Float64)
+        N = n * n
+        rows = Int[]
+        cols = Int[]
+        vals = Float64[]
+        x = zeros(Float64, N)
+        du = packed ? zeros(Float64, N) : zeros(ComplexF64, n, n)
+        for j in 1:N
+            x[j] = 1.0
+            u = packed ? x : unpack_hermitian(x)
+            fill!(du, 0)
+            f!(du, u, p, t)
+            col = packed ? du : pack_hermitian(du)
+            for i in 1:N
+                if col[i] != 0
+                    push!(rows, i)
+                    push!(cols, j)
+                    push!(vals, col[i])
+                end
+            end
+            x[j] = 0.0
+        end
+        return sparse(rows, cols, vals, N, N)
+    end
+
+    """
+        steady_state(f!, p, n, packed, t)
+
+    Steady state density matrix of the Lindblad equation with the parameters `p`
+    frozen at time `t`, from a sparse LU solve of L pack(ρ) = 0 with the equation of
+    the first population replaced by the trace condition Σᵢ ρ[i,i] = 1. The
+    population equations sum to zero by trace conservation, so no information is
+    lost.
+    """
+    function steady_state(f!, p, n::Int, packed::Bool, t::Float64)
+        L = liouvillian_packed(f!, p, n, packed, t)
+        trace = sparse(ones(Int, n), 1:n, ones(Float64, n), 1, n * n)
+        A = vcat(trace, L[2:end, :])
+        b = zeros(Float64, n * n)
+        b[1] = 1.0
+        x = try
+            lu(A) \ b
+        catch e
+            e isa LinearAlgebra.SingularException || rethrow()
+            error(
+                "the steady state is not unique, e.g. states that are not coupled " *
+                "to the decaying states or dark states keep their initial " *
+                "population; integrate in time instead"
+            )
+        end
+        return unpack_hermitian(x)
+    end
+
+    # steady states of the trajectories of an ensemble parameter scan, the
+    # parameters of trajectory i are those of prob_func(prob, i, false)
+    function steady_state_ensemble(f!, prob, prob_func, trajectories::Int, n::Int,
+                                   packed::Bool, t::Float64)
+        states = pmap(1:trajectories) do i
+            steady_state(f!, prob_func(prob, i, false).p, n, packed, t)
+        end
+        A = Array{ComplexF64}(undef, trajectories, n, n)
+        @inbounds for i in 1:trajectories
+            A[i, :, :] = states[i]
+        end
+        return A
+    end
+
+    """
+        periodic_propagator(prob, alg, n, packed, period, parallel; kwargs...)
+
+    One-period propagator of `prob` in the packed Hermitian layout, the real n²×n²
+    matrix U with pack(ρ(t0 + period)) = U pack(ρ(t0)), t0 = prob.tspan[1]. Column j
+    is the state after one period starting from packed basis state j, the columns
+    are solved with pmap over the workers if `parallel`. `kwargs` are passed to
+    `solve`.
+    """
+    function periodic_propagator(prob, alg, n::Int, packed::Bool, period::Float64,
+                                 parallel::Bool; kwargs...)
+        N = n * n
+        t0 = prob.tspan[1]
+        prob = remake(prob, tspan = (t0, t0 + period))
+        function column(j)
+            x = zeros(Float64, N)
+            x[j] = 1.0
+            u0 = packed ? x : unpack_hermitian(x)
+            sol = solve(remake(prob, u0 = u0), alg; save_everystep = false,
+                        save_start = false, kwargs...)
+            return packed ? sol.u[end] : pack_hermitian(sol.u[end])
+        end
+        columns = parallel ? pmap(column, 1:N) : map(column, 1:N)
+        return reduce(hcat, columns)
+    end
+
+    """
+        periodic_stroboscopic(U, x0, n_periods, stride)
+
+    Packed states after k periods of the one-period propagator `U`, for
+    k = 0, stride, 2stride, … up to `n_periods` and k = `n_periods`, by repeated
+    products with U^stride.
+    """
+    function periodic_stroboscopic(U::AbstractMatrix, x0::AbstractVector,
+                                   n_periods::Int, stride::Int)
+        Us = U^stride
+        x = Vector{Float64}(x0)
+        xs = [x]
+        k = 0
+        while k + stride <= n_periods
+            x = Us * x
+            k += stride
+            push!(xs, x)
+        end
+        k < n_periods && push!(xs, U^(n_periods - k) * x)
+        return reduce(hcat, xs)
+    end
+
+    """
+        periodic_steady_state(U, n)
+
+    Periodic steady state density matrix, the fixed point pack(ρ) = U pack(ρ) of
+    the one-period propagator `U` with Tr ρ = 1, solved like `steady_state` with
+    U - I in place of the Liouvillian.
+    """
+    function periodic_steady_state(U::AbstractMatrix, n::Int)
+        A = U - LinearAlgebra.I
+        A[1, :] .= 0.0
+        A[1, 1:n] .= 1.0
+        b = zeros(Float64, size(U, 1))
+        b[1] = 1.0
+        x = try
+            A \ b
+        catch e
+            e isa LinearAlgebra.SingularException || rethrow()
+            error(
+                "the periodic steady state is not unique, e.g. states that are not " *
+                "coupled to the decaying states or dark states keep their initial " *
+                "population; propagate the initial state instead"
+            )
+        end
+        return unpack_hermitian(x)
+    end
+
+    # states after n_periods periods, or the periodic steady states, of the
+    # trajectories of an ensemble parameter scan, the problem of trajectory i is
+    # prob_func(prob, i, false)
+    function periodic_ensemble(prob, prob_func, trajectories::Int, alg, n::Int,
+                               packed::Bool, period::Float64, n_periods::Int,
+                               steady::Bool; kwargs...)
+        states = pmap(1:trajectories) do i
+            prob_i = prob_func(prob, i, false)
+            U = periodic_propagator(prob_i, alg, n, packed, period, false; kwargs...)
+            steady && return periodic_steady_state(U, n)
+            x0 = packed ? Vector{Float64}(prob_i.u0) : pack_hermitian(prob_i.u0)
+            return unpack_hermitian(U^n_periods * x0)
+        end
+        A = Array{ComplexF64}(undef, trajectories, n, n)
+        @inbounds for i in 1:trajectories
+            A[i, :, :] = states[i]
+        end
+        return A
+    end
 end
\ No newline at end of file
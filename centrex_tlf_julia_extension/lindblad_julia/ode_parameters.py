@@ -179,6 +179,8 @@ class odeParameters:
             if is_sequence(getattr(self, par))
         }
         self._method = "expanded"
+        self._packed = False
+        self._jacobian = False
 
     def __setattr__(self, name: str, value: Any) -> None:
         if name in [
@@ -196,7 +198,7 @@ class odeParameters:
         elif name in self._compound_vars:
             assert isinstance(value, str), "Cannot change parameter from str to numeric"
             super(odeParameters, self).__setattr__(name, value)
-        elif name == "_method":
+        elif name in ["_method", "_packed", "_jacobian"]:
             super(odeParameters, self).__setattr__(name, value)
         else:
             raise AssertionError(
@@ -354,31 +356,39 @@ class odeParameters:
         return True
 
     def generate_p_julia(self) -> str:
+        jl_string = self._julia_p_values()
+        jl.seval(f"p = {self._julia_p_constructor(jl_string)}")
+        return jl_string
+
+    def _julia_p_values(self) -> str:
+        """Julia tuple expression with the current parameter values."""
         elems = [julia_literal(pi) for pi in self.p]
         if len(elems) == 1:
-            jl_string = f"({elems[0]},)"
-        else:
-            jl_string = "(" + ", ".join(elems) + ")"
+            return f"({elems[0]},)"
+        return "(" + ", ".join(elems) + ")"
 
+    def _julia_p_constructor(self, p_values: str) -> str:
+        """Julia expression constructing the ODE parameters `p` from a Julia tuple
+        expression `p_values` with the parameter values, which depends on the code
+        generation method.
+
+        The matrix, sparse and superoperator methods evaluate the Hamiltonian into a
+        buffer held by `p`. Every constructed `p` gets its own copy of the global
+        `buf`, so the trajectories of an ensemble, each constructed by the
+        prob_func, never share a buffer and can run with EnsembleThreads()."""
         if self._method == "expanded":
-            # Define p directly
-            jl.seval(f"p = {jl_string}")
-
-        elif self._method == "matrix":
-            # One seval, avoid intermediate globals where possible
-            jl.seval(
-                f"""
-                p_values = {jl_string}
-                HamFun = HamFunctor(p_values...)
-                p = LindbladParameters(HamFun, DissFun, buf)
-                """
+            # the generated RHS takes the tuple directly
+            return p_values
+        elif self._method in ("matrix", "sparse"):
+            return f"LindbladParameters(HamFunctor({p_values}...), DissFun, copy(buf))"
+        elif self._method == "superoperator":
+            return (
+                f"LindbladParameters(HamFunctor({p_values}...), superoperator, "
+                "copy(buf))"
             )
-
         else:
             raise ValueError(f"Unknown method: {self._method!r}")
 
-        return jl_string
-
     def __repr__(self) -> str:
         rep = "OdeParameters("
         for par in self._parameters:
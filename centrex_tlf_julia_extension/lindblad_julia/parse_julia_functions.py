@@ -1,3 +1,4 @@
+import functools
 import re
 from pathlib import Path
 from typing import Any
@@ -78,9 +79,12 @@ def _split_params(s: str) -> list[str]:
     return params
 
 
+@functools.cache
 def _create_sympy_functions() -> dict[str, smp.Function]:
     """Create SymPy functions based on Julia function signatures.
 
+    Parsing julia_common.jl is deferred to the first use and cached.
+
     Returns:
         Dictionary mapping function names to SymPy Function objects
     """
@@ -108,8 +112,11 @@ def _create_sympy_functions() -> dict[str, smp.Function]:
     return sympy_functions
 
 
-# Create the SymPy functions dictionary on import
-sympy_julia_functions = _create_sympy_functions()
+def __getattr__(name: str) -> Any:
+    # the SymPy functions dictionary is built on first access instead of on import
+    if name == "sympy_julia_functions":
+        return _create_sympy_functions()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_julia_function(name: str) -> Any:
@@ -128,6 +135,7 @@ def get_julia_function(name: str) -> Any:
         >>> gauss = get_julia_function("gaussian_peak")
         >>> print(gauss)  # gaussian_peak(x, μ, σ)
     """
+    sympy_julia_functions = _create_sympy_functions()
     if name not in sympy_julia_functions:
         raise KeyError(
             f"Julia function '{name}' not found. Available functions: {list(sympy_julia_functions.keys())}"
@@ -141,4 +149,4 @@ def list_julia_functions() -> dict[str, Any]:
     Returns:
         Dictionary mapping function names to SymPy Function objects
     """
-    return sympy_julia_functions.copy()
+    return _create_sympy_functions().copy()
@@ -0,0 +1,45 @@
+# Precompile workload for build_sysimage: a representative solve of a small OBE
+# system, exercising the same code paths as the generated Lindblad_rhs! functions,
+# the parameter scans and the output functions.
+using Distributed
+using LinearAlgebra
+using SparseArrays
+using Trapz
+using DifferentialEquations
+using Waveforms
+include(joinpath(@__DIR__, "julia_common.jl"))
+
+function _warmup_rhs!(du, ρ, p, t)
+    @inbounds begin
+        Ω::Float64 = p[1]
+        δ::Float64 = p[2]
+        Γ::Float64 = p[3]
+        P = square_wave(t, 1e6, 0.0)
+        du[1, 1] = Γ * ρ[2, 2] + 1im * 0.5 * Ω * P * (ρ[1, 2] - conj(ρ[1, 2]))
+        du[1, 2] = -0.5 * Γ * ρ[1, 2] + 1im * (δ * ρ[1, 2] + 0.5 * Ω * P * (ρ[1, 1] - ρ[2, 2]))
+        du[2, 1] = conj(du[1, 2])
+        du[2, 2] = -du[1, 1]
+    end
+    nothing
+end
+
+let
+    ρ0 = zeros(ComplexF64, 2, 2)
+    ρ0[1, 1] = 1.0
+    p = (1.0e6, 0.0, 1.0e6)
+    prob = ODEProblem(_warmup_rhs!, ρ0, (0.0, 1e-5), p)
+    sol = solve(prob, Tsit5(); abstol = 1e-7, reltol = 1e-4)
+    populations(sol.u[end])
+    trapz(sol.t, [real(sum(populations(u))) for u in sol.u])
+
+    function prob_func(prob, i, repeat)
+        remake(prob, p = (1.0e6, 1.0e5 * i, 1.0e6))
+    end
+    output_func(sol, i) = (real(populations(sol.u[end])[2]), false)
+    ens = EnsembleProblem(prob; prob_func = prob_func, output_func = output_func)
+    solve(ens, Tsit5(), EnsembleThreads(); trajectories = 2, save_everystep = false)
+
+    u0 = pack_hermitian(ρ0)
+    unpack_hermitian(u0)
+    populations(u0)
+end
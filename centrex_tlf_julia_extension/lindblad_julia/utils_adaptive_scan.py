@@ -0,0 +1,235 @@
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import Delaunay
+
+from .utils_solver import (
+    OBEEnsembleProblemConfig,
+    OBEProblem,
+    OBEResultParameterScan,
+    OutputFunction,
+    _solve_scan_points,
+)
+
+__all__ = [
+    "OBEAdaptiveScanResult",
+    "solve_problem_parameter_scan_adaptive",
+]
+
+
+@dataclass
+class OBEAdaptiveScanResult:
+    """
+    Result of an adaptive parameter scan, at scattered points.
+
+    Args:
+        parameters (list[str]): scanned parameters
+        bounds (list[tuple[float, float]]): scan range of each parameter
+        points (npt.NDArray[np.float64]): scan points, shape (n_points, n_parameters)
+        results (npt.NDArray): output of each point, shape (n_points, ...)
+    """
+
+    parameters: list[str]
+    bounds: list[tuple[float, float]]
+    points: npt.NDArray[np.float64]
+    results: npt.NDArray[np.generic]
+
+    def to_grid(
+        self, points_per_axis: int | Sequence[int] = 101
+    ) -> OBEResultParameterScan:
+        """
+        Linearly interpolate the results onto a regular grid spanning the bounds.
+
+        Args:
+            points_per_axis (int | Sequence[int]): number of grid points along each
+                parameter
+
+        Returns:
+            OBEResultParameterScan: gridded results, shape (grid..., ...)
+        """
+        ndim = len(self.parameters)
+        if isinstance(points_per_axis, int):
+            points_per_axis = [points_per_axis] * ndim
+        axes = [
+            np.linspace(lo, hi, n) for (lo, hi), n in zip(self.bounds, points_per_axis)
+        ]
+        grids = np.meshgrid(*axes, indexing="ij")
+        if ndim == 1:
+            order = np.argsort(self.points[:, 0])
+            values: np.ndarray = self.results[order].reshape(len(order), -1)
+            gridded: np.ndarray = np.stack(
+                [np.interp(axes[0], self.points[order, 0], v) for v in values.T],
+                axis=-1,
+            ).reshape(len(axes[0]), *self.results.shape[1:])
+        else:
+            interpolator = LinearNDInterpolator(self.points, self.results)
+            gridded = interpolator(np.stack([g.ravel() for g in grids], axis=-1))
+            gridded = gridded.reshape(*grids[0].shape, *self.results.shape[1:])
+        return OBEResultParameterScan(
+            parameters=self.parameters,
+            scan_values=list(grids),
+            results=gridded,
+            zipped=False,
+        )
+
+
+def _simplices(
+    x: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.int_], npt.NDArray[np.int_]]:
+    """Simplices of a triangulation of the points x (scaled to the unit cube) and
+    the neighbors of each simplex, -1 for none."""
+    if x.shape[1] == 1:
+        order = np.argsort(x[:, 0])
+        simplices = np.stack([order[:-1], order[1:]], axis=-1)
+        idx = np.arange(len(simplices))
+        neighbors = np.stack([idx - 1, np.where(idx + 1 < len(idx), idx + 1, -1)], -1)
+        return simplices, neighbors
+    tri = Delaunay(x)
+    return tri.simplices, tri.neighbors
+
+
+def _simplex_losses(
+    x: npt.NDArray[np.float64],
+    y: npt.NDArray[np.float64],
+    simplices: npt.NDArray[np.int_],
+    neighbors: npt.NDArray[np.int_],
+    exploration: float,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Loss of each simplex and the midpoint of its longest edge.
+
+    The loss estimates the error of linear interpolation over the simplex: the
+    change of the output over the simplex (gradient times size) plus the change of
+    the gradient to its neighbors times size squared (curvature), with a small
+    exploration term proportional to the size so no region is starved.
+    """
+    ndim = x.shape[1]
+    vx = x[simplices]  # (n_simplices, ndim + 1, ndim)
+    vy = y[simplices]  # (n_simplices, ndim + 1, n_outputs)
+
+    edges = vx[:, :, None, :] - vx[:, None, :, :]
+    lengths = np.linalg.norm(edges, axis=-1)
+    flat = lengths.reshape(len(simplices), -1).argmax(axis=1)
+    a, b = np.unravel_index(flat, lengths.shape[1:])
+    idx = np.arange(len(simplices))
+    size = lengths[idx, a, b]
+    midpoints = 0.5 * (vx[idx, a] + vx[idx, b])
+
+    # gradient of the linear interpolant on each simplex
+    dx = vx[:, 1:] - vx[:, :1]
+    dy = vy[:, 1:] - vy[:, :1]
+    grad = np.linalg.pinv(dx) @ dy  # (n_simplices, ndim, n_outputs)
+    grad = grad.reshape(len(simplices), ndim * y.shape[1])
+
+    variation = np.ptp(vy, axis=1).max(axis=-1)
+    curvature = np.zeros(len(simplices))
+    for k in range(neighbors.shape[1]):
+        nb = neighbors[:, k]
+        valid = nb >= 0
+        change = np.linalg.norm(grad[valid] - grad[nb[valid]], axis=-1)
+        curvature[valid] = np.maximum(curvature[valid], change)
+
+    loss = variation + curvature * size + exploration
+    return loss * size, midpoints
+
+
+def solve_problem_parameter_scan_adaptive(
+    problem: OBEProblem,
+    parameters: Sequence[str],
+    bounds: Sequence[tuple[float, float]],
+    output_func: OutputFunction,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    initial_points: int | Sequence[int] = 5,
+    max_points: int = 1000,
+    batch_size: int = 64,
+    tolerance: float = 0.0,
+    exploration: float = 0.01,
+) -> OBEAdaptiveScanResult:
+    """
+    Scan parameters adaptively: start from a coarse grid and add points where the
+    output changes the most.
+
+    The scan space is triangulated (Delaunay) in coordinates scaled to the unit
+    cube, and the error of linear interpolation on each simplex is estimated from
+    the change of the output over the simplex (gradient) and the change of the
+    gradient to the neighboring simplices (curvature), relative to the range of the
+    output. Each round, the midpoints of the longest edges of the batch_size
+    simplices with the largest loss are solved as one zipped ensemble. Narrow
+    features, e.g. a resonance in a detuning scan, are resolved with a fraction of
+    the trajectories of a uniform grid, as long as the initial grid sees them.
+
+    Args:
+        problem (OBEProblem): problem to scan
+        parameters (Sequence[str]): scanned parameters
+        bounds (Sequence[tuple[float, float]]): scan range of each parameter
+        output_func (OutputFunction): output function reducing a trajectory to a
+            real scalar or vector, complex outputs are compared by magnitude
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        initial_points (int | Sequence[int]): points of the initial grid along each
+            parameter
+        max_points (int): maximum number of points in total
+        batch_size (int): points added per round
+        tolerance (float): stop when the largest loss drops below tolerance
+        exploration (float): weight of the size of a simplex in its loss
+
+    Returns:
+        OBEAdaptiveScanResult: scattered points and results, use `to_grid` for an
+            interpolated grid
+    """
+    parameters = list(parameters)
+    bounds = [(float(lo), float(hi)) for lo, hi in bounds]
+    if len(bounds) != len(parameters):
+        raise ValueError(
+            f"Expected {len(parameters)} bounds (one per parameter), got {len(bounds)}."
+        )
+    ndim = len(parameters)
+    if isinstance(initial_points, int):
+        initial_points = [initial_points] * ndim
+    if any(n < 2 for n in initial_points):
+        raise ValueError("initial_points must be at least 2 along each parameter.")
+
+    lo = np.array([b[0] for b in bounds])
+    span = np.array([b[1] - b[0] for b in bounds])
+    axes = [np.linspace(0, 1, n) for n in initial_points]
+    x = np.stack([g.ravel() for g in np.meshgrid(*axes, indexing="ij")], axis=-1)
+    results = _solve_scan_points(
+        problem, parameters, list((lo + x * span).T), output_func, config, True
+    )
+
+    while len(x) < max_points:
+        y = results.reshape(len(x), -1)
+        y = (np.abs(y) if np.iscomplexobj(y) else y).astype(np.float64)
+        y_range = np.ptp(y, axis=0)
+        y = y / np.where(y_range > 0, y_range, 1.0)
+        simplices, neighbors = _simplices(x)
+        loss, midpoints = _simplex_losses(x, y, simplices, neighbors, exploration)
+        if loss.max() <= tolerance:
+            break
+
+        n_new = min(batch_size, max_points - len(x))
+        new = []
+        seen = {tuple(np.round(p, 12)) for p in x}
+        for k in np.argsort(loss)[::-1]:
+            key = tuple(np.round(midpoints[k], 12))
+            if key not in seen:
+                seen.add(key)
+                new.append(midpoints[k])
+            if len(new) == n_new:
+                break
+        if not new:
+            break
+        x_new = np.array(new)
+        results_new = _solve_scan_points(
+            problem, parameters, list((lo + x_new * span).T), output_func, config, True
+        )
+        x = np.concatenate([x, x_new])
+        results = np.concatenate([results, results_new])
+
+    return OBEAdaptiveScanResult(
+        parameters=parameters,
+        bounds=bounds,
+        points=lo + x * span,
+        results=results,
+    )
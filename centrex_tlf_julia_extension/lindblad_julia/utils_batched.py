@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from .ode_parameters import julia_literal
+from .utils_julia import _julia_to_numpy, jl
+from .utils_packed import pack_density_matrix
+from .utils_parallel import partition_chunks
+from .utils_solver import (
+    OBEEnsembleProblemConfig,
+    OBEProblem,
+    OBEResultParameterScan,
+    remove_leading_spaces_to_align,
+)
+
+__all__ = [
+    "OBEBatchedProblem",
+    "setup_problem_batched",
+    "solve_problem_batched",
+    "get_results_batched",
+    "do_simulation_batched",
+]
+
+
+@dataclass
+class OBEBatchedProblem:
+    """
+    Many trajectories of the same OBE system, solved in batches of batch_size
+    trajectories per ODE.
+
+    Each batch is a single ODE with the states of its trajectories stacked along the
+    last dimension and the scanned parameters in struct-of-arrays layout, so the
+    solver overhead per step (step control, callbacks, saving) is paid once per
+    batch instead of once per trajectory. The right-hand side still evaluates the
+    generated scalar RHS trajectory by trajectory, see `batched_rhs!` in
+    julia_common.jl, so the evaluation itself is not vectorized over the batch.
+    This pays off for small systems and many trajectories, e.g. Monte Carlo beam
+    trajectories. The batches are solved as an ensemble, see
+    `OBEEnsembleProblemConfig.distributed_method`.
+
+    The trajectories of a batch share the adaptive time steps of the solver, the
+    step size is set by the trajectory that needs the smallest steps. Batch
+    trajectories with similar dynamics, e.g. sorted by velocity, and keep batches
+    small when the stiffness differs between trajectories.
+
+    Args:
+        problem (OBEProblem): problem with the initial state and time span shared by
+            all trajectories, only supported for the expanded method
+        parameters (list[str]): scanned parameters
+        scan_values (list[npt.NDArray]): values of the scanned parameters, one array
+            per parameter with one value per trajectory
+        batch_size (int, optional): number of trajectories per batch. Defaults to
+            all trajectories in a single batch.
+        t_end (npt.NDArray, optional): time at which each trajectory terminates, its
+            state is frozen afterwards. Defaults to the end of the time span.
+        name (str): name of the ensemble problem in Julia
+    """
+
+    problem: OBEProblem
+    parameters: list[str]
+    scan_values: list[npt.NDArray[np.number]]
+    batch_size: None | int = None
+    t_end: None | npt.NDArray[np.floating] = None
+    name: str = "batched_prob"
+
+    @property
+    def trajectories(self) -> int:
+        return len(self.scan_values[0])
+
+
+def setup_problem_batched(batched: OBEBatchedProblem) -> None:
+    """
+    Define the batched ensemble problem `ens_{name}` in Julia, with one ensemble
+    trajectory per batch.
+
+    Args:
+        batched (OBEBatchedProblem): batched problem
+    """
+    odepars = batched.problem.odepars
+    if odepars._method != "expanded":
+        raise ValueError(
+            "Batched problems are only supported for the expanded method, got "
+            f"{odepars._method!r}"
+        )
+    if len(batched.parameters) != len(batched.scan_values):
+        raise ValueError(
+            f"Expected {len(batched.parameters)} value arrays (one per parameter), "
+            f"got {len(batched.scan_values)}."
+        )
+    ntraj = batched.trajectories
+    if any(len(v) != ntraj for v in batched.scan_values):
+        raise ValueError("All scan value arrays must have the same length.")
+
+    tspan = batched.problem.tspan
+    t_end = (
+        np.full(ntraj, float(tspan[1]))
+        if batched.t_end is None
+        else np.asarray(batched.t_end, dtype=np.float64)
+    )
+    if t_end.shape != (ntraj,):
+        raise ValueError(f"t_end must have shape ({ntraj},), got {t_end.shape}")
+
+    batch_size = ntraj if batched.batch_size is None else batched.batch_size
+    # julia ranges of the trajectories in each batch
+    ranges = [
+        f"{start + 1}:{stop}" for start, stop in partition_chunks(ntraj, batch_size)
+    ]
+
+    # shared parameters as literals, scanned parameters as a view of their values
+    values = [julia_literal(pi) for pi in odepars.p]
+    for k, par in enumerate(batched.parameters):
+        idx = odepars.get_index_parameter(par)
+        assert isinstance(idx, int)
+        values[idx] = f"batch_scan[{k + 1}][r]"
+    values_tuple = (
+        f"({values[0]},)" if len(values) == 1 else "(" + ", ".join(values) + ")"
+    )
+
+    jl.batch_scan = [np.asarray(v) for v in batched.scan_values]
+    jl.batch_t_end = t_end
+    ρ = batched.problem.ρ
+    jl.batch_ρ0 = pack_density_matrix(ρ) if odepars._packed else ρ
+    jl.tspan = tspan
+    jl.seval(
+        f"""
+        batch_scan = map(collect, batch_scan)
+        batch_t_end = collect(batch_t_end)
+        batch_ρ0 = collect(batch_ρ0)
+        batch_ranges = [{", ".join(ranges)}]
+        @everywhere batch_scan = $batch_scan
+        @everywhere batch_t_end = $batch_t_end
+        @everywhere batch_ρ0 = $batch_ρ0
+        @everywhere batch_ranges = $batch_ranges
+        """
+    )
+
+    function_str = f"""
+    @everywhere function batched_prob_func(prob, i, rep)
+        r = batch_ranges[i]
+        u0 = repeat(batch_ρ0, ones(Int, ndims(batch_ρ0))..., length(r))
+        p = BatchedParameters({values_tuple}, batch_t_end[r])
+        remake(prob, u0 = u0, p = p, tstops = unique(batch_t_end[r]))
+    end
+    """
+    jl.seval(function_str)
+    jl.seval(
+        f"""
+        {batched.name} = ODEProblem(batched_rhs!, batch_ρ0, tspan, nothing)
+        ens_{batched.name} = EnsembleProblem(
+            {batched.name},
+            prob_func = batched_prob_func,
+            output_func = batched_output_func,
+            safetycopy = false
+        )
+        """
+    )
+
+
+def _generate_problem_batched_solve_string(
+    batched: OBEBatchedProblem, config: OBEEnsembleProblemConfig
+) -> str:
+    callback = "batched_terminate_callback()"
+    if config.callback is not None:
+        callback = f"CallbackSet({callback}, {config.callback.name})"
+    batch_size = (
+        batched.trajectories if batched.batch_size is None else batched.batch_size
+    )
+    n_batches = len(partition_chunks(batched.trajectories, batch_size))
+
+    # only the final states are kept
+    solve_string = f"""
+    sol = solve(
+        ens_{batched.name},
+        {config.method},
+        {config.distributed_method},
+        abstol = {config.abstol},
+        reltol = {config.reltol},
+        dt = {config.dt},
+        dtmin = {config.dtmin},
+        maxiters = {config.maxiters},
+        trajectories = {n_batches},
+        callback = {callback},
+        save_everystep = false,
+        save_start = false,
+        dense = false
+    )
+    """
+    return remove_leading_spaces_to_align(solve_string)
+
+
+def solve_problem_batched(
+    batched: OBEBatchedProblem,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+) -> None:
+    """
+    Solve a batched problem set up with `setup_problem_batched`. Only the final
+    state of each trajectory is saved; saveat, save_idxs and save_everystep of the
+    config are ignored.
+
+    Args:
+        batched (OBEBatchedProblem): batched problem
+        config (OBEEnsembleProblemConfig, optional): solver configuration.
+    """
+    solve_string = _generate_problem_batched_solve_string(batched, config)
+    jl.seval(f"{solve_string};")
+
+
+def get_results_batched(batched: OBEBatchedProblem) -> OBEResultParameterScan:
+    """
+    Retrieve the final density matrices of a solved batched problem.
+
+    Args:
+        batched (OBEBatchedProblem): batched problem
+
+    Returns:
+        OBEResultParameterScan: zipped results with shape (trajectories, n, n)
+    """
+    results = _julia_to_numpy(
+        jl.seval(
+            """
+            let states = reduce(vcat, sol.u)
+                n1, n2 = size(states[1])
+                A = Array{ComplexF64}(undef, length(states), n1, n2)
+                @inbounds for i in eachindex(states)
+                    A[i, :, :] = states[i]
+                end
+                A
+            end
+            """
+        )
+    )
+    return OBEResultParameterScan(
+        parameters=batched.parameters,
+        scan_values=batched.scan_values,
+        results=results,
+        zipped=True,
+    )
+
+
+def do_simulation_batched(
+    batched: OBEBatchedProblem,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+) -> OBEResultParameterScan:
+    """
+    Set up, solve and retrieve the results of a batched problem.
+
+    Args:
+        batched (OBEBatchedProblem): batched problem
+        config (OBEEnsembleProblemConfig, optional): solver configuration.
+
+    Returns:
+        OBEResultParameterScan: zipped results with shape (trajectories, n, n)
+    """
+    setup_problem_batched(batched)
+    solve_problem_batched(batched, config)
+    return get_results_batched(batched)
@@ -0,0 +1,242 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Sequence
+
+import sympy as smp
+from centrex_tlf import couplings
+from centrex_tlf.lindblad import OBESystem
+
+from .ode_parameters import odeParameters
+
+__all__ = ["CodeCache", "obe_system_hash"]
+
+# bump whenever the layout of the generated code objects changes, so stale cache
+# entries from older versions of the code generators are never reused
+_CACHE_FORMAT_VERSION = 1
+
+_CACHE_SUFFIX = ".pkl"
+
+# sources that determine the generated code, hashed into every cache key so a
+# change to the code generators invalidates the cache without a version bump
+_GENERATOR_SOURCES = (
+    "generate_julia_code.py",
+    "julia_code_printer.py",
+    "julia_common.jl",
+    "ode_parameters.py",
+    "parse_julia_functions.py",
+    "utils_julia_matrix.py",
+    "utils_julia_matrix_assemble.py",
+    "utils_julia_sparse.py",
+    "utils_packed.py",
+    "utils_parallel.py",
+    "utils_setup.py",
+)
+
+
+def _package_version() -> str:
+    try:
+        return metadata.version("centrex-tlf-julia-extension")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@functools.cache
+def _generator_sources_hash() -> str:
+    h = hashlib.sha256()
+    directory = Path(__file__).parent
+    for name in _GENERATOR_SOURCES:
+        h.update(name.encode("utf-8"))
+        h.update((directory / name).read_bytes())
+    return h.hexdigest()
+
+
+def _default_cache_directory() -> Path:
+    env_dir = os.environ.get("CENTREX_TLF_JULIA_CACHE")
+    if env_dir:
+        return Path(env_dir)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache) if xdg_cache else Path.home() / ".cache"
+    return base / "centrex_tlf_julia_extension"
+
+
+def obe_system_hash(
+    obe_system: OBESystem,
+    transition_selectors: Sequence[couplings.TransitionSelector],
+    ode_parameters: odeParameters,
+    method: str,
+    **options: Any,
+) -> str:
+    """Content hash of everything that determines the generated Julia code.
+
+    The hash covers the symbolic Hamiltonian and dissipator, the transition
+    symbols, the names and types of the ODE parameters (and their order for the
+    expanded method), the compound variable expressions, the code generation method
+    and the sources of the code generators. Parameter values are not part of the hash, they only enter the
+    generated code through their types.
+
+    Args:
+        obe_system (OBESystem): symbolic OBE system
+        transition_selectors (Sequence[TransitionSelector]): transition selectors
+        ode_parameters (odeParameters): ODE parameters
+        method (str): code generation method
+        **options: additional code generation options that change the generated
+                    code
+
+    Returns:
+        str: hex digest identifying the generated code
+    """
+    h = hashlib.sha256()
+
+    def update(*items: Any) -> None:
+        for item in items:
+            h.update(str(item).encode("utf-8"))
+            h.update(b"\x00")
+
+    update(
+        "format", _CACHE_FORMAT_VERSION, _package_version(), _generator_sources_hash()
+    )
+    update("method", method)
+    for key in sorted(options):
+        update("option", key, repr(options[key]))
+
+    update("H_symbolic", smp.srepr(obe_system.H_symbolic))
+    update("dissipator", smp.srepr(obe_system.dissipator))
+
+    for transition in transition_selectors:
+        update(
+            "transition",
+            transition.Ω,
+            transition.δ,
+            *[str(s) for s in transition.polarization_symbols],
+        )
+
+    parameters = list(zip(ode_parameters._parameters, ode_parameters._parameter_types))
+    if method != "expanded":
+        # the other methods take the parameters in the order of the Hamiltonian
+        # signature, and generate_OBE_system_julia reorders ode_parameters in place
+        # to it, so the order passed in does not change the code
+        parameters.sort()
+    for par, par_type in parameters:
+        update("parameter", par, par_type)
+    for par in ode_parameters._compound_vars:
+        update("compound", par, getattr(ode_parameters, par))
+
+    return h.hexdigest()
+
+
+class CodeCache:
+    """On-disk cache for generated Julia OBE code.
+
+    Entries are pickled code objects (`CodeExpanded`, `CodeMatrix`) stored under a
+    content hash from `obe_system_hash`. The total size of the cache directory is
+    bounded by `max_size`; when exceeded, the least recently used entries are
+    evicted.
+
+    Args:
+        directory (str | Path, optional): cache directory. Defaults to
+            `$CENTREX_TLF_JULIA_CACHE` if set, otherwise
+            `$XDG_CACHE_HOME/centrex_tlf_julia_extension` or
+            `~/.cache/centrex_tlf_julia_extension`.
+        max_size (int, optional): maximum total size of the cache in bytes.
+            Defaults to 1 GB.
+    """
+
+    def __init__(
+        self, directory: None | str | Path = None, max_size: int = 1_000_000_000
+    ):
+        if max_size <= 0:
+            raise ValueError(f"max_size must be positive, got {max_size}")
+        self.directory = (
+            _default_cache_directory() if directory is None else Path(directory)
+        )
+        self.max_size = max_size
+
+    def __repr__(self) -> str:
+        return f"CodeCache(directory={str(self.directory)!r}, max_size={self.max_size})"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{_CACHE_SUFFIX}"
+
+    def _entries(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return list(self.directory.glob(f"*{_CACHE_SUFFIX}"))
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Any | None:
+        """Load the code object stored under `key`, or `None` if not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                code = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # corrupt or incompatible entry, drop it and regenerate
+            path.unlink(missing_ok=True)
+            return None
+        # mark as recently used for the eviction order
+        os.utime(path)
+        return code
+
+    def put(self, key: str, code: Any) -> None:
+        """Store a code object under `key` and evict old entries if necessary."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so concurrent readers (e.g. parallel
+        # papermill jobs) never see a partially written entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(code, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep: None | str = None) -> None:
+        """Remove least recently used entries until the cache fits in `max_size`.
+
+        Args:
+            keep (str, optional): key that is never evicted, e.g. the entry that
+                                    was just written.
+        """
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_size:
+                break
+            if keep is not None and path == self._path(keep):
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+
+    @property
+    def size(self) -> int:
+        """Total size of the cache entries in bytes."""
+        total = 0
+        for path in self._entries():
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                continue
+        return total
@@ -1,13 +1,77 @@
+import hashlib
+import os
+import warnings
 from pathlib import Path
-from typing import List
+from typing import Any, List, Sequence
 
-import juliacall
+import numpy as np
+import numpy.typing as npt
 
-jl = juliacall.Main  # type: ignore[attr-defined]
+__all__ = [
+    "initialize_julia",
+    "generate_ode_fun_julia",
+    "measure_rhs_compile_time",
+    "build_sysimage",
+    "julia_started",
+]
+
+
+class _LazyJuliaMain:
+    """
+    Proxy for juliacall.Main that starts the Julia runtime on first use.
+
+    Importing juliacall boots Julia, which takes seconds; deferring it keeps
+    importing this package cheap for code that never calls into Julia, e.g. code
+    generation or loading results.
+    """
+
+    def __init__(self) -> None:
+        object.__setattr__(self, "_main", None)
+
+    def _get_main(self) -> Any:
+        main = object.__getattribute__(self, "_main")
+        if main is None:
+            import juliacall
+
+            main = juliacall.Main  # type: ignore[attr-defined]
+            object.__setattr__(self, "_main", main)
+        return main
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_main(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._get_main(), name, value)
+
+    def __repr__(self) -> str:
+        if object.__getattribute__(self, "_main") is None:
+            return "<lazy juliacall.Main, Julia not started>"
+        return repr(self._get_main())
 
-__all__ = ["initialize_julia", "generate_ode_fun_julia"]
 
 # jl = juliacall.newmodule("centrex-tlf-julia-extension")
+jl = _LazyJuliaMain()
+
+
+def julia_started() -> bool:
+    """Whether the Julia runtime has been started."""
+    return object.__getattribute__(jl, "_main") is not None
+
+
+def _julia_to_numpy(x: Any) -> npt.NDArray[Any]:
+    """
+    NumPy array over the memory of a Julia array, without copying.
+
+    Julia arrays with a NumPy compatible element type are strided, so PythonCall
+    exposes them through the buffer protocol; the NumPy array then is a view with
+    column-major strides, and keeps the Julia array alive through its base. Other
+    arrays, e.g. with an abstract element type, are copied.
+    """
+    try:
+        return np.asarray(memoryview(x))
+    except (TypeError, ValueError, BufferError):
+        return np.array(x)
+
 
 julia_dependency_packages = [
     "TerminalLoggers",
@@ -17,6 +81,9 @@ julia_dependency_packages = [
     "DifferentialEquations",
 ]
 
+julia_common_path = Path(__file__).parent / "julia_common.jl"
+sysimage_warmup_path = Path(__file__).parent / "sysimage_warmup.jl"
+
 
 def install_packages() -> None:
     jl.seval("using Pkg")
@@ -26,7 +93,124 @@ def install_packages() -> None:
             jl.Pkg.add(pkg)
 
 
-def initialize_julia(nprocs: int, blas_threads: int = 1, verbose: bool = True) -> None:
+def _julia_common_hash() -> str:
+    return hashlib.sha256(julia_common_path.read_bytes()).hexdigest()
+
+
+def build_sysimage(
+    sysimage_path: None | str | Path = None,
+    packages: Sequence[str] | None = None,
+    verbose: bool = True,
+) -> Path:
+    """
+    Build a Julia sysimage with the solver stack and julia_common.jl baked in.
+
+    Uses PackageCompiler.jl (installed if missing) to compile the Julia dependency
+    packages into a sysimage, with the functions of julia_common.jl defined in Main.
+    A warm-up solve of a small OBE system (sysimage_warmup.jl) is used as the
+    precompile workload, so the ODE solvers, ensemble solves and output functions
+    are compiled ahead of time. Pass the returned path to
+    `initialize_julia(sysimage=...)` to start the master and all workers from it.
+
+    Building takes several minutes and only has to be redone when the Julia
+    packages or julia_common.jl change; `initialize_julia` falls back to including
+    julia_common.jl if the sysimage holds an outdated version.
+
+    Args:
+        sysimage_path (str | Path, optional): output path of the sysimage. Defaults
+            to sysimages/centrex_tlf_julia_extension.<dlext> in the first Julia
+            depot.
+        packages (Sequence[str], optional): packages to compile into the sysimage.
+            Defaults to the Julia dependencies of this package and PythonCall.
+        verbose (bool): print progress
+
+    Returns:
+        Path: path of the sysimage
+    """
+    install_packages()
+    jl.seval("using Pkg")
+    if not bool(jl.seval('!isnothing(Base.find_package("PackageCompiler"))')):
+        if verbose:
+            print("Installing Julia package: PackageCompiler")
+        jl.Pkg.add("PackageCompiler")
+    jl.seval("using PackageCompiler, Libdl")
+
+    if sysimage_path is None:
+        sysimage_path = Path(
+            str(
+                jl.seval(
+                    'joinpath(DEPOT_PATH[1], "sysimages", '
+                    '"centrex_tlf_julia_extension." * Libdl.dlext)'
+                )
+            )
+        )
+    sysimage_path = Path(sysimage_path)
+    sysimage_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if packages is None:
+        packages = [*julia_dependency_packages, "PythonCall"]
+    packages_str = ", ".join(f'"{pkg}"' for pkg in packages)
+
+    # executed in the process that writes the sysimage, so the julia_common.jl
+    # definitions end up in Main of the sysimage
+    script_path = sysimage_path.with_suffix(".script.jl")
+    script_path.write_text(
+        "using Distributed\n"
+        "using LinearAlgebra, SparseArrays, Trapz, DifferentialEquations, Waveforms\n"
+        f'include(raw"{julia_common_path}")\n'
+        f'const _centrex_julia_common_hash = "{_julia_common_hash()}"\n',
+        encoding="utf-8",
+    )
+
+    if verbose:
+        print(f"Building sysimage {sysimage_path}, this takes several minutes")
+    jl.seval(
+        f"""
+        create_sysimage(
+            [{packages_str}];
+            sysimage_path = raw"{sysimage_path}",
+            precompile_execution_file = raw"{sysimage_warmup_path}",
+            script = raw"{script_path}",
+        )
+    """
+    )
+    script_path.unlink()
+    if verbose:
+        print(f"Built sysimage {sysimage_path}")
+    return sysimage_path
+
+
+def _worker_exeflags(sysimage: None | Path, threads: int) -> str:
+    """Julia keyword argument setting the command line flags of new workers."""
+    flags = [f'"--threads={threads}"']
+    if sysimage is not None:
+        flags.append(f'raw"--sysimage={sysimage}"')
+    return f"exeflags = [{', '.join(flags)}]"
+
+
+def _remove_mismatched_workers(threads: int) -> list[int]:
+    """Remove the workers that do not run the given number of Julia threads, workers
+    only get their number of threads at startup. Returns the removed workers."""
+    removed = jl.seval(
+        f"""
+        let mismatch = filter(workers()) do w
+                w != 1 && remotecall_fetch(Threads.nthreads, w) != {threads}
+            end
+            isempty(mismatch) || rmprocs(mismatch)
+            mismatch
+        end
+    """
+    )
+    return [int(w) for w in removed]
+
+
+def initialize_julia(
+    nprocs: int,
+    blas_threads: int = 1,
+    verbose: bool = True,
+    sysimage: None | str | Path = None,
+    threads: int = 1,
+) -> None:
     """
     Function to initialize Julia over nprocs processes.
     Creates nprocs processes and loads the necessary Julia
@@ -34,7 +218,34 @@ def initialize_julia(nprocs: int, blas_threads: int = 1, verbose: bool = True) -
 
     Args:
         nprocs (int): number of Julia processes to initialize.
+        blas_threads (int): number of BLAS threads per process.
+        verbose (bool): print progress.
+        sysimage (str | Path, optional): sysimage created by `build_sysimage`. The
+            master and the workers are started from it. If Julia was already
+            started before (by an earlier call into Julia) the master keeps its
+            image; set the environment variable PYTHON_JULIACALL_SYSIMAGE to the
+            same path beforehand in that case.
+        threads (int): number of Julia threads per worker. Use a few processes with
+            several threads each together with EnsembleSplitThreads() to run on all
+            cores with fewer copies of the package stack and generated code.
+            Existing workers with a different number of threads are replaced.
     """
+    if threads < 1:
+        raise ValueError(f"threads must be >= 1, got {threads}")
+    if sysimage is not None:
+        sysimage = Path(sysimage).resolve()
+        if not sysimage.is_file():
+            raise FileNotFoundError(f"Sysimage {sysimage} does not exist")
+        if not julia_started():
+            # read by juliacall when it starts Julia
+            os.environ.setdefault("PYTHON_JULIACALL_SYSIMAGE", str(sysimage))
+        image_file = Path(str(jl.seval("unsafe_string(Base.JLOptions().image_file)")))
+        if image_file.resolve() != sysimage:
+            warnings.warn(
+                f"The master Julia process was started from {image_file}, not from "
+                f"{sysimage}; set PYTHON_JULIACALL_SYSIMAGE before Julia starts to "
+                "use the sysimage on the master as well."
+            )
     install_packages()
     jl.seval(
         """
@@ -47,8 +258,10 @@ def initialize_julia(nprocs: int, blas_threads: int = 1, verbose: bool = True) -
     """
     )
 
+    _remove_mismatched_workers(threads)
+
     if jl.seval("nprocs()") < nprocs:
-        jl.seval(f"addprocs({nprocs}-nprocs())")
+        jl.seval(f"addprocs({nprocs}-nprocs(); {_worker_exeflags(sysimage, threads)})")
 
     if jl.seval("nprocs()") > nprocs:
         procs = jl.seval("procs()")
@@ -60,6 +273,7 @@ def initialize_julia(nprocs: int, blas_threads: int = 1, verbose: bool = True) -
         @everywhere begin
             using LinearAlgebra
             using LinearAlgebra.BLAS
+            using SparseArrays
             using Trapz
             using DifferentialEquations
             using Waveforms
@@ -67,12 +281,32 @@ def initialize_julia(nprocs: int, blas_threads: int = 1, verbose: bool = True) -
         end
     """
     )
-    # loading common julia functions from julia_common.jl
-    path = Path(__file__).parent / "julia_common.jl"
-    jl.seval(f'include(raw"{path}")')
+    # loading common julia functions from julia_common.jl, unless all processes were
+    # started from a sysimage holding the current version
+    common_hash = _julia_common_hash()
+    in_sysimage = bool(
+        jl.seval(
+            f"""
+            all(procs()) do w
+                remotecall_fetch(w) do
+                    isdefined(Main, :_centrex_julia_common_hash) &&
+                        Main._centrex_julia_common_hash == "{common_hash}"
+                end
+            end
+        """
+        )
+    )
+    if not in_sysimage:
+        jl.seval(f'include(raw"{julia_common_path}")')
 
     if verbose:
-        print(f"Initialized Julia with {nprocs} processes")
+        if threads > 1:
+            print(
+                f"Initialized Julia with {nprocs} processes, {threads} threads per "
+                "worker"
+            )
+        else:
+            print(f"Initialized Julia with {nprocs} processes")
 
 
 def generate_ode_fun_julia(preamble: str, code_lines: List[str]) -> str:
@@ -89,9 +323,48 @@ def generate_ode_fun_julia(preamble: str, code_lines: List[str]) -> str:
     Returns:
         str : function definition of the ODE
     """
+    ode_fun = _assemble_ode_fun(preamble, code_lines)
+    jl.seval(f"@everywhere {ode_fun}")
+    return ode_fun
+
+
+def _assemble_ode_fun(preamble: str, code_lines: List[str]) -> str:
     ode_fun = preamble
     for cline in code_lines:
         ode_fun += "\t\t" + cline + "\n"
     ode_fun += "\t end \n \t nothing \n end"
-    jl.seval(f"@everywhere {ode_fun}")
     return ode_fun
+
+
+def measure_rhs_compile_time(
+    nstates: int, packed: bool = False, p: str = "p"
+) -> tuple[float, float]:
+    """
+    Time the first and second call of Lindblad_rhs! on the main Julia process.
+
+    The first call includes compiling Lindblad_rhs! and everything it calls, so the
+    difference between the two is the compile latency every worker pays on its
+    first solve.
+
+    Args:
+        nstates (int): number of states in the system
+        packed (bool): whether the ODE uses the packed state layout
+        p (str): name of the Julia parameter variable
+
+    Returns:
+        tuple: (first call, second call) durations in seconds
+    """
+    if packed:
+        ρ = f"zeros(Float64, {nstates**2})"
+    else:
+        ρ = f"zeros(ComplexF64, {nstates}, {nstates})"
+    first, second = jl.seval(
+        f"""
+        let ρ = {ρ}, du = similar(ρ)
+            t_first = @elapsed Lindblad_rhs!(du, ρ, {p}, 0.0)
+            t_second = @elapsed Lindblad_rhs!(du, ρ, {p}, 0.0)
+            (t_first, t_second)
+        end
+    """
+    )
+    return float(first), float(second)
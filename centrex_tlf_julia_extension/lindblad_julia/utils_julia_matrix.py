@@ -6,12 +6,14 @@ from .ode_parameters import odeParameters
 liouville_commutator_functions = [
     "liouvillian_commutator!",
     "liouvillian_commutator_her2k!",
+    "liouvillian_commutator_sparse!",
 ]
 
 # Mapping of commutator function names to their number of arguments
 commutator_nargs: dict[str, int] = {
     "liouvillian_commutator!": 3,  # (C, A, B)
     "liouvillian_commutator_her2k!": 3,  # (C, A, B)
+    "liouvillian_commutator_sparse!": 3,  # (C, H, ρ)
 }
 
 
@@ -75,7 +77,8 @@ def lindblad_function_and_parameters(commutator_name: str) -> str:
     Args:
         commutator_name: Name of the commutator function to use.
             Must be one of: 'liouvillian_commutator!',
-            'liouvillian_commutator_onegemm!', 'liouvillian_commutator_her2k!'
+            'liouvillian_commutator_onegemm!', 'liouvillian_commutator_her2k!',
+            'liouvillian_commutator_sparse!'
 
     Returns:
         Julia code string defining:
@@ -139,6 +142,39 @@ end
     return lindblad_function_par_code
 
 
+def superoperator_function_and_parameters() -> str:
+    """Generate Julia code for the superoperator Lindblad struct and functions.
+
+    Creates Julia code that defines:
+    1. LindbladParameters struct holding the coefficient functor, the
+       `Superoperator` and the coefficient buffer
+    2. Lindblad_rhs! evaluating vec(dρ/dt) = L(t) vec(ρ)
+    3. Lindblad_jac! writing the (sparse) Jacobian L(t)
+
+    Returns:
+        Julia code string
+    """
+    return """
+struct LindbladParameters{CoefFunc, S<:Superoperator, T<:AbstractVector}
+    coefficients!::CoefFunc
+    superoperator::S
+    buffer0::T
+end
+
+function Lindblad_rhs!(du, u, p::LindbladParameters, t)
+    p.coefficients!(p.buffer0, t)
+    superoperator_rhs!(du, u, p.superoperator, p.buffer0)
+    nothing
+end
+
+function Lindblad_jac!(J, u, p::LindbladParameters, t)
+    p.coefficients!(p.buffer0, t)
+    superoperator_jacobian!(J, p.superoperator, p.buffer0)
+    nothing
+end
+"""
+
+
 def dissipator_functor() -> str:
     """Generate Julia code for a dissipator functor struct.
 
@@ -1,12 +1,13 @@
-from typing import Any, Optional, cast
+from typing import Any, cast
 
 import sympy as smp
 from sympy import Indexed
 from sympy.matrices.expressions.matexpr import MatrixElement
 
-from .julia_code_printer import custom_julia_code
-from .parse_julia_functions import julia_functions, sympy_julia_functions
+from .julia_code_printer import CustomJuliaCodePrinter
+from .parse_julia_functions import julia_functions
 from .utils_julia_matrix import generate_code_matrix_method
+from .utils_parallel import map_blocks, partition_chunks, partition_triangle_rows
 
 
 def _get_triangle_indices(rows: int, uplo: str) -> list[tuple[int, int]]:
@@ -175,6 +176,214 @@ def _extract_matrix_variable_and_symbols(
     return matrix_var_name, other_syms, args
 
 
+def _hermitian_block_lines(
+    elements: list[tuple[int, int, smp.Expr]],
+    matrix_var_name: str | None,
+    output_name: str,
+    uplo: str,
+    mirror: bool,
+    inplace_add: bool,
+    use_temporaries: bool,
+    temp_prefix: str,
+    value_prefix: str,
+) -> tuple[list[str], list[str]]:
+    """Run CSE on a block of triangle elements and print them as Julia lines.
+
+    Args:
+        elements: (i, j, expression) of the triangle elements in the block
+        matrix_var_name: Name of the matrix variable (if any)
+        output_name: Name of the output matrix parameter
+        uplo: Which triangle is computed, "U" or "L"
+        mirror: Whether to also write the other triangle
+        inplace_add: Whether to add to instead of assign the elements
+        use_temporaries: Whether to store each element in a temporary before
+            adding it, necessary when adding to a matrix with existing values
+        temp_prefix: Prefix of the CSE temporaries
+        value_prefix: Prefix of the per-element temporaries
+
+    Returns:
+        Tuple of (temporary declaration lines, element assignment lines)
+    """
+    _, inline_map, keep, reduced = _perform_cse_and_inlining(
+        [expr for _, _, expr in elements], temp_prefix=temp_prefix
+    )
+    printer = CustomJuliaCodePrinter({})
+    assignment = "+=" if inplace_add else "="
+
+    temp_lines = [
+        f"        {t} = {printer.doprint(expr.subs(inline_map))}" for t, expr in keep
+    ]
+
+    element_lines: list[str] = []
+    temp_counter = 0
+    for (i, j, _), expr_reduced in zip(elements, reduced):
+        expr = expr_reduced.subs(inline_map)
+        # Transform matrix references to use the correct triangle
+        expr = _transform_matrix_references_for_triangle(  # type: ignore[arg-type, assignment]
+            expr, matrix_var_name, uplo, mirror
+        )
+        # Skip zero elements
+        is_zero = expr == 0 or (hasattr(expr, "is_zero") and expr.is_zero)
+        if is_zero:
+            continue
+        code = printer.doprint(expr)
+        if use_temporaries:
+            temp_name = f"{value_prefix}{temp_counter}"
+            temp_counter += 1
+            # Create temporary variable with the computed value
+            element_lines.append(f"        {temp_name} = {code}")
+            element_lines.append(
+                f"        {output_name}[{i + 1},{j + 1}] {assignment} {temp_name}"
+            )
+            # Mirror for off-diagonal elements (Hermitian property) if requested
+            if mirror and i != j:
+                element_lines.append(
+                    f"        {output_name}[{j + 1},{i + 1}] {assignment} conj({temp_name})"
+                )
+        else:
+            element_lines.append(
+                f"        {output_name}[{i + 1},{j + 1}] {assignment} {code}"
+            )
+            # Mirror for off-diagonal elements (Hermitian property) if requested
+            if mirror and i != j:
+                element_lines.append(
+                    f"        {output_name}[{j + 1},{i + 1}] {assignment} conj({output_name}[{i + 1},{j + 1}])"
+                )
+    return temp_lines, element_lines
+
+
+def _sympy_matrix_to_julia_hermitian(
+    matrix: smp.Matrix,
+    func_name: str,
+    zero_input: bool,
+    inplace_add: bool,
+    use_temporaries: bool,
+    output_name: str,
+    uplo: str,
+    mirror: bool,
+    n_jobs: None | int,
+    chunk_size: None | int = None,
+) -> tuple[str, smp.Function]:
+    """Shared implementation of the Hermitian fill and add code generators.
+
+    The rows of the triangle are split into blocks (one block if `n_jobs` is None),
+    CSE and printing run per block, optionally in parallel processes, and the
+    blocks are stitched together in order into a single Julia function.
+
+    With `chunk_size` the non-zero triangle elements are instead split into chunks
+    of at most `chunk_size` elements, each emitted as a separate `@noinline`
+    function called from `func_name`, which keeps the Julia compile time down for
+    large matrices.
+    """
+    rows, cols = matrix.rows, matrix.cols
+
+    # Input validation
+    if rows == 0 or cols == 0:
+        raise ValueError("Matrix cannot be empty")
+    if rows != cols:
+        raise ValueError(
+            f"Matrix must be square for Hermitian operations, got {rows}x{cols}"
+        )
+    if uplo not in ("U", "L"):
+        raise ValueError(f"uplo must be 'U' or 'L', got '{uplo}'")
+
+    # Extract matrix variable and symbols
+    matrix_var_name, other_syms, args = _extract_matrix_variable_and_symbols(matrix)
+
+    triangle_indices = _get_triangle_indices(rows, uplo)
+    if chunk_size is not None:
+        nonzero = [
+            (i, j, matrix[i, j]) for i, j in triangle_indices if matrix[i, j] != 0
+        ]
+        block_elements = [
+            nonzero[start:stop]
+            for start, stop in partition_chunks(len(nonzero), chunk_size)
+        ]
+    else:
+        if n_jobs is None or n_jobs <= 1:
+            row_blocks = [(0, rows)]
+        else:
+            row_blocks = partition_triangle_rows(rows, n_jobs, uplo=uplo)
+        block_elements = [
+            [
+                (i, j, matrix[i, j])
+                for i, j in triangle_indices
+                if start <= i < stop and matrix[i, j] != 0
+            ]
+            for start, stop in row_blocks
+        ]
+
+    block_args = []
+    for idb, elements in enumerate(block_elements):
+        suffix = "" if len(block_elements) == 1 else f"{idb}_"
+        block_args.append(
+            (
+                elements,
+                matrix_var_name,
+                output_name,
+                uplo,
+                mirror,
+                inplace_add,
+                use_temporaries,
+                f"_t{suffix}",
+                f"_tmp{suffix}",
+            )
+        )
+    blocks = map_blocks(_hermitian_block_lines, block_args, n_jobs)
+
+    # Generate Julia code
+    lines = []
+    block_calls = []
+    if chunk_size is not None:
+        base_name = func_name.removesuffix("!")
+        for idb, (block_temps, element_lines) in enumerate(blocks, start=1):
+            block_sig = _build_function_signature(
+                f"{base_name}_block{idb}!", output_name, matrix_var_name, args
+            )
+            lines.append(f"@noinline {block_sig}")
+            lines.append("    @inbounds begin")
+            lines.extend(block_temps)
+            lines.extend(element_lines)
+            lines.append("    end")
+            lines.append("    nothing")
+            lines.append("end")
+            lines.append("")
+            block_calls.append("        " + block_sig.removeprefix("function "))
+
+    sig = _build_function_signature(func_name, output_name, matrix_var_name, args)
+    lines.append(sig)
+    lines.append("    @inbounds begin")
+
+    # Initialize matrix if needed
+    if zero_input:
+        lines.append(f"        fill!({output_name}, .0im)")
+
+    if chunk_size is not None:
+        lines.extend(block_calls)
+    else:
+        # Add temporary variable declarations
+        temp_lines = [line for block_temps, _ in blocks for line in block_temps]
+        if temp_lines:
+            lines.append("        # Pre-computed expressions")
+            lines.extend(temp_lines)
+
+        for _, element_lines in blocks:
+            lines.extend(element_lines)
+
+    lines.append("    end")
+    lines.append("    nothing")
+    lines.append("end")
+
+    # Build the argument list for the SymPy function signature to match Julia signature
+    # Order: output_name, matrix_var_name (if present), other_syms
+    func_args: list[smp.Symbol] = [smp.Symbol(output_name)]
+    if matrix_var_name:
+        func_args.append(smp.Symbol(matrix_var_name))
+    func_args.extend(other_syms)
+
+    return "\n".join(lines), smp.Function(func_name)(*func_args)  # type: ignore[return-value]
+
+
 def sympy_matrix_to_julia_fill_hermitian(
     matrix: smp.Matrix,
     func_name: str = "fill_matrix!",
@@ -183,6 +392,8 @@ def sympy_matrix_to_julia_fill_hermitian(
     output_name: str = "matrix",
     uplo: str = "U",
     mirror: bool = True,
+    n_jobs: None | int = None,
+    chunk_size: None | int = None,
 ) -> tuple[str, smp.Function]:
     """Generate a Julia function that efficiently fills a Hermitian matrix in-place.
 
@@ -214,6 +425,14 @@ def sympy_matrix_to_julia_fill_hermitian(
             automatically transformed to use conj() of the symmetric position. For example,
             if computing the upper triangle (uplo='U') and an expression contains u[5,1],
             it will be transformed to conj(u[1,5]). Defaults to True.
+        n_jobs (int, optional): Number of processes used for code generation. With
+            n_jobs > 1 the rows of the triangle are split into n_jobs blocks, each with
+            its own CSE temporaries, which are processed in parallel and stitched
+            together in order. Defaults to None (serial).
+        chunk_size (int, optional): Maximum number of elements per generated block
+            function. The elements are split into `@noinline` block functions called
+            from `func_name`, reducing the Julia compile time for large matrices.
+            Defaults to None (a single function).
 
     Returns:
         tuple[str, smp.FunctionClass]:
@@ -237,141 +456,18 @@ def sympy_matrix_to_julia_fill_hermitian(
         >>> # But if an upper triangle element references it (e.g., in a different matrix),
         >>> # the reference would be transformed to conj(u[0,2])
     """
-    rows, cols = matrix.rows, matrix.cols
-
-    # Input validation
-    if rows == 0 or cols == 0:
-        raise ValueError("Matrix cannot be empty")
-    if rows != cols:
-        raise ValueError(
-            f"Matrix must be square for Hermitian operations, got {rows}x{cols}"
-        )
-    if uplo not in ("U", "L"):
-        raise ValueError(f"uplo must be 'U' or 'L', got '{uplo}'")
-
-    # Extract matrix variable and symbols
-    matrix_var_name, other_syms, args = _extract_matrix_variable_and_symbols(matrix)
-
-    # Get triangle elements and run CSE
-    triangle = _get_triangle_elements(matrix, uplo)
-    cse_result = smp.cse(triangle, symbols=smp.numbered_symbols("_t"))
-    subs_all: list[tuple[smp.Symbol, smp.Expr]] = cse_result[0]  # type: ignore[assignment]
-    reduced_triangle: list[smp.Expr] = cse_result[1]  # type: ignore[assignment]
-
-    # Reconstruct full reduced list with Hermitian mirror or conjugate reference
-    reduced_all: list[Optional[smp.Expr]] = [None] * (rows * cols)
-    idx = 0
-
-    if uplo == "U":
-        for i in range(rows):
-            for j in range(i, cols):
-                expr = reduced_triangle[idx]
-                reduced_all[i * cols + j] = expr
-                if mirror and i != j:
-                    reduced_all[j * cols + i] = expr.conjugate()  # type: ignore[assignment]
-                idx += 1
-    else:  # uplo == "L"
-        for i in range(rows):
-            for j in range(0, i + 1):
-                expr = reduced_triangle[idx]
-                reduced_all[i * cols + j] = expr
-                if mirror and i != j:
-                    reduced_all[j * cols + i] = expr.conjugate()  # type: ignore[assignment]
-                idx += 1
-
-    # 3) Determine which temporary variables are needed for the specified triangle
-    tmp_syms = [t for t, _ in subs_all]
-    # Collect expressions used in the specified triangle
-    if uplo == "U":
-        used_exprs = [
-            reduced_all[i * cols + j] for i in range(rows) for j in range(i, cols)
-        ]
-    else:  # uplo == "L"
-        used_exprs = [
-            reduced_all[i * cols + j] for i in range(rows) for j in range(0, i + 1)
-        ]
-    needed = set()  # Set to track required temporary variables
-    lookup = {t: expr for t, expr in subs_all}  # Map from temp var to its expression
-
-    # Recursively mark all temporary variables that are needed
-    def mark(expr):
-        for s in expr.free_symbols:
-            if s in tmp_syms and s not in needed:
-                needed.add(s)
-                # Recursively mark any temporaries used in this temporary's definition
-                mark(lookup[s])
-
-    # Find all temporary variables needed for the upper triangle expressions
-    for expr in used_exprs:
-        mark(expr)
-    # Keep only the temporary variables that are actually needed
-    pruned_subs = [(t, e) for t, e in subs_all if t in needed]
-
-    # 4) Perform final inlining optimization
-    usage = {t: 0 for t, _ in pruned_subs}
-    all_exprs = [e for _, e in pruned_subs] + used_exprs
-    for expr in all_exprs:
-        assert expr is not None
-        for t in list(usage):
-            if t in expr.free_symbols:  # type: ignore[operator]
-                usage[t] += 1
-    inline = {t for t, cnt in usage.items() if cnt == 1}
-    keep = [(t, e) for t, e in pruned_subs if t not in inline]
-    inline_map = {t: lookup[t] for t in inline}
-
-    # Set assignment operator and get triangle indices
-    assignment = "+=" if inplace_add else "="
-    triangle_indices = _get_triangle_indices(rows, uplo)
-
-    # Generate Julia code
-    lines = []
-    sig = _build_function_signature(func_name, output_name, matrix_var_name, args)
-    lines.append(sig)
-    lines.append("    @inbounds begin")
-
-    # Initialize matrix if needed
-    if zero_input:
-        lines.append(f"        fill!({output_name}, .0im)")
-
-    # Add temporary variable declarations
-    if keep:
-        lines.append("        # Pre-computed expressions")
-        for t, expr in keep:
-            expr_sub = expr.subs(inline_map)
-            lines.append(f"        {t} = {custom_julia_code(expr_sub)}")
-
-    # Fill matrix with non-zero elements
-    for i, j in triangle_indices:
-        expr_opt = reduced_all[i * cols + j]
-        assert expr_opt is not None, f"Expression at ({i},{j}) should not be None"
-        expr = expr_opt.subs(inline_map)
-        # Transform matrix references to use the correct triangle
-        expr = _transform_matrix_references_for_triangle(  # type: ignore[arg-type, assignment]
-            expr, matrix_var_name, uplo, mirror
-        )
-        # Skip zero elements
-        is_zero = expr == 0 or (hasattr(expr, "is_zero") and expr.is_zero)
-        if not is_zero:
-            code = custom_julia_code(expr)
-            lines.append(f"        {output_name}[{i + 1},{j + 1}] {assignment} {code}")
-            # Mirror for off-diagonal elements (Hermitian property) if requested
-            if mirror and i != j:
-                lines.append(
-                    f"        {output_name}[{j + 1},{i + 1}] {assignment} conj({output_name}[{i + 1},{j + 1}])"
-                )
-
-    lines.append("    end")
-    lines.append("    nothing")
-    lines.append("end")
-
-    # Build the argument list for the SymPy function signature to match Julia signature
-    # Order: output_name, matrix_var_name (if present), other_syms
-    func_args: list[smp.Symbol] = [smp.Symbol(output_name)]
-    if matrix_var_name:
-        func_args.append(smp.Symbol(matrix_var_name))
-    func_args.extend(other_syms)
-
-    return "\n".join(lines), smp.Function(func_name)(*func_args)  # type: ignore[return-value]
+    return _sympy_matrix_to_julia_hermitian(
+        matrix,
+        func_name=func_name,
+        zero_input=zero_input,
+        inplace_add=inplace_add,
+        use_temporaries=False,
+        output_name=output_name,
+        uplo=uplo,
+        mirror=mirror,
+        n_jobs=n_jobs,
+        chunk_size=chunk_size,
+    )
 
 
 def sympy_matrix_to_julia_add_hermitian(
@@ -380,6 +476,8 @@ def sympy_matrix_to_julia_add_hermitian(
     output_name: str = "matrix",
     uplo: str = "U",
     mirror: bool = True,
+    n_jobs: None | int = None,
+    chunk_size: None | int = None,
 ) -> tuple[str, smp.Function]:
     """Generate a Julia function that adds to a Hermitian matrix in-place using temporary variables.
 
@@ -408,6 +506,10 @@ def sympy_matrix_to_julia_add_hermitian(
             This is useful for BLAS operations that only use one triangle. When mirror=False,
             any matrix references in expressions that refer to the opposite triangle are
             automatically transformed to use conj() of the symmetric position. Defaults to True.
+        n_jobs: Number of processes used for code generation, see
+            sympy_matrix_to_julia_fill_hermitian. Defaults to None (serial).
+        chunk_size: Maximum number of elements per generated block function, see
+            sympy_matrix_to_julia_fill_hermitian. Defaults to None.
 
     Returns:
         Tuple containing:
@@ -417,102 +519,40 @@ def sympy_matrix_to_julia_add_hermitian(
     Raises:
         ValueError: If the matrix is empty or not square, or if uplo is not "U" or "L"
     """
-    rows, cols = matrix.rows, matrix.cols
-
-    # Input validation
-    if rows == 0 or cols == 0:
-        raise ValueError("Matrix cannot be empty")
-    if rows != cols:
-        raise ValueError(
-            f"Matrix must be square for Hermitian operations, got {rows}x{cols}"
-        )
-    if uplo not in ("U", "L"):
-        raise ValueError(f"uplo must be 'U' or 'L', got '{uplo}'")
-
-    # Extract matrix variable and symbols
-    matrix_var_name, other_syms, args = _extract_matrix_variable_and_symbols(matrix)
-
-    # Get triangle elements and perform CSE with inlining
-    triangle = _get_triangle_elements(matrix, uplo)
-    lookup, inline_map, keep = _perform_cse_and_inlining(triangle)
-
-    # Get reduced triangle for final code generation
-    cse_result = smp.cse(triangle, symbols=smp.numbered_symbols("_t"))
-    reduced_triangle: list[smp.Expr] = cse_result[1]  # type: ignore[assignment]
-
-    # Get triangle indices
-    triangle_indices = _get_triangle_indices(rows, uplo)
-
-    # Generate Julia code
-    lines = []
-    sig = _build_function_signature(func_name, output_name, matrix_var_name, args)
-    lines.append(sig)
-    lines.append("    @inbounds begin")
-
-    # Add temporary variable declarations for CSE
-    if keep:
-        lines.append("        # Pre-computed expressions")
-        for t, expr in keep:
-            expr_sub = expr.subs(inline_map)
-            lines.append(f"        {t} = {custom_julia_code(expr_sub)}")
-
-    # Add to matrix with temporary variables for each element
-
-    temp_counter = 0
-    for idx, (i, j) in enumerate(triangle_indices):
-        expr = reduced_triangle[idx].subs(inline_map)
-        # Transform matrix references to use the correct triangle
-        expr = _transform_matrix_references_for_triangle(  # type: ignore[arg-type, assignment]
-            expr, matrix_var_name, uplo, mirror
-        )
-
-        # Skip zero elements
-        is_zero = expr == 0 or (hasattr(expr, "is_zero") and expr.is_zero)
-        if not is_zero:
-            code = custom_julia_code(expr)
-            temp_name = f"_tmp{temp_counter}"
-            temp_counter += 1
-
-            # Create temporary variable with the computed value
-            lines.append(f"        {temp_name} = {code}")
-            # Add to the triangle position
-            lines.append(f"        {output_name}[{i + 1},{j + 1}] += {temp_name}")
-
-            # Mirror for off-diagonal elements (Hermitian property) if requested
-            if mirror and i != j:
-                lines.append(
-                    f"        {output_name}[{j + 1},{i + 1}] += conj({temp_name})"
-                )
-
-    lines.append("    end")
-    lines.append("    nothing")
-    lines.append("end")
-
-    # Build the argument list for the SymPy function signature
-    func_args = [smp.Symbol(output_name)]
-    if matrix_var_name:
-        func_args.append(smp.Symbol(matrix_var_name))
-    func_args.extend(other_syms)
-
-    return "\n".join(lines), smp.Function(func_name)(*func_args)
+    return _sympy_matrix_to_julia_hermitian(
+        matrix,
+        func_name=func_name,
+        zero_input=False,
+        inplace_add=True,
+        use_temporaries=True,
+        output_name=output_name,
+        uplo=uplo,
+        mirror=mirror,
+        n_jobs=n_jobs,
+        chunk_size=chunk_size,
+    )
 
 
 def _perform_cse_and_inlining(
     triangle: list[smp.Expr],
+    temp_prefix: str = "_t",
 ) -> tuple[
     dict[smp.Symbol, smp.Expr],
     dict[smp.Symbol, smp.Expr],
     list[tuple[smp.Symbol, smp.Expr]],
+    list[smp.Expr],
 ]:
     """Perform CSE and compute inlining map.
 
     Args:
         triangle: List of expressions from triangle
+        temp_prefix: Prefix of the generated temporaries
 
     Returns:
-        Tuple of (lookup dict, inline_map dict, keep list of (symbol, expr))
+        Tuple of (lookup dict, inline_map dict, keep list of (symbol, expr),
+        reduced expressions)
     """
-    cse_result = smp.cse(triangle, symbols=smp.numbered_symbols("_t"))
+    cse_result = smp.cse(triangle, symbols=smp.numbered_symbols(temp_prefix))
     subs_all: list[tuple[smp.Symbol, smp.Expr]] = cse_result[0]  # type: ignore[assignment]
     reduced_triangle: list[smp.Expr] = cse_result[1]  # type: ignore[assignment]
 
@@ -522,23 +562,34 @@ def _perform_cse_and_inlining(
 
     all_exprs = [e for _, e in subs_all] + reduced_triangle
     for expr in all_exprs:
-        for t in list(usage):
-            if t in expr.free_symbols:
-                usage[t] += 1
+        for t in expr.free_symbols & usage.keys():
+            usage[t] += 1
 
     # Identify temporaries used only once (candidates for inlining)
     inline = {t for t, cnt in usage.items() if cnt == 1}
     keep = [(t, e) for t, e in subs_all if t not in inline]
-    inline_map = {t: lookup[t] for t in inline}
+    # CSE returns the temporaries in dependency order, so substituting the
+    # already resolved ones yields inline expressions free of inlined temporaries
+    inline_map: dict[smp.Symbol, smp.Expr] = {}
+    for t, e in subs_all:
+        if t in inline:
+            inline_map[t] = e.subs(inline_map) if inline_map else e
 
-    return lookup, inline_map, keep
+    return lookup, inline_map, keep, reduced_triangle
 
 
-def generate_hamiltonian_code(hamiltonian: smp.Matrix) -> tuple[str, smp.Function]:
+def generate_hamiltonian_code(
+    hamiltonian: smp.Matrix,
+    n_jobs: None | int = None,
+    chunk_size: None | int = None,
+) -> tuple[str, smp.Function]:
     """Generate Julia code to fill a Hamiltonian matrix.
 
     Args:
         hamiltonian: SymPy matrix representing the Hamiltonian
+        n_jobs: Number of processes used for code generation. Defaults to None.
+        chunk_size: Maximum number of elements per `@noinline` block function.
+            Defaults to None (a single function).
 
     Returns:
         Julia code string for the Hamiltonian-filling function
@@ -550,15 +601,20 @@ def generate_hamiltonian_code(hamiltonian: smp.Matrix) -> tuple[str, smp.Functio
         output_name="du",
         uplo="U",
         mirror=True,
+        n_jobs=n_jobs,
+        chunk_size=chunk_size,
     )
     return code, sig
 
 
-def generate_dissipator_code(dissipator: smp.Matrix) -> tuple[str, smp.Function]:
+def generate_dissipator_code(
+    dissipator: smp.Matrix, n_jobs: None | int = None
+) -> tuple[str, smp.Function]:
     """Generate Julia code to fill a Dissipator matrix.
 
     Args:
         dissipator: SymPy matrix representing the Dissipator
+        n_jobs: Number of processes used for code generation. Defaults to None.
 
     Returns:
         Julia code string for the Dissipator-filling function
@@ -569,5 +625,6 @@ def generate_dissipator_code(dissipator: smp.Matrix) -> tuple[str, smp.Function]
         output_name="du",
         uplo="U",
         mirror=True,
+        n_jobs=n_jobs,
     )
     return code, sig
@@ -0,0 +1,315 @@
+import numpy as np
+import numpy.typing as npt
+import sympy as smp
+
+from .julia_code_printer import CustomJuliaCodePrinter
+from .utils_julia_matrix_assemble import (
+    _build_function_signature,
+    _extract_matrix_variable_and_symbols,
+    _perform_cse_and_inlining,
+)
+
+
+def decompose_hamiltonian(
+    hamiltonian: smp.Matrix,
+) -> tuple[
+    npt.NDArray[np.complex128],
+    list[smp.Expr],
+    list[tuple[int, int, int, complex]],
+]:
+    """Decompose a symbolic Hermitian Hamiltonian into H0 + Σ_k f_k V_k.
+
+    Only the upper triangle is decomposed; the lower triangle follows from
+    hermiticity, i.e. each off-diagonal term f_k V_k[i,j] is accompanied by
+    conj(f_k V_k[i,j]) at [j,i]. Every element is expanded into a sum of terms, the
+    numerical terms make up H0 and each distinct symbolic monomial (e.g. Ω0*PZ0)
+    becomes a coefficient f_k.
+
+    Args:
+        hamiltonian (smp.Matrix): symbolic Hamiltonian
+
+    Returns:
+        tuple:
+            npt.NDArray[np.complex128]: time and parameter independent part H0 (full
+                                        matrix)
+            list[smp.Expr]: coefficients f_k
+            list[tuple[int, int, int, complex]]: non-zero elements (i, j, k, value)
+                                                of the upper triangle of V_k
+    """
+    rows, cols = hamiltonian.shape
+    if rows != cols:
+        raise ValueError(f"Hamiltonian must be square, got {rows}x{cols}")
+
+    H0 = np.zeros((rows, cols), dtype=np.complex128)
+    coefficients: dict[smp.Expr, int] = {}
+    terms: dict[tuple[int, int, int], complex] = {}
+
+    for i in range(rows):
+        for j in range(i, cols):
+            expr = hamiltonian[i, j]
+            if expr == 0:
+                continue
+            for term in smp.Add.make_args(smp.expand(expr)):
+                if not term.free_symbols:
+                    H0[i, j] += complex(term)
+                    continue
+                value, monomial = term.as_independent(*term.free_symbols, as_Add=False)
+                k = coefficients.setdefault(monomial, len(coefficients))
+                terms[(i, j, k)] = terms.get((i, j, k), 0j) + complex(value)
+
+    H0 = np.triu(H0) + np.triu(H0, 1).conj().T
+    return (
+        H0,
+        list(coefficients),
+        [(i, j, k, value) for (i, j, k), value in terms.items() if value != 0],
+    )
+
+
+def _julia_vector(values: list[int] | list[complex], element_type: str) -> str:
+    if element_type == "ComplexF64":
+        elems = [f"{v.real!r} + {v.imag!r}im" for v in values]  # type: ignore[union-attr]
+    else:
+        elems = [str(v) for v in values]
+    return f"{element_type}[{', '.join(elems)}]"
+
+
+def sparse_hamiltonian_support(
+    H0: npt.NDArray[np.complex128],
+    terms: list[tuple[int, int, int, complex]],
+    buffer_name: str = "buf",
+    terms_name: str = "sparse_terms",
+) -> str:
+    """Generate the Julia definitions of the sparse Hamiltonian buffer and terms.
+
+    The buffer is a SparseMatrixCSC with the union of the non-zero patterns of H0 and
+    all V_k (including the mirrored lower triangle). The terms are stored as a
+    `SparseTerms` object (see julia_common.jl), indexing directly into the non-zero
+    values of the buffer.
+
+    Args:
+        H0 (npt.NDArray[np.complex128]): time and parameter independent part
+        terms (list[tuple[int, int, int, complex]]): upper triangle elements
+                                                    (i, j, k, value) of the V_k
+        buffer_name (str, optional): name of the buffer. Defaults to "buf".
+        terms_name (str, optional): name of the terms. Defaults to "sparse_terms".
+
+    Returns:
+        str: Julia code
+    """
+    n = H0.shape[0]
+    pattern = {(int(i), int(j)) for i, j in zip(*np.nonzero(H0))}
+    for i, j, _, _ in terms:
+        pattern.update([(i, j), (j, i)])
+
+    # column major order of the non-zero elements, as stored in a SparseMatrixCSC
+    ordered = sorted(pattern, key=lambda ij: (ij[1], ij[0]))
+    position = {ij: idx + 1 for idx, ij in enumerate(ordered)}
+    colptr = [1]
+    for j in range(n):
+        colptr.append(colptr[-1] + sum(1 for _, col in ordered if col == j))
+    rowval = [i + 1 for i, _ in ordered]
+    nzval0 = [complex(H0[i, j]) for i, j in ordered]
+
+    nzind = [position[(i, j)] for i, j, _, _ in terms]
+    nzmirror = [position[(j, i)] if i != j else 0 for i, j, _, _ in terms]
+    coef = [k + 1 for _, _, k, _ in terms]
+    vals = [value for _, _, _, value in terms]
+
+    return (
+        f"{buffer_name} = SparseMatrixCSC({n}, {n}, "
+        f"{_julia_vector(colptr, 'Int')}, {_julia_vector(rowval, 'Int')}, "
+        f"zeros(ComplexF64, {len(ordered)}))\n"
+        f"{terms_name}::SparseTerms{{ComplexF64}} = SparseTerms("
+        f"{_julia_vector(nzval0, 'ComplexF64')}, {_julia_vector(nzind, 'Int')}, "
+        f"{_julia_vector(nzmirror, 'Int')}, {_julia_vector(coef, 'Int')}, "
+        f"{_julia_vector(vals, 'ComplexF64')})\n"
+    )
+
+
+def _coefficient_lines(
+    coefficients: smp.Matrix,
+) -> tuple[list[smp.Symbol], str, list[str], list[str]]:
+    """Run CSE on the coefficients f_k and print them as Julia code.
+
+    Args:
+        coefficients (smp.Matrix): column matrix of the coefficients f_k
+
+    Returns:
+        tuple: (symbols, arguments string, temporary declaration lines, printed
+                coefficients)
+    """
+    _, other_syms, args = _extract_matrix_variable_and_symbols(coefficients)
+    _, inline_map, keep, reduced = _perform_cse_and_inlining(list(coefficients))
+    printer = CustomJuliaCodePrinter({})
+
+    temp_lines = []
+    if keep:
+        temp_lines.append("        # Pre-computed expressions")
+        temp_lines.extend(
+            f"        {t} = {printer.doprint(expr.subs(inline_map))}"
+            for t, expr in keep
+        )
+    codes = [printer.doprint(expr.subs(inline_map)) for expr in reduced]
+    return other_syms, args, temp_lines, codes
+
+
+def generate_sparse_hamiltonian_code(
+    coefficients: smp.Matrix,
+    func_name: str = "sparse_hamiltonian!",
+    output_name: str = "du",
+    terms_name: str = "sparse_terms",
+) -> tuple[str, smp.Function]:
+    """Generate a Julia function that updates a sparse Hamiltonian in-place.
+
+    The generated function only evaluates the scalar coefficients f_k(t) and passes
+    them to `update_sparse_hamiltonian!` (see julia_common.jl), which writes
+    H0 + Σ_k f_k V_k into the non-zero values of the sparse output matrix.
+
+    Args:
+        coefficients (smp.Matrix): column matrix of the coefficients f_k
+        func_name (str, optional): Name for the generated Julia function. Defaults
+                                    to "sparse_hamiltonian!".
+        output_name (str, optional): Name of the output matrix parameter. Defaults to
+                                    "du".
+        terms_name (str, optional): Name of the Julia global holding the sparse
+                                    terms. Defaults to "sparse_terms".
+
+    Returns:
+        tuple[str, smp.Function]:
+            str: Julia code string
+            smp.Function: SymPy function object representing the call signature
+    """
+    other_syms, args, temp_lines, codes = _coefficient_lines(coefficients)
+
+    lines = [_build_function_signature(func_name, output_name, None, args)]
+    lines.append("    @inbounds begin")
+    lines.extend(temp_lines)
+    lines.append("        f = (")
+    lines.extend(f"            ComplexF64({code})," for code in codes)
+    lines.append("        )")
+    lines.append(f"        update_sparse_hamiltonian!({output_name}, {terms_name}, f)")
+    lines.append("    end")
+    lines.append("    nothing")
+    lines.append("end")
+
+    func_args: list[smp.Symbol] = [smp.Symbol(output_name)]
+    func_args.extend(other_syms)
+    return "\n".join(lines), smp.Function(func_name)(*func_args)  # type: ignore[return-value]
+
+
+def generate_coefficients_code(
+    coefficients: smp.Matrix,
+    func_name: str = "superoperator_coefficients!",
+    output_name: str = "du",
+) -> tuple[str, smp.Function]:
+    """Generate a Julia function that writes the coefficients f_k(t) into a vector.
+
+    Args:
+        coefficients (smp.Matrix): column matrix of the coefficients f_k
+        func_name (str, optional): Name for the generated Julia function. Defaults
+                                    to "superoperator_coefficients!".
+        output_name (str, optional): Name of the output vector parameter. Defaults to
+                                    "du".
+
+    Returns:
+        tuple[str, smp.Function]:
+            str: Julia code string
+            smp.Function: SymPy function object representing the call signature
+    """
+    other_syms, args, temp_lines, codes = _coefficient_lines(coefficients)
+
+    lines = [_build_function_signature(func_name, output_name, None, args)]
+    lines.append("    @inbounds begin")
+    lines.extend(temp_lines)
+    lines.extend(
+        f"        {output_name}[{k + 1}] = {code}" for k, code in enumerate(codes)
+    )
+    lines.append("    end")
+    lines.append("    nothing")
+    lines.append("end")
+
+    func_args: list[smp.Symbol] = [smp.Symbol(output_name)]
+    func_args.extend(other_syms)
+    return "\n".join(lines), smp.Function(func_name)(*func_args)  # type: ignore[return-value]
+
+
+def _julia_sparse(matrix: npt.NDArray[np.complex128]) -> str:
+    """Julia `sparse(I, J, V, m, n)` expression of a (square) matrix"""
+    n = matrix.shape[0]
+    rows, cols = np.nonzero(matrix)
+    I_code = _julia_vector([int(i) + 1 for i in rows], "Int")
+    J_code = _julia_vector([int(j) + 1 for j in cols], "Int")
+    V_code = _julia_vector([complex(v) for v in matrix[rows, cols]], "ComplexF64")
+    return f"sparse({I_code}, {J_code}, {V_code}, {n}, {n})"
+
+
+def superoperator_support(
+    H0: npt.NDArray[np.complex128],
+    terms: list[tuple[int, int, int, complex]],
+    n_coefficients: int,
+    C_array: npt.NDArray[np.floating | np.complexfloating],
+    superoperator_name: str = "superoperator",
+    buffer_name: str = "buf",
+) -> str:
+    """Generate the Julia definitions of the Liouville superoperator.
+
+    The superoperator is built once in Julia by `build_superoperator` (see
+    julia_common.jl) from sparse H0, the upper triangles U_k of the V_k (with half
+    of the diagonal, such that H = H0 + Σ_k f_k U_k + conj(f_k) U_k†) and the
+    collapse operators C.
+
+    Args:
+        H0 (npt.NDArray[np.complex128]): time and parameter independent part
+        terms (list[tuple[int, int, int, complex]]): upper triangle elements
+                                                    (i, j, k, value) of the V_k
+        n_coefficients (int): number of coefficients f_k
+        C_array (npt.NDArray): collapse operators, real or complex
+        superoperator_name (str, optional): name of the superoperator. Defaults to
+                                            "superoperator".
+        buffer_name (str, optional): name of the coefficient buffer. Defaults to
+                                    "buf".
+
+    Returns:
+        str: Julia code
+    """
+    n = H0.shape[0]
+    U = np.zeros((n_coefficients, n, n), dtype=np.complex128)
+    for i, j, k, value in terms:
+        U[k, i, j] += value / 2 if i == j else value
+
+    H0_code = _julia_sparse(H0)
+    U_code = ", ".join(_julia_sparse(Uk) for Uk in U)
+    C_code = ", ".join(
+        _julia_sparse(C) for C in np.asarray(C_array, dtype=np.complex128)
+    )
+    return (
+        f"{superoperator_name} = build_superoperator({H0_code}, "
+        f"SparseMatrixCSC{{ComplexF64, Int}}[{U_code}], "
+        f"SparseMatrixCSC{{ComplexF64, Int}}[{C_code}])\n"
+        f"{buffer_name} = zeros(ComplexF64, {n_coefficients})\n"
+        f"jac_prototype = {superoperator_name}.prototype\n"
+    )
+
+
+def generate_jump_dissipator_code(
+    C_array: npt.NDArray[np.floating | np.complexfloating], name: str = "DissFun"
+) -> str:
+    """Generate the Julia definition of the jump operator dissipator.
+
+    The dissipator Σ_c C ρ C† - ½{C†C, ρ} is applied at runtime by a
+    `JumpDissipator` (see julia_common.jl) built from the sparse collapse operators,
+    instead of generating code for every element of the symbolic dissipator.
+
+    Args:
+        C_array (npt.NDArray): collapse operators, real or complex
+        name (str, optional): name of the dissipator. Defaults to "DissFun".
+
+    Returns:
+        str: Julia code
+    """
+    C_array = np.asarray(C_array, dtype=np.complex128)
+    C_code = ", ".join(_julia_sparse(C) for C in C_array)
+    return (
+        f"{name} = JumpDissipator({C_array.shape[-1]}, "
+        f"SparseMatrixCSC{{ComplexF64, Int}}[{C_code}])\n"
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+import numpy.typing as npt
+
+__all__ = ["packed_index", "pack_density_matrix", "unpack_density_matrix"]
+
+
+def packed_index(n: int, i: int, j: int) -> int:
+    """Index of density matrix element ρ[i,j] (i <= j) in the packed state vector.
+
+    The packed layout of an n x n Hermitian density matrix is a real vector of
+    length n²: the n real populations ρ[i,i] followed by the real and imaginary part
+    of each upper triangle coherence ρ[i,j], i < j, in row-major order. For i < j
+    the returned index points to the real part, the imaginary part is the next
+    element.
+
+    Args:
+        n (int): number of states
+        i (int): row index (0-based)
+        j (int): column index (0-based)
+
+    Returns:
+        int: 0-based index into the packed state vector
+    """
+    if not (0 <= i <= j < n):
+        raise ValueError(f"Expected 0 <= i <= j < {n}, got i={i}, j={j}")
+    if i == j:
+        return i
+    m = i * n - i * (i + 1) // 2 + (j - i - 1)
+    return n + 2 * m
+
+
+def pack_density_matrix(ρ: npt.NDArray[np.complex128]) -> npt.NDArray[np.float64]:
+    """Pack a Hermitian density matrix into the real packed state vector.
+
+    Args:
+        ρ (npt.NDArray[np.complex128]): density matrix of shape (n, n)
+
+    Returns:
+        npt.NDArray[np.float64]: packed state vector of length n²
+    """
+    ρ = np.asarray(ρ)
+    n = ρ.shape[0]
+    if ρ.shape != (n, n):
+        raise ValueError(f"Expected a square density matrix, got shape {ρ.shape}")
+    rows, cols = np.triu_indices(n, k=1)
+    coherences = ρ[rows, cols]
+    u = np.empty(n * n, dtype=np.float64)
+    u[:n] = np.real(np.diagonal(ρ))
+    u[n::2] = coherences.real
+    u[n + 1 :: 2] = coherences.imag
+    return u
+
+
+def unpack_density_matrix(u: npt.NDArray[np.floating]) -> npt.NDArray[np.complex128]:
+    """Unpack packed state vectors into Hermitian density matrices.
+
+    Args:
+        u (npt.NDArray[np.floating]): packed state vector(s) of shape (..., n²)
+
+    Returns:
+        npt.NDArray[np.complex128]: density matrices of shape (..., n, n)
+    """
+    u = np.asarray(u)
+    n = int(round(np.sqrt(u.shape[-1])))
+    if n * n != u.shape[-1]:
+        raise ValueError(
+            f"Length of the packed state ({u.shape[-1]}) is not a square number"
+        )
+    ρ = np.zeros(u.shape[:-1] + (n, n), dtype=np.complex128)
+    diag = np.arange(n)
+    ρ[..., diag, diag] = u[..., :n]
+    rows, cols = np.triu_indices(n, k=1)
+    coherences = u[..., n::2] + 1j * u[..., n + 1 :: 2]
+    ρ[..., rows, cols] = coherences
+    ρ[..., cols, rows] = coherences.conj()
+    return ρ
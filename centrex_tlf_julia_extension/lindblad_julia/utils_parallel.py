@@ -0,0 +1,93 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def partition_triangle_rows(
+    n: int, n_blocks: int, uplo: str = "U"
+) -> list[tuple[int, int]]:
+    """Partition the rows of an n x n triangle into contiguous row blocks.
+
+    Blocks are chosen such that each holds roughly the same number of triangle
+    elements. The partition only depends on `n`, `n_blocks` and `uplo`, so code
+    generated per block is reproducible.
+
+    Args:
+        n (int): number of rows
+        n_blocks (int): requested number of blocks, capped at n
+        uplo (str): "U" for the upper triangle, "L" for the lower triangle
+
+    Returns:
+        list[tuple[int, int]]: half-open row ranges (start, stop)
+    """
+    if uplo not in ("U", "L"):
+        raise ValueError(f"uplo must be 'U' or 'L', got '{uplo}'")
+    n_blocks = max(1, min(n_blocks, n))
+    row_sizes = [n - i if uplo == "U" else i + 1 for i in range(n)]
+    total = sum(row_sizes)
+
+    blocks: list[tuple[int, int]] = []
+    start = 0
+    count = 0
+    for i, size in enumerate(row_sizes):
+        count += size
+        remaining_rows = n - i - 1
+        remaining_blocks = n_blocks - len(blocks) - 1
+        target = total * (len(blocks) + 1) / n_blocks
+        if remaining_blocks > 0 and (
+            count >= target or remaining_rows == remaining_blocks
+        ):
+            blocks.append((start, i + 1))
+            start = i + 1
+    blocks.append((start, n))
+    return blocks
+
+
+def partition_chunks(n_items: int, chunk_size: int) -> list[tuple[int, int]]:
+    """Partition n_items consecutive items into chunks of at most chunk_size items.
+
+    The items are spread evenly over the minimal number of chunks, so the last chunk
+    is not much smaller than the others.
+
+    Args:
+        n_items (int): number of items
+        chunk_size (int): maximum number of items per chunk
+
+    Returns:
+        list[tuple[int, int]]: half-open item ranges (start, stop)
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be >= 1, got {chunk_size}")
+    n_chunks = max(1, -(-n_items // chunk_size))
+    bounds = [round(i * n_items / n_chunks) for i in range(n_chunks + 1)]
+    return list(itertools.pairwise(bounds))
+
+
+def map_blocks(
+    func: Callable[..., T], args: Sequence[tuple[Any, ...]], n_jobs: None | int
+) -> list[T]:
+    """Apply `func` to each argument tuple, optionally in a process pool.
+
+    Results are returned in the order of `args`, independent of the order in which
+    the workers finish.
+
+    Args:
+        func (Callable): module level (picklable) function
+        args (Sequence[tuple]): argument tuples, one per block
+        n_jobs (int, optional): number of worker processes. None or 1 runs serially.
+
+    Returns:
+        list: results in the order of `args`
+    """
+    if n_jobs is None or n_jobs <= 1 or len(args) <= 1:
+        return [func(*a) for a in args]
+    # spawn instead of fork; forking a process with a running Julia runtime is not
+    # safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=min(n_jobs, len(args)), mp_context=context
+    ) as executor:
+        return list(executor.map(func, *zip(*args)))
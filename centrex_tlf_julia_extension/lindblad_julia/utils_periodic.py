@@ -0,0 +1,202 @@
+import numpy as np
+import numpy.typing as npt
+
+from .utils_julia import _julia_to_numpy, jl
+from .utils_solver import (
+    OBEEnsembleProblem,
+    OBEEnsembleProblemConfig,
+    OBEProblem,
+    OBEProblemConfig,
+    OBEResult,
+    OBEResultParameterScan,
+    _scan_trajectories,
+    _shape_scan_results,
+    setup_problem,
+    setup_problem_parameter_scan,
+)
+
+__all__ = [
+    "solve_periodic_propagator",
+    "do_simulation_periodic",
+    "solve_periodic_steady_state",
+    "solve_periodic_parameter_scan",
+]
+
+
+def _periodic_solve_kwargs(config: OBEProblemConfig) -> str:
+    # saveat, save_idxs and callbacks do not apply to a single period
+    return (
+        f"abstol = {config.abstol}, reltol = {config.reltol}, dt = {config.dt}, "
+        f"maxiters = {config.maxiters}"
+    )
+
+
+def _n_periods(tspan: list[float] | tuple[float, ...], period: float) -> int:
+    # whole periods in tspan, tolerant to rounding of tspan = n * period
+    return int(np.floor((tspan[1] - tspan[0]) / period + 1e-9))
+
+
+def _setup_propagator(
+    problem: OBEProblem, period: float, config: OBEProblemConfig
+) -> None:
+    """Define `{name}_propagator`, the one-period propagator of problem in Julia."""
+    odepars = problem.odepars
+    setup_problem(odepars, problem.tspan, problem.ρ, problem.name)
+    jl.seval(
+        f"""
+        {problem.name}_propagator = periodic_propagator(
+            {problem.name}, {config.method}, {problem.ρ.shape[0]},
+            {str(odepars._packed).lower()}, {float(period)}, true;
+            {_periodic_solve_kwargs(config)}
+        )
+        """
+    )
+
+
+def solve_periodic_propagator(
+    problem: OBEProblem,
+    period: float,
+    config: OBEProblemConfig = OBEProblemConfig(),
+) -> npt.NDArray[np.float64]:
+    """
+    One-period propagator of a periodically driven OBE problem, e.g. with
+    polarization switching or phase modulation.
+
+    The propagator is the real n²×n² matrix U advancing the packed state (see
+    `utils_packed`) by one period from the start of the time span,
+    pack(ρ(t0 + period)) = U pack(ρ(t0)). Its columns are the states after one
+    period from the packed basis states, solved in parallel over the Julia worker
+    processes. Any number of periods then costs matrix products instead of time
+    integration.
+
+    The period has to be a common period of all time-dependent parameters, e.g.
+    2π/ωp for polarization switching at ωp. The saveat, save_idxs, callback and
+    save_everystep settings of the config are not used.
+
+    Args:
+        problem (OBEProblem): problem, its initial state only sets the number of
+            states
+        period (float): period of the drive [s]
+        config (OBEProblemConfig, optional): solver configuration
+
+    Returns:
+        npt.NDArray[np.float64]: one-period propagator
+    """
+    _setup_propagator(problem, period, config)
+    return _julia_to_numpy(jl.seval(f"{problem.name}_propagator"))
+
+
+def do_simulation_periodic(
+    problem: OBEProblem,
+    period: float,
+    config: OBEProblemConfig = OBEProblemConfig(),
+    stride: int = 1,
+) -> OBEResult:
+    """
+    Solve a periodically driven OBE problem over its time span by repeated products
+    of the one-period propagator, see `solve_periodic_propagator`.
+
+    The output is stroboscopic: the populations at t0 + k * period for
+    k = 0, stride, 2 * stride, ... and at the last whole period in the time span.
+
+    Args:
+        problem (OBEProblem): problem
+        period (float): period of the drive [s]
+        config (OBEProblemConfig, optional): solver configuration
+        stride (int): number of periods between outputs
+
+    Returns:
+        OBEResult: stroboscopic times and populations, shape (n, n_times)
+    """
+    if stride < 1:
+        raise ValueError(f"stride must be >= 1, got {stride}")
+    n_periods = _n_periods(problem.tspan, period)
+    _setup_propagator(problem, period, config)
+    nstates = problem.ρ.shape[0]
+    x0 = (
+        f"{problem.name}.u0"
+        if problem.odepars._packed
+        else f"pack_hermitian({problem.name}.u0)"
+    )
+    states = _julia_to_numpy(
+        jl.seval(
+            f"periodic_stroboscopic({problem.name}_propagator, {x0}, {n_periods}, "
+            f"{stride})[1:{nstates}, :]"
+        )
+    )
+    periods = np.arange(0, n_periods + 1, stride, dtype=np.float64)
+    if periods[-1] != n_periods:
+        periods = np.append(periods, n_periods)
+    return OBEResult(problem.tspan[0] + periods * period, states)
+
+
+def solve_periodic_steady_state(
+    problem: OBEProblem,
+    period: float,
+    config: OBEProblemConfig = OBEProblemConfig(),
+) -> npt.NDArray[np.complex128]:
+    """
+    Periodic steady state of a periodically driven OBE problem, the density matrix
+    at the start of a period that the one-period propagator maps onto itself, see
+    `solve_periodic_propagator`.
+
+    The steady state has to be unique; systems with uncoupled or dark states keep
+    part of their initial population and raise an error.
+
+    Args:
+        problem (OBEProblem): problem, its initial state only sets the number of
+            states
+        period (float): period of the drive [s]
+        config (OBEProblemConfig, optional): solver configuration
+
+    Returns:
+        npt.NDArray[np.complex128]: periodic steady state density matrix
+    """
+    _setup_propagator(problem, period, config)
+    return _julia_to_numpy(
+        jl.seval(
+            f"periodic_steady_state({problem.name}_propagator, {problem.ρ.shape[0]})"
+        )
+    )
+
+
+def solve_periodic_parameter_scan(
+    scan: OBEEnsembleProblem,
+    period: float,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    steady_state: bool = False,
+) -> OBEResultParameterScan:
+    """
+    Final states of a parameter scan of a periodically driven OBE problem, from the
+    one-period propagator of each scan point, see `solve_periodic_propagator`.
+
+    The scan points are set up as for `setup_problem_parameter_scan`, including
+    initial condition scans, and solved in parallel over the Julia worker
+    processes. The output function of the scan is not used.
+
+    Args:
+        scan (OBEEnsembleProblem): parameter scan
+        period (float): period of the drive [s]
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        steady_state (bool): return the periodic steady states instead of the
+            states after the last whole period in the time span
+
+    Returns:
+        OBEResultParameterScan: density matrices, shape (scan..., n, n)
+    """
+    prob_func = setup_problem_parameter_scan(scan)
+    trajectories = _scan_trajectories(scan)
+    problem = scan.problem
+    results = _julia_to_numpy(
+        jl.seval(
+            f"""
+            periodic_ensemble(
+                {problem.name}, {prob_func.name}, {trajectories}, {config.method},
+                {problem.ρ.shape[0]}, {str(problem.odepars._packed).lower()},
+                {float(period)}, {_n_periods(problem.tspan, period)},
+                {str(steady_state).lower()}; {_periodic_solve_kwargs(config)}
+            )
+            """
+        )
+    )
+    return _shape_scan_results(scan, results)
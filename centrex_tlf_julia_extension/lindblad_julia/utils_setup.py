@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Any, List, Optional, Sequence, cast
 
 import numpy as np
@@ -10,19 +11,36 @@ from centrex_tlf.couplings import CouplingFields
 from centrex_tlf.lindblad import OBESystem, utils_decay
 from sympy import MutableDenseMatrix
 
-from .generate_julia_code import generate_preamble, system_of_equations_to_lines
+from .generate_julia_code import (
+    generate_jacobian_code,
+    generate_preamble,
+    system_of_equations_to_functions,
+    system_of_equations_to_lines,
+)
 from .ode_parameters import odeParameters
-from .utils_julia import generate_ode_fun_julia, initialize_julia, jl
+from .utils_code_cache import CodeCache, obe_system_hash
+from .utils_julia import (
+    _assemble_ode_fun,
+    initialize_julia,
+    jl,
+    measure_rhs_compile_time,
+)
 from .utils_julia_matrix import (
-    dissipator_functor,
     hamiltonian_functor,
     lindblad_function_and_parameters,
     substitute_odepars_hamiltonian,
+    superoperator_function_and_parameters,
 )
-from .utils_julia_matrix_assemble import (
-    generate_dissipator_code,
-    generate_hamiltonian_code,
+from .utils_julia_matrix_assemble import generate_hamiltonian_code
+from .utils_julia_sparse import (
+    decompose_hamiltonian,
+    generate_coefficients_code,
+    generate_jump_dissipator_code,
+    generate_sparse_hamiltonian_code,
+    sparse_hamiltonian_support,
+    superoperator_support,
 )
+from .utils_worker_pool import WorkerPool
 
 __all__ = ["OBESystemJulia", "generate_OBE_system_julia", "setup_OBE_system_julia"]
 
@@ -31,16 +49,38 @@ __all__ = ["OBESystemJulia", "generate_OBE_system_julia", "setup_OBE_system_juli
 class CodeExpanded:
     preamble: str
     code_lines: List[str]
+    # Lindblad_jac! and jac_prototype for the packed layout, if requested
+    jacobian: str | None = None
+    # @noinline block functions called by code_lines, if the RHS is chunked
+    blocks: List[str] | None = None
 
 
 @dataclass
 class CodeMatrix:
     hamiltonian: str
+    # defines the DissFun dissipator, applied at runtime from the collapse operators
     dissipator: str
     lindblad: str
     support: str
     hamiltonian_signature: smp.Function
-    dissipator_signature: smp.Function
+    dissipator_signature: smp.Function | None
+
+
+@dataclass
+class CodeSparse(CodeMatrix):
+    # hamiltonian only evaluates the coefficients f_k(t) of H = H0 + Σ_k f_k(t) V_k
+    # and updates a SparseMatrixCSC buffer, the sparse data lives in support
+    pass
+
+
+@dataclass
+class CodeSuperoperator:
+    # hamiltonian evaluates the coefficients f_k(t), the Liouville superoperators
+    # L0 and L_k are built in Julia by the support code
+    hamiltonian: str
+    lindblad: str
+    support: str
+    hamiltonian_signature: smp.Function
 
 
 @dataclass
@@ -55,7 +95,7 @@ class OBESystemJulia:
     dissipator: MutableDenseMatrix
     C_array: npt.NDArray[np.floating]
     system: MutableDenseMatrix | None
-    code: CodeExpanded | CodeMatrix
+    code: CodeExpanded | CodeMatrix | CodeSparse | CodeSuperoperator
     full_output: bool = False
     QN_original: Optional[Sequence[states.State]] = None
     decay_channels: Optional[Sequence[utils_decay.DecayChannel]] = None
@@ -91,95 +131,278 @@ class OBESystemJulia:
         return f"OBESystem(ground=[{ground_str}], excited=[{excited_str}])"
 
 
-def generate_OBE_system_julia(
+def _generate_code(
     obe_system: OBESystem,
     transition_selectors: Sequence[couplings.TransitionSelector],
     ode_parameters: odeParameters,
     method: str,
-) -> OBESystemJulia:
-    if obe_system.dissipator is None:
-        raise ValueError("obe_system.dissipator is None, cannot generate code.")
-
-    if method == "expanded":
-        preamble = generate_preamble(ode_parameters, transition_selectors)
-        code_lines = system_of_equations_to_lines(
-            obe_system.system, transition_selectors
+    n_jobs: None | int = None,
+    packed: bool = False,
+    jacobian: bool = False,
+    chunk_size: None | int = None,
+) -> CodeExpanded | CodeMatrix | CodeSparse | CodeSuperoperator:
+    if packed and method != "expanded":
+        raise ValueError(
+            f"The packed state layout is only supported for the expanded method, "
+            f"not '{method}'."
+        )
+    if jacobian and method in ("matrix", "sparse"):
+        raise ValueError(
+            f"An analytic Jacobian is not supported for the {method} method, use "
+            "the expanded method with packed=True or the superoperator method."
         )
+    if jacobian and method == "expanded" and not packed:
+        raise ValueError(
+            "An analytic Jacobian for the expanded method requires packed=True, the "
+            "complex layout reads the lower triangle as conj(ρ[j,i]) and is not "
+            "complex differentiable."
+        )
+    if method == "expanded":
         if obe_system.system is None:
             raise ValueError(
                 "obe_system.system is None, cannot generate expanded code."
             )
-        return OBESystemJulia(
-            QN=obe_system.QN,
-            ground=obe_system.ground,
-            excited=obe_system.excited,
-            couplings=obe_system.couplings,
-            H_symbolic=obe_system.H_symbolic,
-            dissipator=obe_system.dissipator,
-            H_int=obe_system.H_int,
-            V_ref_int=obe_system.V_ref_int,
-            C_array=obe_system.C_array,
-            system=obe_system.system,
-            code=CodeExpanded(preamble=preamble, code_lines=code_lines),
-            QN_original=obe_system.QN_original,
-            decay_channels=obe_system.decay_channels,
-            couplings_original=obe_system.couplings_original,
+        preamble = generate_preamble(ode_parameters, transition_selectors)
+        blocks = None
+        if chunk_size is None:
+            code_lines = system_of_equations_to_lines(
+                obe_system.system, transition_selectors, n_jobs=n_jobs, packed=packed
+            )
+        else:
+            blocks, code_lines = system_of_equations_to_functions(
+                obe_system.system,
+                transition_selectors,
+                chunk_size,
+                n_jobs=n_jobs,
+                packed=packed,
+            )
+        jacobian_code = None
+        if jacobian:
+            real_symbols = [
+                par
+                for par, par_type in zip(
+                    ode_parameters._parameters, ode_parameters._parameter_types
+                )
+                if par_type == "Float64"
+            ]
+            jacobian_code = generate_jacobian_code(
+                preamble, obe_system.system, n_jobs=n_jobs, real_symbols=real_symbols
+            )
+        return CodeExpanded(
+            preamble=preamble,
+            code_lines=code_lines,
+            jacobian=jacobian_code,
+            blocks=blocks,
         )
     elif method == "matrix":
         hamiltonian_subbed = substitute_odepars_hamiltonian(
             obe_system.H_symbolic, ode_parameters
         )
         hamiltonian_code, hamiltonian_signature = generate_hamiltonian_code(
-            hamiltonian_subbed
-        )
-        dissipator_code, dissipator_signature = generate_dissipator_code(
-            obe_system.dissipator
+            hamiltonian_subbed, n_jobs=n_jobs, chunk_size=chunk_size
         )
+        dissipator_code = generate_jump_dissipator_code(obe_system.C_array)
         lindblad = lindblad_function_and_parameters("liouvillian_commutator_her2k!")
 
         ham_functor_code = hamiltonian_functor(hamiltonian_signature, ode_parameters)
-        diss_functor_code = dissipator_functor()
+        nstates = obe_system.H_symbolic.shape[0]
+        other_code = f"nstates = {nstates}\n"
+        other_code += "buf = zeros(ComplexF64, nstates, nstates)\n"
 
-        # reorder ode parameters to match Hamiltonian signature
-        new_order = [
-            str(v) for v in hamiltonian_signature.args if str(v) not in ["du", "t"]
-        ]
-        ode_parameters.reorder(new_order)
-        ode_parameters._method = "matrix"
+        return CodeMatrix(
+            hamiltonian_code,
+            dissipator_code,
+            lindblad,
+            ham_functor_code + other_code,
+            hamiltonian_signature,
+            None,
+        )
+    elif method == "sparse":
+        H0, coefficients, terms = decompose_hamiltonian(obe_system.H_symbolic)
+        coefficients_subbed = substitute_odepars_hamiltonian(
+            smp.Matrix(coefficients), ode_parameters
+        )
+        hamiltonian_code, hamiltonian_signature = generate_sparse_hamiltonian_code(
+            coefficients_subbed
+        )
+        dissipator_code = generate_jump_dissipator_code(obe_system.C_array)
+        lindblad = lindblad_function_and_parameters("liouvillian_commutator_sparse!")
 
-        other_code = "DissFun = DissFunctor()\n"
+        ham_functor_code = hamiltonian_functor(
+            hamiltonian_signature, ode_parameters, call_name="sparse_hamiltonian!"
+        )
+        nstates = obe_system.H_symbolic.shape[0]
+        other_code = f"nstates = {nstates}\n"
+        other_code += sparse_hamiltonian_support(H0, terms)
+
+        return CodeSparse(
+            hamiltonian_code,
+            dissipator_code,
+            lindblad,
+            ham_functor_code + other_code,
+            hamiltonian_signature,
+            None,
+        )
+    elif method == "superoperator":
+        H0, coefficients, terms = decompose_hamiltonian(obe_system.H_symbolic)
+        coefficients_subbed = substitute_odepars_hamiltonian(
+            smp.Matrix(coefficients), ode_parameters
+        )
+        hamiltonian_code, hamiltonian_signature = generate_coefficients_code(
+            coefficients_subbed
+        )
+        lindblad = superoperator_function_and_parameters()
+        ham_functor_code = hamiltonian_functor(
+            hamiltonian_signature,
+            ode_parameters,
+            call_name="superoperator_coefficients!",
+        )
 
         nstates = obe_system.H_symbolic.shape[0]
-        other_code += f"nstates = {nstates}\n"
-        other_code += "buf = zeros(ComplexF64, nstates, nstates)\n"
+        other_code = f"nstates = {nstates}\n"
+        other_code += superoperator_support(
+            H0, terms, len(coefficients), obe_system.C_array
+        )
 
-        return OBESystemJulia(
-            QN=obe_system.QN,
-            ground=obe_system.ground,
-            excited=obe_system.excited,
-            couplings=obe_system.couplings,
-            H_symbolic=obe_system.H_symbolic,
-            dissipator=obe_system.dissipator,
-            H_int=obe_system.H_int,
-            V_ref_int=obe_system.V_ref_int,
-            C_array=obe_system.C_array,
-            system=obe_system.system,
-            code=CodeMatrix(
-                hamiltonian_code,
-                dissipator_code,
-                lindblad,
-                ham_functor_code + diss_functor_code + other_code,
-                hamiltonian_signature,
-                dissipator_signature,
-            ),
-            QN_original=obe_system.QN_original,
-            decay_channels=obe_system.decay_channels,
-            couplings_original=obe_system.couplings_original,
+        return CodeSuperoperator(
+            hamiltonian_code,
+            lindblad,
+            ham_functor_code + other_code,
+            hamiltonian_signature,
         )
     else:
         raise ValueError(f"Unknown method '{method}' for generating ODE system.")
 
 
+def generate_OBE_system_julia(
+    obe_system: OBESystem,
+    transition_selectors: Sequence[couplings.TransitionSelector],
+    ode_parameters: odeParameters,
+    method: str,
+    cache: bool | CodeCache = False,
+    n_jobs: None | int = None,
+    packed: bool = False,
+    jacobian: bool = False,
+    chunk_size: None | int = None,
+) -> OBESystemJulia:
+    """Generate the Julia code for an OBE system.
+
+    Args:
+        obe_system (OBESystem): symbolic OBE system
+        transition_selectors (Sequence[TransitionSelector]): transition selectors
+        ode_parameters (odeParameters): ODE parameters, reordered in-place to match
+                                        the generated code for the matrix and sparse
+                                        methods
+        method (str): code generation method, "expanded", "matrix", "sparse" or
+            "superoperator".
+            "sparse" decomposes the Hamiltonian into H0 + Σ_k f_k(t) V_k with sparse
+            V_k, only evaluates the coefficients f_k(t) per RHS call and uses a
+            sparse-dense commutator, so the cost scales with the number of
+            couplings instead of n³.
+            "superoperator" builds vec(dρ/dt) = (L0 + Σ_k f_k(t) L_k) vec(ρ) once in
+            Julia as sparse n²×n² matrices from the same decomposition and C_array.
+            The RHS is a few sparse mat-vecs and the analytic sparse Jacobian is
+            used by `setup_problem`.
+        cache (bool | CodeCache, optional): on-disk cache for the generated code.
+            True uses a `CodeCache` in the default cache directory. Defaults to
+            False.
+        n_jobs (int, optional): number of processes used for code generation. The
+            triangle of the density matrix is split into row blocks that are
+            simplified and printed in parallel. The generated code is deterministic
+            for a given n_jobs. Defaults to None (serial).
+        packed (bool, optional): use the packed Hermitian state layout, a real
+            vector of length n² holding the populations and the real and imaginary
+            parts of the upper triangle coherences (see `utils_packed`), instead of
+            the complex n×n density matrix. Halves the ODE state size and avoids
+            integrating the redundant lower triangle. Only supported for the
+            expanded method. Defaults to False.
+        jacobian (bool, optional): also generate an analytic sparse Jacobian
+            `Lindblad_jac!` and its sparsity pattern `jac_prototype` from the
+            symbolic system, used by `setup_problem` to build an `ODEFunction` so
+            implicit solvers (e.g. Rodas5, KenCarp4) avoid finite-difference
+            Jacobians. Requires packed=True for the expanded method; the
+            superoperator method always provides a Jacobian. Defaults to False.
+        chunk_size (int, optional): split the generated RHS (expanded) or
+            Hamiltonian (matrix) into `@noinline` block functions of at most
+            chunk_size density matrix elements each, called from a small driver.
+            Julia compile time grows superlinearly with function size, so this
+            cuts the first-solve latency on every worker for large systems; a few
+            hundred elements per block is a reasonable start. Defaults to None (a
+            single function).
+
+    Returns:
+        OBESystemJulia: OBE system with the generated Julia code
+    """
+    if obe_system.dissipator is None:
+        raise ValueError("obe_system.dissipator is None, cannot generate code.")
+
+    if cache is True:
+        cache = CodeCache()
+
+    code: CodeExpanded | CodeMatrix | CodeSparse | CodeSuperoperator | None = None
+    key = None
+    if isinstance(cache, CodeCache):
+        key = obe_system_hash(
+            obe_system,
+            transition_selectors,
+            ode_parameters,
+            method=method,
+            n_jobs=n_jobs,
+            packed=packed,
+            jacobian=jacobian,
+            chunk_size=chunk_size,
+        )
+        code = cache.get(key)
+        if code is not None and method == "expanded":
+            # generate_preamble validates the transition symbols, which is skipped
+            # when loading from the cache
+            ode_parameters.check_transition_symbols(transition_selectors)
+
+    if code is None:
+        code = _generate_code(
+            obe_system,
+            transition_selectors,
+            ode_parameters,
+            method=method,
+            n_jobs=n_jobs,
+            packed=packed,
+            jacobian=jacobian,
+            chunk_size=chunk_size,
+        )
+        if isinstance(cache, CodeCache):
+            assert key is not None
+            cache.put(key, code)
+
+    if isinstance(code, (CodeMatrix, CodeSuperoperator)):
+        # reorder ode parameters to match Hamiltonian signature
+        new_order = [
+            str(v) for v in code.hamiltonian_signature.args if str(v) not in ["du", "t"]
+        ]
+        ode_parameters.reorder(new_order)
+        ode_parameters._method = method
+    ode_parameters._packed = packed
+    ode_parameters._jacobian = method == "superoperator" or (
+        isinstance(code, CodeExpanded) and code.jacobian is not None
+    )
+
+    return OBESystemJulia(
+        QN=obe_system.QN,
+        ground=obe_system.ground,
+        excited=obe_system.excited,
+        couplings=obe_system.couplings,
+        H_symbolic=obe_system.H_symbolic,
+        dissipator=obe_system.dissipator,
+        H_int=obe_system.H_int,
+        V_ref_int=obe_system.V_ref_int,
+        C_array=obe_system.C_array,
+        system=obe_system.system,
+        code=code,
+        QN_original=obe_system.QN_original,
+        decay_channels=obe_system.decay_channels,
+        couplings_original=obe_system.couplings_original,
+    )
+
+
 def setup_OBE_system_julia(
     obe_system: OBESystem,
     transition_selectors: Sequence[couplings.TransitionSelector],
@@ -188,34 +411,75 @@ def setup_OBE_system_julia(
     method: str = "expanded",
     Γ: float = hamiltonian.Γ,
     verbose: bool = False,
+    cache: bool | CodeCache = False,
+    n_jobs: None | int = None,
+    packed: bool = False,
+    jacobian: bool = False,
+    chunk_size: None | int = None,
+    sysimage: None | str | Path = None,
+    pool: None | WorkerPool = None,
+    threads: int = 1,
 ) -> OBESystemJulia:
-    if n_procs is None:
+    if pool is not None:
+        if sysimage is not None or threads != 1:
+            raise ValueError(
+                "sysimage and threads are set on the WorkerPool when a pool is given"
+            )
+        n_procs = pool.nprocs
+    elif n_procs is None:
         core_count = psutil.cpu_count(logical=False)
         if core_count is None:
             raise RuntimeError("Could not determine number of CPU cores.")
-        n_procs = cast(int, core_count + 1)
+        # one worker per `threads` cores, plus the master
+        n_procs = cast(int, max(1, core_count // threads) + 1)
     if verbose:
         print(f"setup_OBE_system_julia: 1/3 -> Initializing Julia on {n_procs} cores")
-    initialize_julia(nprocs=n_procs, verbose=verbose)
+    if pool is None:
+        initialize_julia(
+            nprocs=n_procs, verbose=verbose, sysimage=sysimage, threads=threads
+        )
     if verbose:
         print("setup_OBE_system_julia: 2/3 -> generating OBESystemJulia")
     obe_system_julia = generate_OBE_system_julia(
-        obe_system, transition_selectors, ode_parameters, method=method
+        obe_system,
+        transition_selectors,
+        ode_parameters,
+        method=method,
+        cache=cache,
+        n_jobs=n_jobs,
+        packed=packed,
+        jacobian=jacobian,
+        chunk_size=chunk_size,
     )
     if verbose:
         print(
             "setup_OBE_system_julia: 3/3 -> Defining the ODE equation and"
             " parameters in Julia"
         )
-    if isinstance(obe_system_julia.code, CodeExpanded):
-        generate_ode_fun_julia(
-            obe_system_julia.code.preamble, obe_system_julia.code.code_lines
+    code = obe_system_julia.code
+    if isinstance(code, CodeExpanded):
+        definitions = [
+            *(code.blocks or []),
+            _assemble_ode_fun(code.preamble, code.code_lines),
+        ]
+        if code.jacobian is not None:
+            definitions.append(code.jacobian)
+    elif isinstance(code, CodeMatrix):
+        definitions = [code.hamiltonian, code.dissipator, code.lindblad, code.support]
+    elif isinstance(code, CodeSuperoperator):
+        definitions = [code.hamiltonian, code.lindblad, code.support]
+    definitions.append(f"Γ = {Γ}")
+    if pool is not None:
+        pool.deploy("\n".join(definitions), group="obe_system")
+    else:
+        jl.seval("@everywhere begin\n" + "\n".join(definitions) + "\nend")
+    ode_parameters.generate_p_julia()
+    if verbose:
+        first, second = measure_rhs_compile_time(
+            len(obe_system_julia.QN), packed=packed
         )
-    elif isinstance(obe_system_julia.code, CodeMatrix):
-        jl.seval(
-            f"@everywhere begin\n{obe_system_julia.code.hamiltonian}\n{obe_system_julia.code.dissipator}\n{obe_system_julia.code.lindblad}\n{obe_system_julia.code.support}\nend"
+        print(
+            "setup_OBE_system_julia: Lindblad_rhs! compiled in "
+            f"{first - second:.2f} s (first call {first:.2f} s, then {second:.2e} s)"
         )
-        # raise NotImplementedError("Matrix method not yet implemented in setup.")
-    jl.seval(f"@everywhere Γ = {Γ}")
-    ode_parameters.generate_p_julia()
     return obe_system_julia
@@ -1,4 +1,4 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from numbers import Number
 from typing import Sequence
 
@@ -7,7 +7,8 @@ import numpy.typing as npt
 from sympy.parsing import sympy_parser
 
 from .ode_parameters import julia_literal, odeParameters
-from .utils_julia import jl
+from .utils_julia import _julia_to_numpy, jl
+from .utils_packed import pack_density_matrix
 
 numeric = int | float | complex
 
@@ -94,6 +95,10 @@ class OBEProblemConfig:
 
 @dataclass
 class OBEEnsembleProblemConfig(OBEProblemConfig):
+    # EnsembleDistributed() hands trajectories to the processes one at a time,
+    # EnsembleSplitThreads() splits them over the processes and runs them
+    # multithreaded on each (workers started with initialize_julia(threads=...)),
+    # EnsembleThreads() runs multithreaded on the master only
     distributed_method: str = "EnsembleDistributed()"
     trajectories: None | int = None
 
@@ -110,6 +115,9 @@ class OBEResultParameterScan:
     scan_values: Sequence[npt.NDArray[np.generic]]
     results: npt.NDArray[np.complex128]
     zipped: bool
+    # save times of time-resolved results, results then have shape
+    # (scan..., n_times, n_saved)
+    t: None | npt.NDArray[np.float64] = None
 
 
 def remove_leading_spaces_to_align(multiline_string: str) -> str:
@@ -179,10 +187,20 @@ def _julia_saveat_arg(saveat: object) -> str | None:
 
 
 def get_diagonal_indices_flattened(
-    size: int, states: None | Sequence[int] = None, mode: str = "python"
+    size: int,
+    states: None | Sequence[int] = None,
+    mode: str = "python",
+    packed: bool = False,
 ) -> list[int]:
+    """
+    Indices of the populations of the given states (all states if None) in the
+    flattened state, e.g. for save_idxs. With packed=True the indices are for the
+    packed state layout, which holds the populations first (see `utils_packed`).
+    """
     if states is None:
-        indices = [i + size * i for i in range(size)]
+        states = range(size)
+    if packed:
+        indices = list(states)
     else:
         indices = [i + size * i for i in states]
     if mode == "julia":
@@ -196,13 +214,28 @@ def get_diagonal_indices_flattened(
 def setup_initial_condition_scan(
     values: Sequence[Number] | npt.NDArray[np.generic],
     name: str = "prob_func",
+    ode_parameters: None | odeParameters = None,
 ) -> ProblemFunction:
-    jl.params = values
+    """
+    Scan over initial conditions. Pass ode_parameters to construct a new `p` for
+    each trajectory, which is required for EnsembleThreads() with the matrix,
+    sparse and superoperator methods since their `p` holds a buffer, and for the
+    packed state layout, for which the initial density matrices are packed like in
+    `setup_problem`.
+    """
+    if ode_parameters is not None and ode_parameters._packed:
+        jl.params = [pack_density_matrix(np.asarray(ρ)) for ρ in values]
+    else:
+        jl.params = values
     jl.params = jl.seval("collect(params)")
     jl.seval("@everywhere params = $params")
+    remake_p = ""
+    if ode_parameters is not None and ode_parameters._method != "expanded":
+        p_values = ode_parameters._julia_p_values()
+        remake_p = f", p = {ode_parameters._julia_p_constructor(p_values)}"
     function_str = f"""
     @everywhere function {name}(prob,i,repeat)
-        remake(prob,u0=params[i])
+        remake(prob,u0=params[i]{remake_p})
     end"""
     jl.seval(function_str)
     function_str = remove_leading_spaces_to_align(function_str)
@@ -250,23 +283,11 @@ def setup_parameter_scan_zipped(
     jl.seval("@everywhere params = $params")
 
     # Generate prob_func
-    if ode_parameters._method == "expanded":
-        function_str = f"""
-        @everywhere function {name}(prob, i, repeat)
-            remake(prob, p = {_pars})
-        end
-        """
-    elif ode_parameters._method == "matrix":
-        function_str = f"""
-        @everywhere function {name}(prob, i, repeat)
-            p_values = {_pars}
-            HamFun = HamFunctor(p_values...)
-            p_new = LindbladParameters(HamFun, DissFun, buf)
-            remake(prob, p = p_new)
-        end
-        """
-    else:
-        raise ValueError(f"method {ode_parameters._method} not supported")
+    function_str = f"""
+    @everywhere function {name}(prob, i, repeat)
+        remake(prob, p = {ode_parameters._julia_p_constructor(_pars)})
+    end
+    """
 
     jl.seval(function_str)
     function_str = remove_leading_spaces_to_align(function_str)
@@ -345,27 +366,14 @@ def setup_parameter_scan_ND(
         Lk = lens[k - 1]
         idx_lines.append(f"idx_{k} = (idx0 % {Lk}) + 1")
         idx_lines.append(f"idx0 = idx0 ÷ {Lk}")
-    idx_block = "\n            ".join(idx_lines)
+    idx_block = "\n        ".join(idx_lines)
 
-    if odePar._method == "expanded":
-        function_str = f"""
-        @everywhere function {name}(prob, i, repeat)
-            {idx_block}
-            remake(prob, p = {_pars})
-        end
-        """
-    elif odePar._method == "matrix":
-        function_str = f"""
-        @everywhere function {name}(prob, i, repeat)
-            {idx_block}
-            p_values = {_pars}
-            HamFun = HamFunctor(p_values...)
-            p_new = LindbladParameters(HamFun, DissFun, buf)
-            remake(prob, p = p_new)
-        end
-        """
-    else:
-        raise ValueError(f"method {odePar._method} not supported")
+    function_str = f"""
+    @everywhere function {name}(prob, i, repeat)
+        {idx_block}
+        remake(prob, p = {odePar._julia_p_constructor(_pars)})
+    end
+    """
 
     jl.seval(function_str)
     function_str = remove_leading_spaces_to_align(function_str)
@@ -408,14 +416,14 @@ def setup_ratio_calculation(
     if isinstance(states[0], (list, np.ndarray, tuple)):
         for state in states:
             cmd += (
-                f"sum(real(diag(sol.u[end])[{state}]))/"
-                f"sum(real(diag(sol.u[1])[{state}])), "
+                f"sum(populations(sol.u[end])[{state}])/"
+                f"sum(populations(sol.u[1])[{state}]), "
             )
         cmd = cmd.strip(", ")
         cmd = "[" + cmd + "]"
     else:
         cmd = (
-            f"sum(real(diag(sol.u[end])[{states}]))/sum(real(diag(sol.u[1])[{states}]))"
+            f"sum(populations(sol.u[end])[{states}])/sum(populations(sol.u[1])[{states}])"
         )
 
     function_str = f"""
@@ -501,7 +509,7 @@ def setup_state_integral_calculation(
     if nphotons & jl.seval("@isdefined Γ"):
         function_str = f"""
         @everywhere function {output_func}(sol,i)
-            return Γ.*trapz(sol.t, [real(sum(diag(sol.u[j])[{states}])) for j in 1:size(sol)[3]]), false
+            return Γ.*trapz(sol.t, [sum(populations(sol.u[j])[{states}]) for j in eachindex(sol.u)]), false
         end"""
         jl.seval(function_str)
     else:
@@ -512,13 +520,13 @@ def setup_state_integral_calculation(
             jl.seval(f"@everywhere Γ = {Γ}")
             function_str = f"""
             @everywhere function {output_func}(sol,i)
-                return {Γ}.*trapz(sol.t, [real(sum(diag(sol.u[j])[{states}])) for j in 1:size(sol)[3]]), false
+                return {Γ}.*trapz(sol.t, [sum(populations(sol.u[j])[{states}]) for j in eachindex(sol.u)]), false
             end"""
             jl.seval(function_str)
         else:
             function_str = f"""
             @everywhere function {output_func}(sol,i)
-                return trapz(sol.t, [real(sum(diag(sol.u[j])[{states}])) for j in 1:size(sol)[3]]), false
+                return trapz(sol.t, [sum(populations(sol.u[j])[{states}]) for j in eachindex(sol.u)]), false
             end"""
             jl.seval(function_str)
 
@@ -538,7 +546,7 @@ def setup_state_integral_callback(
     @everywhere function nphotons_integrator(u, t, integrator)
         s = 0.0
         @inbounds for j in {states_tuple}
-            s += real(u[j, j])
+            s += population(u, j)
         end
         return s
     end
@@ -623,18 +631,35 @@ def setup_problem(
 ) -> None:
     odepars.generate_p_julia()
 
-    jl.ρ = ρ
+    jl.ρ = pack_density_matrix(ρ) if odepars._packed else ρ
     jl.seval("ρ = collect(ρ)")
 
     jl.tspan = tspan
     assert jl.seval("@isdefined Lindblad_rhs!"), (
         "Lindblad function is not defined in Julia"
     )
-    jl.seval(
-        f"""
-        {problem_name} = ODEProblem(Lindblad_rhs!,ρ,tspan,p)
-    """
-    )
+    if odepars._jacobian:
+        # analytic sparse Jacobian, makes implicit solvers viable
+        jl.seval(
+            f"""
+            {problem_name} = ODEProblem(
+                ODEFunction(
+                    Lindblad_rhs!;
+                    jac = Lindblad_jac!,
+                    jac_prototype = copy(jac_prototype)
+                ),
+                ρ,
+                tspan,
+                p
+            )
+        """
+        )
+    else:
+        jl.seval(
+            f"""
+            {problem_name} = ODEProblem(Lindblad_rhs!,ρ,tspan,p)
+        """
+        )
 
 
 def setup_problem_parameter_scan(scan: OBEEnsembleProblem) -> ProblemFunction:
@@ -714,10 +739,7 @@ def _generate_problem_parameter_scan_solve_string(
     problem: OBEEnsembleProblem, config: OBEEnsembleProblemConfig
 ) -> str:
     if config.trajectories is None:
-        if problem.zipped:
-            trajectories = str(len(problem.scan_values[0]))
-        else:
-            trajectories = str(int(np.prod([len(v) for v in problem.scan_values])))
+        trajectories = str(_scan_trajectories(problem))
     else:
         trajectories = str(config.trajectories)
 
@@ -727,6 +749,9 @@ def _generate_problem_parameter_scan_solve_string(
 
     saveat_expr = _julia_saveat_arg(config.saveat)
     saveat_line = "" if saveat_expr is None else f"        saveat = {saveat_expr},\n"
+    # with saveat only the saveat times are saved, so all trajectories share their
+    # save times, see get_results_parameter_scan
+    save_everystep = config.save_everystep and saveat_expr is None
 
     solve_string = f"""
     sol = solve(
@@ -738,7 +763,7 @@ def _generate_problem_parameter_scan_solve_string(
         dt = {config.dt},
         trajectories = {trajectories},
         callback = {callback},
-        save_everystep = {str(config.save_everystep).lower()},
+        save_everystep = {str(save_everystep).lower()},
 {saveat_line}
         save_idxs = {save_idxs},
         dense = {str(config.dense).lower()},
@@ -756,21 +781,32 @@ def solve_problem_parameter_scan(
     jl.seval(f"{solve_string};")
 
 
-def get_results_single() -> OBEResult:
+def get_results_single(config: None | OBEProblemConfig = None) -> OBEResult:
     """Retrieve the results of a single trajectory OBE simulation solution.
 
+    Args:
+        config (OBEProblemConfig, optional): configuration of the solve. With
+            save_idxs set, the saved elements are returned instead of the
+            populations.
+
     Returns:
         tuple: OBEResult dataclass with the solution of the OBE for a single trajectory
     """
-    # Extract populations (real diagonal) in Julia and transfer once.
-    results = np.array(jl.seval("reduce(hcat, [real(diag(u)) for u in sol.u])"))
-    t = np.array(jl.seval("sol.t"))
+    if config is not None and config.save_idxs is not None:
+        results = _julia_to_numpy(jl.seval("reduce(hcat, sol.u)"))
+    else:
+        # Extract populations (real diagonal or leading packed elements) in Julia
+        # and transfer once.
+        results = _julia_to_numpy(
+            jl.seval("reduce(hcat, [populations(u) for u in sol.u])")
+        )
+    t = _julia_to_numpy(jl.seval("sol.t"))
     return OBEResult(t, results)
 
 
 def _get_ensemble_final_states_vecs() -> np.ndarray:
     """Return a 2D array of vectorized final states: shape (state_len, trajectories)."""
-    return np.array(
+    return _julia_to_numpy(
         jl.seval(
             "reduce(hcat, [vec(sol.u[i][end]) for i in eachindex(sol.u)])"
         )
@@ -781,17 +817,20 @@ def _get_ensemble_final_states_mats() -> np.ndarray:
     """Return a 3D array of final density matrices: shape (trajectories, n, n).
 
     This matches the previous behavior of stacking `sol.u[i][end]` matrices in Python,
-    but does it in Julia in one call (and avoids vec/reshape layout pitfalls).
+    but does it in Julia in one call (and avoids vec/reshape layout pitfalls). Packed
+    state vectors are unpacked into density matrices. The array is a view of the
+    Julia array, without copying.
     """
-    return np.array(
+    return _julia_to_numpy(
         jl.seval(
             """
             let ntraj = length(sol.u)
-                A0 = sol.u[1][end]
+                as_matrix(u) = u isa AbstractVector ? unpack_hermitian(u) : u
+                A0 = as_matrix(sol.u[1][end])
                 n1, n2 = size(A0)
                 A = Array{eltype(A0)}(undef, ntraj, n1, n2)
                 @inbounds for i in 1:ntraj
-                    A[i, :, :] = sol.u[i][end]
+                    A[i, :, :] = as_matrix(sol.u[i][end])
                 end
                 A
             end
@@ -800,6 +839,42 @@ def _get_ensemble_final_states_mats() -> np.ndarray:
     )
 
 
+def _get_ensemble_time_resolved(save_idxs: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Return the save times and the saved values of all trajectories, with shape
+    (trajectories, n_times, n_saved).
+
+    The values are the elements of the state selected by save_idxs if `save_idxs`,
+    otherwise the populations. The array is preallocated and filled in Julia and
+    transferred once. Trajectories terminated early by a callback are padded with
+    NaN.
+    """
+    t, values = jl.seval(
+        f"""
+        let ntraj = length(sol.u)
+            longest = argmax(i -> length(sol.u[i].t), 1:ntraj)
+            t = sol.u[longest].t
+            nt = length(t)
+            for i in 1:ntraj
+                ti = sol.u[i].t
+                ti == view(t, 1:length(ti)) || error(
+                    "trajectories are saved at different times, set saveat"
+                )
+            end
+            # populations, unless save_idxs already selected the saved elements
+            saved(u) = {str(save_idxs).lower()} ? u : populations(u)
+            v0 = saved(sol.u[1].u[1])
+            T = eltype(v0) <: Complex ? ComplexF64 : Float64
+            A = fill(T(NaN), ntraj, nt, length(v0))
+            @inbounds for i in 1:ntraj, k in eachindex(sol.u[i].u)
+                A[i, k, :] = saved(sol.u[i].u[k])
+            end
+            (collect(t), A)
+        end
+        """
+    )
+    return _julia_to_numpy(t), _julia_to_numpy(values)
+
+
 def transpose_first_n(a: np.ndarray, n: int) -> np.ndarray:
     if not (0 <= n <= a.ndim):
         raise ValueError(f"n must be in [0, {a.ndim}], got {n}")
@@ -807,6 +882,42 @@ def transpose_first_n(a: np.ndarray, n: int) -> np.ndarray:
     return np.transpose(a, axes)
 
 
+def _scan_trajectories(scan: OBEEnsembleProblem) -> int:
+    """Number of trajectories of a parameter scan, one per scan point."""
+    if scan.zipped or len(scan.scan_values) == 1:
+        return len(scan.scan_values[0])
+    return int(np.prod([len(v) for v in scan.scan_values]))
+
+
+def _shape_scan_results(
+    scan: OBEEnsembleProblem,
+    results: np.ndarray,
+    t: None | npt.NDArray[np.float64] = None,
+) -> OBEResultParameterScan:
+    """Shape results with one row per trajectory into the result of a parameter
+    scan, with shape (scan..., ...) for ND scans, the first parameter varying
+    fastest over the trajectories."""
+    if scan.zipped:
+        return OBEResultParameterScan(
+            parameters=scan.parameters,
+            scan_values=scan.scan_values,
+            results=results,
+            zipped=True,
+            t=t,
+        )
+    if len(scan.scan_values) > 1:
+        scan_shape = [len(v) for v in scan.scan_values]
+        results = results.reshape(scan_shape[::-1] + list(results.shape[1:]))
+        results = transpose_first_n(results, n=len(scan.scan_values))
+    return OBEResultParameterScan(
+        parameters=scan.parameters,
+        scan_values=list(np.meshgrid(*scan.scan_values, indexing="ij")),
+        results=results,
+        zipped=False,
+        t=t,
+    )
+
+
 def get_results_parameter_scan(
     scan: OBEEnsembleProblem, config: OBEEnsembleProblemConfig
 ) -> OBEResultParameterScan:
@@ -819,70 +930,62 @@ def get_results_parameter_scan(
 
     Returns:
         OBEResultParameterScan: Dataclass containing the results of the parameter scan.
+            With saveat set, the results are time-resolved, with shape
+            (scan..., n_times, n_saved) and the save times in `t`. The saved values
+            are the elements selected by save_idxs, or the populations if save_idxs
+            is not set.
     """
-    trajectories = config.trajectories
-    if trajectories is None:
-        if scan.zipped or len(scan.scan_values) == 1:
-            trajectories = len(scan.scan_values[0])
-        else:
-            trajectories = int(np.prod([len(v) for v in scan.scan_values]))
-    else:
-        trajectories = trajectories
-
     # check if returning 2D density matrices
     return_2D = config.save_idxs is None
 
-    scan_shape = [len(v) for v in scan.scan_values]
-
     # check if saving multiple timesteps
     saveat_defined = isinstance(config.saveat, (float, int)) or len(config.saveat) > 0
-    if scan.zipped:
-        if scan.output_func is None:
-            if config.save_everystep or saveat_defined or config.save_everystep:
-                raise NotImplementedError(
-                    "Extracting time-dependent results from parameter scans is not yet implemented."
-                )
-            if return_2D:
-                results = _get_ensemble_final_states_mats()
-            else:
-                vecs = _get_ensemble_final_states_vecs()
-                results = vecs.T
+    time_resolved = scan.output_func is None and (
+        saveat_defined or config.save_everystep
+    )
+    t = None
+    if time_resolved:
+        if not saveat_defined:
+            raise ValueError(
+                "Time-resolved results from parameter scans require saveat, so all "
+                "trajectories are saved at the same times; set save_everystep=False "
+                "for the final states only."
+            )
+        t, results = _get_ensemble_time_resolved(not return_2D)
+    elif scan.output_func is None:
+        if return_2D:
+            results = _get_ensemble_final_states_mats()
         else:
-            results = np.array(jl.seval("sol.u"))
-        return OBEResultParameterScan(
-            parameters=scan.parameters,
-            scan_values=scan.scan_values,
-            results=results,
-            zipped=True,
-        )
+            # For save_idxs results, keep (trajectories, n_saved)
+            vecs = _get_ensemble_final_states_vecs()
+            results = vecs.T
     else:
-        if scan.output_func is None:
-            if config.save_everystep or saveat_defined or config.save_everystep:
-                raise NotImplementedError(
-                    "Extracting time-dependent results from parameter scans is not yet implemented."
-                )
-            if return_2D:
-                results = _get_ensemble_final_states_mats()
-            else:
-                # For save_idxs results, keep (trajectories, n_saved)
-                vecs = _get_ensemble_final_states_vecs()
-                results = vecs.T
-        else:
-            results = np.array(jl.seval("sol.u"))
+        results = _julia_to_numpy(jl.seval("sol.u"))
 
-        if results.ndim == 1:
-            if len(scan.scan_values) > 1:
-                results = results.reshape([len(v) for v in scan.scan_values][::-1]).T
-        elif len(scan.scan_values) > 1:
-            results = results.reshape(scan_shape[::-1] + list(results.shape[1:]))
-            results = transpose_first_n(results, n=len(scan.scan_values))
+    return _shape_scan_results(scan, results, t)
 
-        return OBEResultParameterScan(
-            parameters=scan.parameters,
-            scan_values=list(np.meshgrid(*scan.scan_values, indexing="ij")),
-            results=results,
-            zipped=False,
-        )
+
+def _solve_scan_points(
+    problem: OBEProblem,
+    parameters: list[str],
+    scan_values: Sequence[npt.NDArray[np.floating]],
+    output_func: OutputFunction,
+    config: OBEEnsembleProblemConfig,
+    zipped: bool,
+) -> np.ndarray:
+    """Set up, solve and retrieve the results of a parameter scan of problem, with
+    one trajectory per scan point."""
+    scan = OBEEnsembleProblem(
+        problem=problem,
+        parameters=parameters,
+        scan_values=list(scan_values),
+        output_func=output_func,
+        zipped=zipped,
+    )
+    setup_problem_parameter_scan(scan)
+    config = replace(config, trajectories=None)
+    solve_problem_parameter_scan(scan, config)
+    return np.asarray(get_results_parameter_scan(scan, config).results)
 
 
 def do_simulation_single(
@@ -903,4 +1006,4 @@ def do_simulation_single(
     """
     setup_problem(problem.odepars, problem.tspan, problem.ρ, problem.name)
     solve_problem(problem, config)
-    return get_results_single()
+    return get_results_single(config)
@@ -1,7 +1,26 @@
-from .utils_julia import jl
-from .utils_solver import OBEEnsembleProblem, OBEEnsembleProblemConfig, _julia_saveat_arg
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Iterator
 
-__all__ = ["solve_problem_parameter_scan_progress"]
+import numpy as np
+import numpy.typing as npt
+
+from .utils_julia import _julia_to_numpy, jl
+from .utils_solver import (
+    OBEEnsembleProblem,
+    OBEEnsembleProblemConfig,
+    ProblemFunction,
+    _generate_problem_parameter_scan_solve_string,
+    _julia_saveat_arg,
+    _scan_trajectories,
+)
+
+__all__ = [
+    "solve_problem_parameter_scan_progress",
+    "ProgressUpdate",
+    "iter_problem_parameter_scan_progress",
+    "solve_problem_parameter_scan_callback",
+]
 
 
 def solve_problem_parameter_scan_progress(
@@ -37,6 +56,8 @@ def solve_problem_parameter_scan_progress(
     # Ensure saveat is Julia-native for distributed workers; omit if unset.
     _saveat = _julia_saveat_arg(saveat)
     _saveat_kw = "" if _saveat is None else f"saveat = {_saveat},"
+    # with saveat only the saveat times are saved, as in the plain ensemble solve
+    save_everystep = save_everystep and _saveat is None
 
     _save_idxs = "nothing" if save_idxs is None else str(save_idxs)
 
@@ -72,7 +93,7 @@ def solve_problem_parameter_scan_progress(
     jl.seval(
         """
         if !@isdefined channel
-            const channel = RemoteChannel(()->Channel{Int}(1))
+            const channel = RemoteChannel(()->Channel{Int}(Inf))
             @everywhere const channel = $channel
         end
     """
@@ -101,3 +122,247 @@ def solve_problem_parameter_scan_progress(
     end
     """
     )
+
+
+@dataclass
+class ProgressUpdate:
+    """
+    Progress of an ensemble solve.
+
+    Args:
+        completed (int): number of completed trajectories
+        total (int): total number of trajectories
+        elapsed (float): wall time since the start of the solve [s]
+        trajectory_times (npt.NDArray[np.float64]): wall times of the trajectories
+            completed since the previous update [s]
+        eta (float | None): estimated remaining wall time [s], None before the
+            first trajectory completed
+    """
+
+    completed: int
+    total: int
+    elapsed: float
+    trajectory_times: npt.NDArray[np.float64]
+    eta: None | float
+
+    @property
+    def done(self) -> bool:
+        return self.completed >= self.total
+
+
+# Julia side of the progress stream: the output function of every trajectory adds
+# (index, wall time) to a buffer of its process, which is sent to the master as
+# one vector per batch_size trajectories or interval seconds. The send runs as a
+# task, so a worker does not wait while the master is busy in Python; the tasks
+# are waited for at the end of the solve. The channel of
+# `solve_problem_parameter_scan_progress` only carries completion counts, so the
+# stream has its own channel.
+_progress_stream_setup = """
+if !@isdefined(progress_batches)
+    const progress_batches =
+        RemoteChannel(() -> Channel{Vector{Tuple{Int,Float64}}}(Inf))
+    @everywhere const progress_batches = $progress_batches
+end
+@everywhere begin
+    if !@isdefined(progress_batch_lock)
+        const progress_batch_lock = ReentrantLock()
+        const progress_batch_starts = Dict{Int,Float64}()
+        const progress_batch_pending = Tuple{Int,Float64}[]
+        const progress_batch_sent = Ref(0.0)
+        const progress_batch_puts = Task[]
+    end
+
+    function progress_batch_start!(i)
+        lock(progress_batch_lock) do
+            progress_batch_starts[i] = time()
+        end
+        return nothing
+    end
+
+    # send the pending (index, wall time) pairs, with the lock held
+    function _progress_batch_send!()
+        batch = copy(progress_batch_pending)
+        empty!(progress_batch_pending)
+        progress_batch_sent[] = time()
+        push!(progress_batch_puts, @async put!(progress_batches, batch))
+        return nothing
+    end
+
+    function progress_batch_done!(i, batch_size::Int, interval::Float64)
+        lock(progress_batch_lock) do
+            t0 = pop!(progress_batch_starts, i, NaN)
+            push!(progress_batch_pending, (i, time() - t0))
+            if length(progress_batch_pending) >= batch_size ||
+               time() - progress_batch_sent[] >= interval
+                _progress_batch_send!()
+            end
+        end
+        return nothing
+    end
+
+    function progress_batch_flush()
+        puts = lock(progress_batch_lock) do
+            isempty(progress_batch_pending) || _progress_batch_send!()
+            tasks = copy(progress_batch_puts)
+            empty!(progress_batch_puts)
+            tasks
+        end
+        foreach(wait, puts)
+        return nothing
+    end
+end
+
+function progress_batches_poll(task::Task, timeout::Float64)
+    deadline = time() + timeout
+    times = Float64[]
+    while true
+        while isready(progress_batches)
+            append!(times, last.(take!(progress_batches)))
+        end
+        (istaskdone(task) || time() >= deadline) && break
+        sleep(0.02)
+    end
+    while isready(progress_batches)
+        append!(times, last.(take!(progress_batches)))
+    end
+    return times, istaskdone(task)
+end
+"""
+
+
+def _trajectories(problem: OBEEnsembleProblem, config: OBEEnsembleProblemConfig) -> int:
+    if config.trajectories is not None:
+        return config.trajectories
+    return _scan_trajectories(problem)
+
+
+def iter_problem_parameter_scan_progress(
+    problem: OBEEnsembleProblem,
+    prob_func: ProblemFunction,
+    config: OBEEnsembleProblemConfig,
+    interval: float = 0.5,
+    batch_size: int = 64,
+) -> Iterator[ProgressUpdate]:
+    """
+    Solve a parameter scan set up with `setup_problem_parameter_scan`, yielding the
+    progress every interval seconds.
+
+    Each Julia process sends the wall times of its completed trajectories in
+    batches of batch_size trajectories, or after interval seconds if fewer
+    completed, so the progress lags the solve by up to that much.
+
+    The solve runs as a task on the master Julia process; iterating drives it, so
+    the iterator has to be consumed to completion, after which the solution is in
+    `sol` as for `solve_problem_parameter_scan`. Errors of the solve are raised
+    when the solve finishes.
+
+    Example:
+        >>> prob_func = setup_problem_parameter_scan(scan)
+        >>> with tqdm(total=n) as pbar:
+        ...     for update in iter_problem_parameter_scan_progress(
+        ...         scan, prob_func, config
+        ...     ):
+        ...         pbar.update(len(update.trajectory_times))
+
+    Args:
+        problem (OBEEnsembleProblem): parameter scan
+        prob_func (ProblemFunction): problem function of the scan, returned by
+            `setup_problem_parameter_scan`
+        config (OBEEnsembleProblemConfig): solver configuration
+        interval (float): seconds between updates
+        batch_size (int): maximum number of trajectories per batch sent by a
+            process
+
+    Yields:
+        ProgressUpdate: progress since the previous update
+    """
+    jl.seval(_progress_stream_setup)
+
+    if problem.output_func is None:
+        output = "sol, false"
+    else:
+        output = f"{problem.output_func.name}(sol, i)"
+    jl.seval(
+        f"""
+        @everywhere function prob_func_progress_stream(prob, i, repeat)
+            progress_batch_start!(i)
+            {prob_func.name}(prob, i, repeat)
+        end
+        @everywhere function output_func_progress_stream(sol, i)
+            progress_batch_done!(i, {int(batch_size)}, {float(interval)})
+            return {output}
+        end
+        {problem.name}_progress_stream = EnsembleProblem({problem.problem.name},
+            prob_func = prob_func_progress_stream,
+            output_func = output_func_progress_stream
+        )
+        """
+    )
+
+    total = _trajectories(problem, config)
+    solve_string = _generate_problem_parameter_scan_solve_string(
+        replace(problem, name=f"{problem.name}_progress_stream"), config
+    )
+    start = time.perf_counter()
+    jl.seval(
+        f"""
+        progress_stream_task = @async begin
+            global {solve_string.strip()}
+            # send the batches still pending on each process
+            for w in procs()
+                remotecall_wait(progress_batch_flush, w)
+            end
+        end
+        """
+    )
+
+    completed = 0
+    done = False
+    while not done:
+        times, done = jl.seval(
+            f"progress_batches_poll(progress_stream_task, {float(interval)})"
+        )
+        done = bool(done)
+        trajectory_times = _julia_to_numpy(times)
+        completed += len(trajectory_times)
+        elapsed = time.perf_counter() - start
+        eta = None if completed == 0 else elapsed / completed * (total - completed)
+        if done:
+            # rethrows errors of the solve
+            jl.seval("fetch(progress_stream_task)")
+        yield ProgressUpdate(
+            completed=completed,
+            total=total,
+            elapsed=elapsed,
+            trajectory_times=trajectory_times,
+            eta=eta,
+        )
+
+
+def solve_problem_parameter_scan_callback(
+    problem: OBEEnsembleProblem,
+    prob_func: ProblemFunction,
+    config: OBEEnsembleProblemConfig,
+    callback: Callable[[ProgressUpdate], None],
+    interval: float = 0.5,
+    batch_size: int = 64,
+) -> None:
+    """
+    Solve a parameter scan set up with `setup_problem_parameter_scan`, calling
+    callback with the progress every interval seconds, see
+    `iter_problem_parameter_scan_progress`.
+
+    Args:
+        problem (OBEEnsembleProblem): parameter scan
+        prob_func (ProblemFunction): problem function of the scan, returned by
+            `setup_problem_parameter_scan`
+        config (OBEEnsembleProblemConfig): solver configuration
+        callback (Callable[[ProgressUpdate], None]): called with each update
+        interval (float): seconds between updates
+        batch_size (int): maximum number of trajectories per batch sent by a
+            process
+    """
+    for update in iter_problem_parameter_scan_progress(
+        problem, prob_func, config, interval, batch_size
+    ):
+        callback(update)
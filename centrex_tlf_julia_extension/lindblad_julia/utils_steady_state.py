@@ -0,0 +1,85 @@
+import numpy as np
+import numpy.typing as npt
+
+from .utils_julia import _julia_to_numpy, jl
+from .utils_solver import (
+    OBEEnsembleProblem,
+    OBEProblem,
+    OBEResultParameterScan,
+    _scan_trajectories,
+    _shape_scan_results,
+    setup_problem,
+    setup_problem_parameter_scan,
+)
+
+__all__ = [
+    "solve_steady_state",
+    "solve_steady_state_parameter_scan",
+]
+
+
+def solve_steady_state(
+    problem: OBEProblem, t: float = 0.0
+) -> npt.NDArray[np.complex128]:
+    """
+    Steady state density matrix of an OBE problem from a direct linear solve,
+    instead of integrating to long times.
+
+    The Liouvillian L is assembled in Julia as a sparse real n²×n² matrix in the
+    packed Hermitian layout by applying the right-hand side of the system to the
+    basis states, which works for every code generation method. One population
+    equation of L ρ = 0 is replaced by the trace condition and the system is solved
+    with a sparse LU factorization.
+
+    Only meaningful for time-independent drives: time-dependent parameters are
+    evaluated at t. The steady state has to be unique; systems with uncoupled or
+    dark states keep part of their initial population and raise an error.
+
+    Args:
+        problem (OBEProblem): problem, its initial state only sets the number of
+            states and its time span is not used
+        t (float): time at which the parameters are evaluated
+
+    Returns:
+        npt.NDArray[np.complex128]: steady state density matrix
+    """
+    odepars = problem.odepars
+    setup_problem(odepars, problem.tspan, problem.ρ, problem.name)
+    nstates = problem.ρ.shape[0]
+    return _julia_to_numpy(
+        jl.seval(
+            f"steady_state(Lindblad_rhs!, {problem.name}.p, {nstates}, "
+            f"{str(odepars._packed).lower()}, {float(t)})"
+        )
+    )
+
+
+def solve_steady_state_parameter_scan(
+    scan: OBEEnsembleProblem, t: float = 0.0
+) -> OBEResultParameterScan:
+    """
+    Steady state density matrices of a parameter scan, see `solve_steady_state`.
+
+    The parameters of each scan point are set up as for
+    `setup_problem_parameter_scan`, and the scan points are solved in parallel over
+    the Julia worker processes with `pmap`. The output function of the scan is not
+    used.
+
+    Args:
+        scan (OBEEnsembleProblem): parameter scan
+        t (float): time at which the parameters are evaluated
+
+    Returns:
+        OBEResultParameterScan: steady states, shape (scan..., n, n)
+    """
+    prob_func = setup_problem_parameter_scan(scan)
+    trajectories = _scan_trajectories(scan)
+    nstates = scan.problem.ρ.shape[0]
+    results = _julia_to_numpy(
+        jl.seval(
+            f"steady_state_ensemble(Lindblad_rhs!, {scan.problem.name}, "
+            f"{prob_func.name}, {trajectories}, {nstates}, "
+            f"{str(scan.problem.odepars._packed).lower()}, {float(t)})"
+        )
+    )
+    return _shape_scan_results(scan, results)
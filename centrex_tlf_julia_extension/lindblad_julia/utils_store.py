@@ -0,0 +1,369 @@
+import json
+import warnings
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Literal, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from .utils_julia import jl
+from .utils_solver import (
+    OBEEnsembleProblem,
+    OBEEnsembleProblemConfig,
+    OBEResultParameterScan,
+    ProblemFunction,
+    _generate_problem_parameter_scan_solve_string,
+    _scan_trajectories,
+    _shape_scan_results,
+    remove_leading_spaces_to_align,
+    setup_problem_parameter_scan,
+)
+
+__all__ = [
+    "TrajectoryStore",
+    "TrajectoryStoreResult",
+    "setup_trajectory_store",
+    "close_trajectory_store",
+    "load_trajectory_store",
+    "get_results_trajectory_store",
+    "solve_problem_parameter_scan_checkpoint",
+]
+
+_julia_types = {
+    np.dtype(np.float64): "Float64",
+    np.dtype(np.float32): "Float32",
+    np.dtype(np.complex128): "ComplexF64",
+    np.dtype(np.complex64): "ComplexF32",
+    np.dtype(np.int64): "Int64",
+    np.dtype(np.int32): "Int32",
+}
+
+_results_file = "results.npy"
+_done_file = "done.npy"
+_meta_file = "meta.json"
+_scan_values_file = "scan_values.npz"
+
+
+@dataclass
+class TrajectoryStore:
+    """
+    On-disk store with one row per trajectory of a parameter scan, written by the
+    Julia processes while the scan runs.
+
+    Args:
+        path (Path): directory of the store
+        name (str): name of the store in Julia
+        trajectories (int): number of trajectories
+        shape (tuple[int, ...]): shape of the output of a single trajectory
+        dtype (np.dtype): element type of the output
+        remaining (int): number of trajectories not yet written when the store was
+            set up
+    """
+
+    path: Path
+    name: str
+    trajectories: int
+    shape: tuple[int, ...]
+    dtype: np.dtype
+    remaining: int
+
+
+@dataclass
+class TrajectoryStoreResult:
+    """
+    Results of a parameter scan read from a `TrajectoryStore`.
+
+    Args:
+        parameters (list[str]): scanned parameters
+        scan_values (list[npt.NDArray]): values of the scanned parameters
+        zipped (bool): whether the scan is zipped
+        results (np.memmap): memory-mapped results, shape (trajectories, *shape),
+            rows are in trajectory order
+        done (npt.NDArray[np.bool_]): rows that have been written
+    """
+
+    parameters: list[str]
+    scan_values: list[npt.NDArray[np.generic]]
+    zipped: bool
+    results: np.memmap
+    done: npt.NDArray[np.bool_]
+
+
+def setup_trajectory_store(
+    scan: OBEEnsembleProblem,
+    prob_func: ProblemFunction,
+    path: str | Path,
+    shape: None | int | Sequence[int] = None,
+    dtype: npt.DTypeLike = np.float64,
+    buffer_size: int = 64,
+    name: str = "store",
+    config: None | OBEEnsembleProblemConfig = None,
+    resume: bool = False,
+) -> TrajectoryStore:
+    """
+    Stream the output of every trajectory of a parameter scan into an on-disk
+    store, instead of collecting the outputs on the master process.
+
+    The store is a directory holding `results.npy`, a C-ordered .npy file with one
+    row per trajectory that can be memory-mapped while or after the scan runs, and
+    `done.npy` marking the rows that have been written. Each Julia process buffers
+    up to buffer_size rows before writing them to their offsets in the file, so
+    memory use stays bounded and the processes never wait for each other. All
+    processes have to see the same filesystem, which holds for the local workers
+    started by `initialize_julia`.
+
+    Call after `setup_problem_parameter_scan` with the problem function it returns;
+    the ensemble problem is redefined with an output function that writes the
+    output of `scan.output_func` (the final populations if not set) to the store
+    and returns nothing. After solving, call `close_trajectory_store` to write the
+    remaining buffered rows.
+
+    Args:
+        scan (OBEEnsembleProblem): parameter scan
+        prob_func (ProblemFunction): problem function of the scan, returned by
+            `setup_problem_parameter_scan`
+        path (str | Path): directory of the store, created if it does not exist
+        shape (int | Sequence[int], optional): shape of the output of a single
+            trajectory, () for a scalar. Required with an output function, the
+            number of states for the final populations if not set.
+        dtype (npt.DTypeLike): element type of the output
+        buffer_size (int): number of rows each process buffers before writing
+        name (str): name of the store in Julia
+        config (OBEEnsembleProblemConfig, optional): solver configuration, used
+            for the number of trajectories if set there. save_idxs can not be set
+            without an output function.
+        resume (bool): reuse an existing store of the same scan at path, only the
+            trajectories not yet written are run. The number of ensemble
+            trajectories to solve is `TrajectoryStore.remaining`.
+
+    Returns:
+        TrajectoryStore: the store
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in _julia_types:
+        raise ValueError(
+            f"Unsupported dtype {dtype}, use one of {[str(d) for d in _julia_types]}"
+        )
+    if buffer_size < 1:
+        raise ValueError(f"buffer_size must be >= 1, got {buffer_size}")
+    if scan.output_func is None and config is not None and config.save_idxs is not None:
+        raise ValueError(
+            "The final populations are stored without an output function, which "
+            "does not work with save_idxs set; unset save_idxs or set an output "
+            "function"
+        )
+    if shape is None:
+        if scan.output_func is not None:
+            raise ValueError("shape is required when the scan has an output function")
+        shape = (scan.problem.ρ.shape[0],)
+    shape = (shape,) if isinstance(shape, int) else tuple(shape)
+    trajectories = (
+        _scan_trajectories(scan)
+        if config is None or config.trajectories is None
+        else config.trajectories
+    )
+
+    path = Path(path).resolve()
+    meta = {
+        "parameters": list(scan.parameters),
+        "zipped": scan.zipped,
+        "shape": list(shape),
+        "dtype": dtype.str,
+        "trajectories": trajectories,
+    }
+    if resume and (path / _meta_file).is_file():
+        stored_meta = json.loads((path / _meta_file).read_text(encoding="utf-8"))
+        if stored_meta != meta:
+            raise ValueError(
+                f"Cannot resume, the store in {path} holds a different scan: "
+                f"{stored_meta}"
+            )
+        with np.load(path / _scan_values_file) as data:
+            stored_values = [data[f"arr_{i}"] for i in range(len(data.files))]
+        if len(stored_values) != len(scan.scan_values) or not all(
+            np.array_equal(stored, np.asarray(values))
+            for stored, values in zip(stored_values, scan.scan_values)
+        ):
+            raise ValueError(
+                f"Cannot resume, the store in {path} holds different scan values"
+            )
+        results = np.load(path / _results_file, mmap_mode="r")
+        done = np.load(path / _done_file, mmap_mode="r")
+    else:
+        path.mkdir(parents=True, exist_ok=True)
+        results = np.lib.format.open_memmap(
+            path / _results_file, mode="w+", dtype=dtype, shape=(trajectories, *shape)
+        )
+        done = np.lib.format.open_memmap(
+            path / _done_file, mode="w+", dtype=np.uint8, shape=(trajectories,)
+        )
+        (path / _meta_file).write_text(json.dumps(meta), encoding="utf-8")
+        np.savez(path / _scan_values_file, *scan.scan_values)
+    offset, done_offset = results.offset, done.offset
+    # julia indices of the trajectories still to run
+    remaining = np.flatnonzero(done == 0) + 1
+    del results, done
+
+    row_length = int(np.prod(shape))
+    jl.seval(
+        f"""
+        @everywhere open_trajectory_store(
+            "{name}", {_julia_types[dtype]}, raw"{path / _results_file}", {offset},
+            raw"{path / _done_file}", {done_offset}, {row_length}, {buffer_size}
+        )
+        """
+    )
+
+    # when resuming, ensemble trajectory i runs trajectory {name}_indices[i] of the
+    # scan, the prob_func and output function are called with the scan index
+    if len(remaining) < trajectories:
+        jl._store_indices = remaining
+        jl.seval(f"{name}_indices = Vector{{Int}}(_store_indices)")
+        jl.seval(f"@everywhere {name}_indices = ${name}_indices")
+        index = f"{name}_indices[i]"
+    else:
+        index = "i"
+
+    if scan.output_func is None:
+        output = "populations(sol.u[end]), false"
+    else:
+        output = f"{scan.output_func.name}(sol, j)"
+    function_str = f"""
+    @everywhere function prob_func_{name}(prob, i, repeat)
+        {prob_func.name}(prob, {index}, repeat)
+    end
+    @everywhere function output_func_{name}(sol, i)
+        j = {index}
+        out, rerun = {output}
+        rerun || store_trajectory!("{name}", j, out)
+        return nothing, rerun
+    end
+    """
+    jl.seval(remove_leading_spaces_to_align(function_str))
+    problem_name = scan.problem.name
+    jl.seval(
+        f"""
+        ens_{problem_name} = EnsembleProblem({problem_name},
+                                            prob_func = prob_func_{name},
+                                            output_func = output_func_{name}
+                                        )
+        """
+    )
+    return TrajectoryStore(
+        path=path,
+        name=name,
+        trajectories=trajectories,
+        shape=shape,
+        dtype=dtype,
+        remaining=len(remaining),
+    )
+
+
+def close_trajectory_store(store: TrajectoryStore) -> None:
+    """Write the rows still buffered on the Julia processes and close the store."""
+    jl.seval(f'@everywhere close_trajectory_store!("{store.name}")')
+
+
+def load_trajectory_store(
+    path: str | Path, mode: Literal["r", "r+"] = "r"
+) -> TrajectoryStoreResult:
+    """
+    Memory-map the results of a trajectory store.
+
+    Args:
+        path (str | Path): directory of the store
+        mode (str): memory-map mode of the results, "r" or "r+"
+
+    Returns:
+        TrajectoryStoreResult: scan information and memory-mapped results
+    """
+    path = Path(path)
+    meta = json.loads((path / _meta_file).read_text(encoding="utf-8"))
+    with np.load(path / _scan_values_file) as data:
+        scan_values = [data[f"arr_{i}"] for i in range(len(data.files))]
+    return TrajectoryStoreResult(
+        parameters=meta["parameters"],
+        scan_values=scan_values,
+        zipped=meta["zipped"],
+        results=np.load(path / _results_file, mmap_mode=mode),
+        done=np.load(path / _done_file).astype(bool),
+    )
+
+
+def get_results_trajectory_store(
+    scan: OBEEnsembleProblem, store: TrajectoryStore
+) -> OBEResultParameterScan:
+    """
+    Results of a parameter scan from its closed trajectory store, shaped like the
+    results of `get_results_parameter_scan`. The results are memory-mapped.
+
+    Args:
+        scan (OBEEnsembleProblem): parameter scan
+        store (TrajectoryStore): store the scan was written to
+
+    Returns:
+        OBEResultParameterScan: results of the parameter scan
+    """
+    stored = load_trajectory_store(store.path)
+    missing = int(np.count_nonzero(~stored.done))
+    if missing > 0:
+        warnings.warn(
+            f"{missing} of {store.trajectories} trajectories are missing from the "
+            f"store in {store.path}, resume the scan to run them"
+        )
+    return _shape_scan_results(scan, stored.results)
+
+
+def solve_problem_parameter_scan_checkpoint(
+    scan: OBEEnsembleProblem,
+    path: str | Path,
+    shape: None | int | Sequence[int] = None,
+    dtype: npt.DTypeLike = np.float64,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    buffer_size: int = 16,
+    resume: bool = True,
+    name: str = "store",
+) -> OBEResultParameterScan:
+    """
+    Set up and solve a parameter scan with the completed trajectories checkpointed
+    to a trajectory store at path, see `setup_trajectory_store`.
+
+    With resume, a scan that was interrupted (crash, kernel restart) continues from
+    its store: only the trajectories missing from the store are solved, and the
+    results are merged with the stored ones. At most buffer_size trajectories per
+    Julia process are lost when a scan is interrupted.
+
+    Args:
+        scan (OBEEnsembleProblem): parameter scan
+        path (str | Path): directory of the store
+        shape (int | Sequence[int], optional): shape of the output of a single
+            trajectory, see `setup_trajectory_store`
+        dtype (npt.DTypeLike): element type of the output
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        buffer_size (int): number of rows each process buffers before writing
+        resume (bool): continue from an existing store of the same scan
+        name (str): name of the store in Julia
+
+    Returns:
+        OBEResultParameterScan: results of the complete parameter scan
+    """
+    prob_func = setup_problem_parameter_scan(scan)
+    store = setup_trajectory_store(
+        scan,
+        prob_func,
+        path,
+        shape=shape,
+        dtype=dtype,
+        buffer_size=buffer_size,
+        name=name,
+        config=config,
+        resume=resume,
+    )
+    if store.remaining > 0:
+        solve_string = _generate_problem_parameter_scan_solve_string(
+            scan, replace(config, trajectories=store.remaining)
+        )
+        jl.seval(f"{solve_string};")
+    close_trajectory_store(store)
+    return get_results_trajectory_store(scan, store)
@@ -0,0 +1,232 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+from scipy.interpolate import RegularGridInterpolator
+
+from .utils_solver import (
+    OBEEnsembleProblemConfig,
+    OBEProblem,
+    OutputFunction,
+    _solve_scan_points,
+)
+
+__all__ = [
+    "OBESurrogate",
+    "SurrogateValidation",
+    "build_surrogate",
+    "validate_surrogate",
+    "save_surrogate",
+    "load_surrogate",
+]
+
+
+@dataclass
+class OBESurrogate:
+    """
+    Output of an OBE problem tabulated on a regular grid of parameters, evaluated by
+    interpolation instead of solving, e.g. the number of photons scattered by a
+    molecule as a function of (vz, δ0, y0) for a Monte Carlo of a beamline.
+
+    Points outside the grid evaluate to NaN.
+
+    Example:
+        >>> surrogate = build_surrogate(problem, ["vz", "δ0", "y0"], axes, output)
+        >>> photons = surrogate(np.stack([vz, δ, y0], axis=-1))
+
+    Args:
+        parameters (list[str]): parameters of the grid
+        axes (list[npt.NDArray[np.float64]]): strictly ascending grid values of each
+            parameter
+        values (npt.NDArray): output on the grid, shape (*grid, ...)
+        method (str): interpolation method of `scipy.interpolate.
+            RegularGridInterpolator`: "linear", "nearest", "slinear", "cubic",
+            "quintic" or "pchip"
+    """
+
+    parameters: list[str]
+    axes: list[npt.NDArray[np.float64]]
+    values: npt.NDArray[np.inexact]
+    method: str = "linear"
+    _interpolator: None | RegularGridInterpolator = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __call__(self, points: npt.ArrayLike) -> npt.NDArray[np.inexact]:
+        """
+        Evaluate the surrogate.
+
+        Args:
+            points (npt.ArrayLike): parameter values, shape (..., n_parameters)
+
+        Returns:
+            npt.NDArray: interpolated output, shape (..., *output_shape)
+        """
+        if self._interpolator is None:
+            self._interpolator = RegularGridInterpolator(
+                self.axes,
+                self.values,
+                method=self.method,
+                bounds_error=False,
+                fill_value=np.nan,
+            )
+        return self._interpolator(points)
+
+
+@dataclass
+class SurrogateValidation:
+    """
+    Comparison of a surrogate with full solves at the same points.
+
+    Args:
+        points (npt.NDArray[np.float64]): validation points, shape
+            (n_samples, n_parameters)
+        predicted (npt.NDArray): output of the surrogate, NaN outside the grid
+        exact (npt.NDArray): output of the full solves
+    """
+
+    points: npt.NDArray[np.float64]
+    predicted: npt.NDArray[np.inexact]
+    exact: npt.NDArray[np.inexact]
+
+    @property
+    def abs_error(self) -> npt.NDArray[np.float64]:
+        return np.abs(self.predicted - self.exact)
+
+    @property
+    def max_abs_error(self) -> float:
+        return float(np.nanmax(self.abs_error))
+
+    @property
+    def rms_error(self) -> float:
+        return float(np.sqrt(np.nanmean(self.abs_error**2)))
+
+    @property
+    def mean_rel_error(self) -> float:
+        """Relative error of the mean output over the points inside the grid, the
+        error of a Monte Carlo average over the surrogate."""
+        inside = ~np.isnan(self.predicted)
+        exact_mean = np.mean(self.exact[inside])
+        return float(np.abs(np.mean(self.predicted[inside]) - exact_mean) / exact_mean)
+
+
+def build_surrogate(
+    problem: OBEProblem,
+    parameters: Sequence[str],
+    axes: Sequence[npt.ArrayLike],
+    output_func: OutputFunction,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    method: str = "linear",
+) -> OBESurrogate:
+    """
+    Build a surrogate by solving an ND parameter scan over the grid spanned by axes,
+    see `setup_parameter_scan_ND`.
+
+    Args:
+        problem (OBEProblem): problem to tabulate
+        parameters (Sequence[str]): parameters of the grid
+        axes (Sequence[npt.ArrayLike]): grid values of each parameter, sorted and
+            deduplicated before solving
+        output_func (OutputFunction): output function reducing a trajectory to the
+            tabulated output
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        method (str): interpolation method, see `OBESurrogate`
+
+    Returns:
+        OBESurrogate: the surrogate
+    """
+    parameters = list(parameters)
+    if len(axes) != len(parameters):
+        raise ValueError(
+            f"Expected {len(parameters)} axes (one per parameter), got {len(axes)}."
+        )
+    grid_axes = [np.unique(np.asarray(a, dtype=np.float64)) for a in axes]
+    values = _solve_scan_points(
+        problem, parameters, grid_axes, output_func, config, False
+    )
+    return OBESurrogate(
+        parameters=parameters, axes=grid_axes, values=values, method=method
+    )
+
+
+def validate_surrogate(
+    surrogate: OBESurrogate,
+    problem: OBEProblem,
+    output_func: OutputFunction,
+    points: None | npt.ArrayLike = None,
+    n_samples: int = 100,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    seed: None | int = None,
+) -> SurrogateValidation:
+    """
+    Validate a surrogate against full solves at n_samples random points.
+
+    The points are drawn from points, e.g. the molecules of the Monte Carlo the
+    surrogate is used for, or uniformly from the grid if not given.
+
+    Args:
+        surrogate (OBESurrogate): surrogate to validate
+        problem (OBEProblem): problem the surrogate was built from
+        output_func (OutputFunction): output function the surrogate was built with
+        points (npt.ArrayLike, optional): candidate points, shape
+            (n_points, n_parameters)
+        n_samples (int): number of validation points
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        seed (int, optional): seed of the random number generator
+
+    Returns:
+        SurrogateValidation: surrogate and full-solve outputs at the sampled points
+    """
+    rng = np.random.default_rng(seed)
+    if points is None:
+        low = np.array([a[0] for a in surrogate.axes])
+        high = np.array([a[-1] for a in surrogate.axes])
+        samples = rng.uniform(low, high, size=(n_samples, len(surrogate.axes)))
+    else:
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != len(surrogate.parameters):
+            raise ValueError(
+                f"points must have shape (n_points, {len(surrogate.parameters)}), got "
+                f"{points.shape}"
+            )
+        n_samples = min(n_samples, len(points))
+        samples = points[rng.choice(len(points), size=n_samples, replace=False)]
+
+    exact = _solve_scan_points(
+        problem,
+        surrogate.parameters,
+        [samples[:, k] for k in range(samples.shape[1])],
+        output_func,
+        config,
+        True,
+    )
+    return SurrogateValidation(
+        points=samples, predicted=surrogate(samples), exact=exact
+    )
+
+
+def save_surrogate(surrogate: OBESurrogate, path: str | Path) -> None:
+    """Save a surrogate to a .npz file."""
+    # axes of different lengths are stored concatenated
+    np.savez(
+        path,
+        parameters=np.array(surrogate.parameters),
+        axes=np.concatenate(surrogate.axes),
+        axis_lengths=np.array([len(a) for a in surrogate.axes]),
+        values=surrogate.values,
+        method=np.array(surrogate.method),
+    )
+
+
+def load_surrogate(path: str | Path) -> OBESurrogate:
+    """Load a surrogate saved with `save_surrogate`."""
+    with np.load(path) as data:
+        splits = np.cumsum(data["axis_lengths"])[:-1]
+        return OBESurrogate(
+            parameters=[str(p) for p in data["parameters"]],
+            axes=np.split(data["axes"], splits),
+            values=data["values"],
+            method=str(data["method"]),
+        )
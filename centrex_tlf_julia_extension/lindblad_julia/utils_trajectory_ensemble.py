@@ -0,0 +1,242 @@
+from dataclasses import dataclass, replace
+from typing import Callable, Iterator, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from .ode_parameters import julia_literal
+from .utils_julia import _julia_to_numpy, jl
+from .utils_parallel import partition_chunks
+from .utils_solver import (
+    OBEEnsembleProblem,
+    OBEEnsembleProblemConfig,
+    OBEProblem,
+    OutputFunction,
+    _generate_problem_parameter_scan_solve_string,
+    remove_leading_spaces_to_align,
+    setup_problem,
+)
+
+__all__ = [
+    "TrajectoryEnsemble",
+    "TrajectoryEnsembleChunk",
+    "setup_trajectory_ensemble",
+    "iter_trajectory_ensemble",
+    "solve_trajectory_ensemble",
+]
+
+
+@dataclass
+class TrajectoryEnsemble:
+    """
+    Monte Carlo ensemble of trajectories, e.g. molecules with their own initial
+    positions and velocities, solved in chunks of chunk_size trajectories.
+
+    Only the values of the current chunk are sent to the Julia processes, and every
+    trajectory is reduced by the output function on the process that solved it, so
+    memory use is set by the chunk size instead of the number of trajectories.
+
+    Example:
+        >>> # coords_vels columns: x, y, z, vx, vy, vz
+        >>> ensemble = TrajectoryEnsemble(
+        ...     problem, ["y0", "vx", "vz"], coords_vels[:, [1, 3, 5]], output
+        ... )
+        >>> photons = solve_trajectory_ensemble(ensemble, config)
+
+    Args:
+        problem (OBEProblem): problem shared by all trajectories
+        parameters (list[str | Sequence[str]]): parameter set by each column of
+            values, several parameters set by the same column are given as a
+            sequence
+        values (npt.NDArray): parameter values, shape (trajectories, len(parameters))
+        output_func (OutputFunction, optional): output function reducing a
+            trajectory, the final populations if not set
+        chunk_size (int): maximum number of trajectories solved at once
+        name (str): name of the ensemble in Julia
+    """
+
+    problem: OBEProblem
+    parameters: list[str | Sequence[str]]
+    values: npt.NDArray[np.floating]
+    output_func: None | OutputFunction = None
+    chunk_size: int = 10_000
+    name: str = "trajectory_ensemble"
+
+    @property
+    def trajectories(self) -> int:
+        return len(self.values)
+
+    @property
+    def chunks(self) -> list[tuple[int, int]]:
+        return partition_chunks(self.trajectories, self.chunk_size)
+
+
+@dataclass
+class TrajectoryEnsembleChunk:
+    """
+    Outputs of a chunk of a trajectory ensemble.
+
+    Args:
+        start (int): index of the first trajectory of the chunk
+        stop (int): index after the last trajectory of the chunk
+        results (npt.NDArray): outputs, shape (stop - start, ...)
+    """
+
+    start: int
+    stop: int
+    results: npt.NDArray[np.generic]
+
+
+def setup_trajectory_ensemble(ensemble: TrajectoryEnsemble) -> None:
+    """
+    Define the ensemble problem `ens_{name}` of a trajectory ensemble in Julia. The
+    trajectory values are sent per chunk when solving.
+
+    Args:
+        ensemble (TrajectoryEnsemble): trajectory ensemble
+    """
+    values = np.asarray(ensemble.values)
+    if values.ndim != 2 or values.shape[1] != len(ensemble.parameters):
+        raise ValueError(
+            f"values must have shape (trajectories, {len(ensemble.parameters)}), got "
+            f"{values.shape}"
+        )
+    if len(values) == 0:
+        raise ValueError("A trajectory ensemble needs at least one trajectory.")
+    if ensemble.chunk_size < 1:
+        raise ValueError(f"chunk_size must be >= 1, got {ensemble.chunk_size}")
+
+    odepars = ensemble.problem.odepars
+    setup_problem(
+        odepars, ensemble.problem.tspan, ensemble.problem.ρ, ensemble.problem.name
+    )
+
+    # scanned parameters read column k of the values of the current chunk
+    pars = list(odepars.p)
+    for k, parameter in enumerate(ensemble.parameters):
+        names = [parameter] if isinstance(parameter, str) else parameter
+        for par in names:
+            idx = odepars.get_index_parameter(par)
+            assert isinstance(idx, int)
+            pars[idx] = f"{ensemble.name}_chunk[i,{k + 1}]"
+    elems = [pi if isinstance(pi, str) else julia_literal(pi) for pi in pars]
+    _pars = f"({elems[0]},)" if len(elems) == 1 else "(" + ", ".join(elems) + ")"
+
+    if ensemble.output_func is None:
+        output = "populations(sol.u[end]), false"
+    else:
+        output = f"{ensemble.output_func.name}(sol, i)"
+    function_str = f"""
+    @everywhere function prob_func_{ensemble.name}(prob, i, repeat)
+        remake(prob, p = {odepars._julia_p_constructor(_pars)})
+    end
+    @everywhere function output_func_{ensemble.name}(sol, i)
+        {output}
+    end
+    """
+    jl.seval(remove_leading_spaces_to_align(function_str))
+    jl.seval(
+        f"""
+        ens_{ensemble.name} = EnsembleProblem({ensemble.problem.name},
+                                            prob_func = prob_func_{ensemble.name},
+                                            output_func = output_func_{ensemble.name}
+                                        )
+        """
+    )
+
+
+def iter_trajectory_ensemble(
+    ensemble: TrajectoryEnsemble,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+) -> Iterator[TrajectoryEnsembleChunk]:
+    """
+    Solve a trajectory ensemble set up with `setup_trajectory_ensemble` chunk by
+    chunk, yielding the outputs of each chunk when it is done.
+
+    Only the outputs are kept, so set save_everystep=False in the config unless the
+    output function needs the saved states.
+
+    Args:
+        ensemble (TrajectoryEnsemble): trajectory ensemble
+        config (OBEEnsembleProblemConfig, optional): solver configuration, the
+            number of trajectories is set per chunk
+
+    Yields:
+        TrajectoryEnsembleChunk: outputs of the next chunk
+    """
+    # only the name of the ensemble problem is used for the solve string
+    scan = OBEEnsembleProblem(
+        problem=ensemble.problem,
+        parameters=[],
+        scan_values=[],
+        name=f"ens_{ensemble.name}",
+    )
+    for start, stop in ensemble.chunks:
+        jl._trajectory_chunk = np.ascontiguousarray(ensemble.values[start:stop])
+        jl.seval(
+            f"""
+            {ensemble.name}_chunk = collect(_trajectory_chunk)
+            @everywhere {ensemble.name}_chunk = ${ensemble.name}_chunk
+            """
+        )
+        solve_string = _generate_problem_parameter_scan_solve_string(
+            scan, replace(config, trajectories=stop - start)
+        )
+        jl.seval(f"{solve_string};")
+        # array outputs, e.g. the default populations, are stacked in Julia into
+        # one array with the trajectories along the first dimension, a vector of
+        # Julia vectors would arrive as an object array
+        results = _julia_to_numpy(
+            jl.seval(
+                """
+                let u = sol.u
+                    if eltype(u) <: AbstractArray
+                        x0 = first(u)
+                        A = similar(x0, length(u), size(x0)...)
+                        @inbounds for (k, x) in enumerate(u)
+                            A[k, ntuple(_ -> Colon(), ndims(x0))...] = x
+                        end
+                        A
+                    else
+                        u
+                    end
+                end
+                """
+            )
+        )
+        # drop the solutions of the chunk before solving the next one
+        jl.seval("sol = nothing")
+        yield TrajectoryEnsembleChunk(start=start, stop=stop, results=results)
+
+
+def solve_trajectory_ensemble(
+    ensemble: TrajectoryEnsemble,
+    config: OBEEnsembleProblemConfig = OBEEnsembleProblemConfig(),
+    callback: None | Callable[[TrajectoryEnsembleChunk], None] = None,
+) -> npt.NDArray[np.generic]:
+    """
+    Set up and solve a trajectory ensemble chunk by chunk, see
+    `iter_trajectory_ensemble`.
+
+    Args:
+        ensemble (TrajectoryEnsemble): trajectory ensemble
+        config (OBEEnsembleProblemConfig, optional): solver configuration
+        callback (Callable[[TrajectoryEnsembleChunk], None], optional): called with
+            the outputs of each chunk, e.g. to save them or report progress
+
+    Returns:
+        npt.NDArray: outputs of all trajectories, shape (trajectories, ...)
+    """
+    setup_trajectory_ensemble(ensemble)
+    results = None
+    for chunk in iter_trajectory_ensemble(ensemble, config):
+        if callback is not None:
+            callback(chunk)
+        if results is None:
+            results = np.empty(
+                (ensemble.trajectories, *chunk.results.shape[1:]),
+                dtype=chunk.results.dtype,
+            )
+        results[chunk.start : chunk.stop] = chunk.results
+    assert results is not None
+    return results
@@ -0,0 +1,265 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .utils_julia import (
+    _julia_common_hash,
+    _remove_mismatched_workers,
+    _worker_exeflags,
+    install_packages,
+    jl,
+    julia_common_path,
+    julia_dependency_packages,
+)
+
+__all__ = ["WorkerPool"]
+
+# Julia helpers of the pool, only defined on the master process
+_pool_helpers = """
+import PythonCall
+
+# remove @everywhere from top level expressions, the pool decides where code runs
+function _pool_strip_everywhere(ex)
+    if ex isa Expr && ex.head === :macrocall && ex.args[1] === Symbol("@everywhere")
+        return ex.args[end]
+    elseif ex isa Expr && ex.head in (:toplevel, :block)
+        return Expr(ex.head, map(_pool_strip_everywhere, ex.args)...)
+    end
+    return ex
+end
+
+# evaluate code on the given processes concurrently
+function _pool_deploy(ws::Vector{Int}, code::String)
+    ex = _pool_strip_everywhere(Meta.parseall(code))
+    @sync for w in ws
+        @async remotecall_wait(Core.eval, w, Main, ex)
+    end
+    nothing
+end
+
+# processes that do not answer within timeout seconds
+function _pool_unresponsive(ws::Vector{Int}, timeout::Float64)
+    dead = Int[]
+    for w in ws
+        ok = try
+            f = remotecall(myid, w)
+            timedwait(() -> isready(f), timeout) === :ok && fetch(f) == w
+        catch
+            false
+        end
+        ok || push!(dead, w)
+    end
+    dead
+end
+"""
+
+
+class WorkerPool:
+    """
+    Persistent pool of Julia worker processes.
+
+    The pool keeps its workers warm across OBE systems: the package stack and
+    julia_common.jl are only loaded on new workers, and generated code is deployed
+    to all processes concurrently. The pool tracks which code each worker has
+    loaded, replays it on workers that are added later or replace dead workers, and
+    skips redeploying code a worker already has.
+
+    Every OBE system defines the same Julia names (Lindblad_rhs!, p, ...), so code
+    is only skipped if it is the most recent deployment on a worker, and only the
+    most recent deployment of a group is replayed.
+
+    Args:
+        nprocs (int): total number of Julia processes, including the master
+        blas_threads (int): number of BLAS threads per process
+        sysimage (str | Path, optional): sysimage created by `build_sysimage` to
+            start the workers from
+        verbose (bool): print progress
+        threads (int): number of Julia threads per worker, see `initialize_julia`.
+            Existing workers with a different number of threads are replaced.
+    """
+
+    def __init__(
+        self,
+        nprocs: int,
+        blas_threads: int = 1,
+        sysimage: None | str | Path = None,
+        verbose: bool = False,
+        threads: int = 1,
+    ):
+        if threads < 1:
+            raise ValueError(f"threads must be >= 1, got {threads}")
+        self.blas_threads = blas_threads
+        self.threads = threads
+        self.sysimage = None if sysimage is None else Path(sysimage).resolve()
+        self.verbose = verbose
+        # most recent (key, code) deployed to the pool per group, in order of (last)
+        # deployment
+        self._deployed: Dict[str, Tuple[str, str]] = {}
+        # deployment history of each process
+        self._loaded: Dict[int, List[str]] = {}
+
+        install_packages()
+        jl.seval(
+            """
+            using Logging: global_logger
+            using TerminalLoggers: TerminalLogger
+            global_logger(TerminalLogger())
+
+            using Distributed
+            using ProgressMeter
+        """
+        )
+        jl.seval(_pool_helpers)
+        # existing workers are reused, unless they run a different number of threads
+        removed = _remove_mismatched_workers(threads)
+        if removed and verbose:
+            print(
+                f"WorkerPool: removed workers {removed} with a different thread count"
+            )
+        self._prepare(self.procs)
+        self.resize(nprocs)
+
+    @property
+    def procs(self) -> List[int]:
+        """Ids of all Julia processes, including the master."""
+        return [int(w) for w in jl.seval("procs()")]
+
+    @property
+    def workers(self) -> List[int]:
+        """Ids of the worker processes."""
+        return [int(w) for w in jl.seval("workers()") if int(w) != 1]
+
+    @property
+    def nprocs(self) -> int:
+        return len(self.procs)
+
+    def loaded(self, worker: int) -> List[str]:
+        """Keys of the code deployed to a process, in order of deployment."""
+        return list(self._loaded.get(worker, []))
+
+    def _run(self, procs: List[int], code: str) -> None:
+        if not procs:
+            return
+        jl._pool_code = code
+        jl.seval(f"_pool_deploy(Int{procs}, PythonCall.pyconvert(String, _pool_code))")
+
+    def _prepare(self, procs: List[int]) -> None:
+        """Load the package stack and julia_common.jl and replay deployed code."""
+        if not procs:
+            return
+        if self.verbose:
+            print(f"WorkerPool: loading packages on processes {procs}")
+        packages = ", ".join(
+            ["LinearAlgebra", "LinearAlgebra.BLAS", "SparseArrays"]
+            + [pkg for pkg in julia_dependency_packages if pkg != "TerminalLoggers"]
+        )
+        self._run(
+            procs,
+            f"using {packages}\n"
+            f"LinearAlgebra.BLAS.set_num_threads({self.blas_threads})",
+        )
+        common_hash = _julia_common_hash()
+        in_sysimage = bool(
+            jl.seval(
+                f"""
+                all(Int{procs}) do w
+                    remotecall_fetch(w) do
+                        isdefined(Main, :_centrex_julia_common_hash) &&
+                            Main._centrex_julia_common_hash == "{common_hash}"
+                    end
+                end
+            """
+            )
+        )
+        if not in_sysimage:
+            self._run(procs, julia_common_path.read_text(encoding="utf-8"))
+        for w in procs:
+            self._loaded[w] = []
+        for key, code in self._deployed.values():
+            self._run(procs, code)
+            for w in procs:
+                self._loaded[w].append(key)
+
+    def _add_workers(self, n: int) -> None:
+        exeflags = _worker_exeflags(self.sysimage, self.threads)
+        new = [int(w) for w in jl.seval(f"addprocs({n}; {exeflags})")]
+        self._prepare(new)
+
+    def resize(self, nprocs: int) -> None:
+        """Grow or shrink the pool to nprocs processes, including the master.
+
+        New workers are prepared concurrently; surviving workers are left as is.
+        """
+        current = self.nprocs
+        if nprocs > current:
+            self._add_workers(nprocs - current)
+        elif nprocs < current:
+            remove = self.workers[nprocs - current :]
+            jl.seval(f"rmprocs(Int{remove})")
+            for w in remove:
+                self._loaded.pop(w, None)
+        if self.verbose:
+            print(f"WorkerPool: {self.nprocs} processes")
+
+    def deploy(
+        self, code: str, key: None | str = None, group: None | str = None
+    ) -> List[int]:
+        """Evaluate code on all processes concurrently.
+
+        Processes whose most recent deployment is the same key are skipped.
+
+        Args:
+            code (str): Julia code, top level @everywhere macros are ignored
+            key (str, optional): identifier of the code. Defaults to a hash of the
+                code.
+            group (str, optional): deployments that define the same Julia names,
+                e.g. OBE systems. Only the most recent deployment of a group is
+                replayed on workers added later. Defaults to the key.
+
+        Returns:
+            List[int]: processes the code was deployed to
+        """
+        if key is None:
+            key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        targets = [w for w in self.procs if self._loaded.get(w, [None])[-1:] != [key]]
+        self._run(targets, code)
+        if group is None:
+            group = key
+        self._deployed.pop(group, None)
+        self._deployed[group] = (key, code)
+        for w in targets:
+            self._loaded.setdefault(w, []).append(key)
+        return targets
+
+    def health_check(self, timeout: float = 10.0) -> List[int]:
+        """Replace workers that exited or do not respond within timeout seconds.
+
+        Args:
+            timeout (float): seconds to wait for each worker to respond
+
+        Returns:
+            List[int]: ids of the replaced workers
+        """
+        alive = set(self.procs)
+        # workers that exited are deregistered by Distributed
+        lost = [w for w in self._loaded if w not in alive]
+        dead = [
+            int(w)
+            for w in jl.seval(
+                f"_pool_unresponsive(Int{self.workers}, {float(timeout)})"
+            )
+        ]
+        if dead:
+            jl.seval(f"try rmprocs(Int{dead}; waitfor = {float(timeout)}) catch end")
+        replaced = lost + dead
+        if not replaced:
+            return []
+        if self.verbose:
+            print(f"WorkerPool: replacing workers {replaced}")
+        for w in replaced:
+            self._loaded.pop(w, None)
+        self._add_workers(len(replaced))
+        return replaced
+
+    def __repr__(self) -> str:
+        return f"WorkerPool(nprocs={self.nprocs}, deployed={len(self._deployed)})"